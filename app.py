@@ -1,105 +1,2489 @@
 #!./venv/bin/python3
 
 import os
-from flask import Flask, render_template, request, redirect, url_for, send_file
+from flask import Flask, Request, Response, render_template, request, redirect, url_for, send_file, jsonify, g
+from werkzeug.exceptions import RequestEntityTooLarge
 import json
+import re
+import sys
 import os
 import hashlib
 import shutil
 import uuid
 from datetime import datetime
 import textwrap
-import matplotlib.pyplot as plt
-from PIL import Image
-import matplotlib.font_manager as fm
 import tempfile
 import base64
 import webbrowser
 import time
 import threading
+import atexit
+import sqlite3
+import bisect
+import math
+import unicodedata
+import mimetypes
+import functools
+import io
+import gc
+import urllib.parse
+import marshal
+import mmap
+import struct
+from contextlib import contextmanager, nullcontext
+from collections import OrderedDict
+import multiprocessing
+import argparse
+import signal
+import subprocess
+from wsgiref.simple_server import WSGIServer, make_server
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+try:
+    import fcntl # プロセス間ロック用 (Windowsにはない)
+except ImportError:
+    fcntl = None
+
+# matplotlib・PIL・NumPyは起動を速くするため初めて使うときに読み込む (_load_plotting / _load_imaging / _load_numpy)
+plt = None
+fm = None
+PdfPages = None
+np = None
+Image = None
+ImageOps = None
+
+
+def _load_imaging():
+    """PILを読み込む (画像の検証・サムネイル生成・PDF/PNG出力で使う)"""
+    global Image, ImageOps
+    if Image is None:
+        from PIL import Image as _Image, ImageOps as _ImageOps
+        ImageOps = _ImageOps
+        Image = _Image
+
+
+def _load_numpy():
+    """NumPyを読み込む (統計の集計で使う)"""
+    global np
+    if np is None:
+        import numpy as _np
+        np = _np
+
+
+def _load_plotting():
+    """matplotlibとNumPyを読み込む (PDF/PNG出力で使う)"""
+    global plt, fm, PdfPages, np
+    if plt is None:
+        import matplotlib
+        matplotlib.use('Agg') # 画面のないサーバー・ワーカープロセスで描画する
+        import matplotlib.font_manager as _fm
+        import matplotlib.pyplot as _plt
+        from matplotlib.backends.backend_pdf import PdfPages as _PdfPages
+        import numpy as _np
+        fm, PdfPages, np = _fm, _PdfPages, _np
+        plt = _plt
+    _load_imaging()
+
+
+# 画像ファイル名のリストを持つデータのフィールド
+IMAGE_FIELDS = ['today_completed_images', 'results_images', 'images', 'weekly_activity_images']
+
+# 内容のSHA-256をファイル名とする画像 (例: 3f2a...9c.jpg)
+CAS_IMAGE_RE = re.compile(r'^[0-9a-f]{64}(\.[A-Za-z0-9]+)?$')
+
+# 保存途中のアップロード一時ファイルの拡張子
+UPLOAD_TMP_SUFFIX = '.upload'
+
+# サムネイルの長辺のピクセル数 (/images/<filename>?size= で指定)
+THUMBNAIL_SIZES = (160, 320, 640)
+
+
+def split_tags(tags):
+    """カンマ区切りのタグ文字列をタグのリストに分解"""
+    if not tags:
+        return []
+    normalized = tags.replace('、', ',').replace('，', ',')
+    return [t.strip().lstrip('#＃').strip() for t in normalized.split(',') if t.strip().lstrip('#＃').strip()]
+
+
+def _remove_sorted(items, item):
+    """ソート済みのリストから item を取り除く (なければ何もしない)"""
+    pos = bisect.bisect_left(items, item)
+    if pos < len(items) and items[pos] == item:
+        del items[pos]
+
+
+def record_date(record):
+    """エントリーの日付 (フォームの日付欄があればそれ、なければ作成日)"""
+    data = record.get('data') or {}
+    return data.get('date') or data.get('experiment_date') or record['timestamp'][:10]
+
+
+class Metrics:
+    """
+    処理時間のヒストグラム・カウンターを集計し、Prometheusのテキスト形式で出力する。
+    リクエスト処理中に計測した区間は、Server-Timingヘッダー用にスレッドごとにも記録する。
+    """
+
+    # ヒストグラムのバケット (秒)
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    # name -> (種類, 説明)
+    DEFINITIONS = {
+        'research_record_startup_seconds': ('gauge', 'ResearchDiaryCoreの初期化にかかった時間'),
+        'research_record_operation_seconds': ('histogram', 'ResearchDiaryCoreの処理ごとの所要時間'),
+        'research_record_http_request_seconds': ('histogram', 'HTTPリクエストの処理時間'),
+        'research_record_http_requests_total': ('counter', 'HTTPリクエスト数'),
+        'research_record_export_job_seconds': ('histogram', 'PDF/PNG出力ジョブの登録から完了までの時間'),
+        'research_record_export_jobs_total': ('counter', '描画したPDF/PNG出力ジョブの数'),
+        'research_record_bytes_written_total': ('counter', 'データ・HTMLアーカイブとして書き込んだバイト数'),
+        'research_record_image_bytes_total': ('counter', '保存・生成した画像のバイト数'),
+        'research_record_errors_total': ('counter', '処理中に発生したエラーの数'),
+        'research_record_draft_patches_total': ('counter', '下書きの自動保存で受け付けたパッチの数'),
+        'research_record_draft_writes_total': ('counter', '下書きの自動保存でストレージに書き込んだ回数'),
+        'research_record_git_commits_total': ('counter', 'データディレクトリのgitリポジトリへのコミット数'),
+        'research_record_export_cache_evictions_total': ('counter', '上限を超えたため削除したPDF/PNG出力のキャッシュの数'),
+        'research_record_lazy_decodes_total': ('counter', '起動用スナップショットから本文を復元したエントリー・下書きの数'),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {} # (name, labels) -> 値 (ヒストグラムは [バケットごとの件数..., 合計, 件数])
+        self._local = threading.local()
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, self._labels(labels))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, self._labels(labels))] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, self._labels(labels))
+        with self.lock:
+            hist = self.values.get(key)
+            if hist is None:
+                hist = self.values[key] = [0] * (len(self.BUCKETS) + 2)
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+            hist[-2] += seconds
+            hist[-1] += 1
+
+    @contextmanager
+    def timer(self, name, timing_name=None, **labels):
+        """with文の区間の所要時間を記録する (timing_nameを指定するとServer-Timingにも載せる)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(name, elapsed, **labels)
+            timings = getattr(self._local, 'timings', None)
+            if timings is not None and timing_name:
+                timings[timing_name] = timings.get(timing_name, 0.0) + elapsed
+
+    def after_fork(self):
+        """fork後の子プロセスで、親プロセスのスレッドが持っていたかもしれないロックを作り直す"""
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+    def start_request(self):
+        """このスレッドでServer-Timing用の区間の記録を始める"""
+        self._local.timings = {}
+
+    def finish_request(self):
+        """このスレッドで記録した区間 {名前: 秒} を返して記録を終える"""
+        timings = getattr(self._local, 'timings', None) or {}
+        self._local.timings = None
+        return timings
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = []
+        for key, value in pairs:
+            value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            escaped.append(f'{key}="{value}"')
+        return '{' + ','.join(escaped) + '}'
+
+    def render(self):
+        """Prometheusのテキスト形式 (text/plain; version=0.0.4) で全メトリクスを返す"""
+        with self.lock:
+            snapshot = {key: (list(value) if isinstance(value, list) else value) for key, value in self.values.items()}
+        lines = []
+        for name, (kind, help_text) in self.DEFINITIONS.items():
+            series = sorted((labels, value) for (metric, labels), value in snapshot.items() if metric == name)
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in series:
+                if kind != 'histogram':
+                    lines.append(f"{name}{self._format_labels(labels)} {value}")
+                    continue
+                for bound, count in zip(self.BUCKETS, value):
+                    lines.append(f"{name}_bucket{self._format_labels(labels, [('le', str(bound))])} {count}")
+                lines.append(f"{name}_bucket{self._format_labels(labels, [('le', '+Inf')])} {value[-1]}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {value[-2]}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def instrumented(operation):
+    """ResearchDiaryCore・ExportRendererのメソッドの所要時間を research_record_operation_seconds に記録するデコレーター"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.timer('research_record_operation_seconds', timing_name=operation, operation=operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ReadWriteLock:
+    """
+    読み書きロック。読み込みは複数スレッドが同時に行え、書き込みは1スレッドずつ行う。
+    書き込み待ちのスレッドがあれば新しい読み込みを待たせる (書き込みが飢餓状態にならないように)。
+    同じスレッド内での入れ子の取得 (書き込み中の読み込み・書き込み、読み込み中の読み込み) ができる。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None # 書き込み中のスレッドのident
+        self._write_depth = 0
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    def held(self):
+        """現在のスレッドが読み込み・書き込みいずれかのロックを持っているか"""
+        return self._writer == threading.get_ident() or getattr(self._local, 'read_depth', 0) > 0
+
+    @contextmanager
+    def read(self):
+        depth = getattr(self._local, 'read_depth', 0)
+        if depth or self._writer == threading.get_ident():
+            self._local.read_depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.read_depth = depth
+            return
+        with self._cond:
+            while self._writer is not None or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        self._local.read_depth = 1
+        try:
+            yield
+        finally:
+            self._local.read_depth = 0
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        """書き込みロック。asで最も外側の取得かどうかを返す"""
+        if self._writer == threading.get_ident():
+            self._write_depth += 1
+            try:
+                yield False
+            finally:
+                self._write_depth -= 1
+            return
+        if getattr(self._local, 'read_depth', 0):
+            raise RuntimeError("読み込みロックを持ったまま書き込みロックは取得できません")
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = threading.get_ident()
+            self._write_depth = 1
+        try:
+            yield True
+        finally:
+            with self._cond:
+                self._writer = None
+                self._write_depth = 0
+                self._cond.notify_all()
+
+
+class ProcessFileLock:
+    """ロックファイルへのflockによるプロセス間の排他ロック (複数ワーカーのWSGIサーバーで使う)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+
+    def __enter__(self):
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def close(self):
+        self._file.close()
+
+
+def reads_records(func):
+    """エントリー・下書きを読むだけのResearchDiaryCoreのメソッド (他の読み込みと並行して実行できる)"""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self._reading():
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def writes_records(func):
+    """エントリー・下書きを変更するResearchDiaryCoreのメソッド (書き込みは1つずつ実行する)"""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self._writing():
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+class DraftConflict(Exception):
+    """下書きのパッチの元にした版が古い (他のタブなどで先に更新された) とき"""
+
+    def __init__(self, draft):
+        super().__init__(f"下書き {draft['id']} は他で更新されています (版 {draft.get('version', 0)})")
+        self.draft = draft
+
+
+class DraftAutosaver:
+    """
+    下書きの自動保存の書き込みをまとめるバックグラウンドスレッド。
+    mark() された下書きを delay 秒ごとにまとめて flush(下書きIDの集合) に渡すので、
+    その間に何度パッチが来ても1件あたりの書き込みは1回で済む。
+    """
+
+    def __init__(self, flush, delay):
+        self._flush = flush
+        self.delay = delay
+        self.pending = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closing = False
+
+    def mark(self, draft_id):
+        with self._cond:
+            self.pending.add(draft_id)
+            if self._thread is None:
+                # fork後の子プロセスで作られるよう、最初のパッチが来たときに起動する
+                self._thread = threading.Thread(target=self._run, name='draft-autosave', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self.pending and not self._closing:
+                    self._cond.wait()
+                # 続けて来るパッチをまとめるため delay 秒待つ (終了時はすぐ抜ける)
+                deadline = time.monotonic() + self.delay
+                while not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closing:
+                    return
+            self.flush()
+
+    def flush(self):
+        """保存待ちの下書きをすぐに書き込む"""
+        with self._cond:
+            draft_ids, self.pending = self.pending, set()
+        if not draft_ids:
+            return
+        try:
+            self._flush(draft_ids)
+        except Exception as e:
+            print(f"下書きの自動保存エラー: {e}")
+            with self._cond:
+                self.pending |= draft_ids # 次の周期で再試行する
+
+    def close(self):
+        """スレッドを止め、保存待ちの下書きを書き込む"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+class HashingUploadFile:
+    """
+    アップロードされたファイルの受け口。
+    Werkzeugがリクエスト本文を読みながら書き込むチャンクを、そのまま画像ディレクトリ内の
+    一時ファイルへ書き出しつつSHA-256を計算し、サイズの上限を超えたら受信を打ち切る。
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix=UPLOAD_TMP_SUFFIX)
+        self.file = os.fdopen(fd, 'w+b')
+        self.sha256 = hashlib.sha256()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.claimed = False
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            self.close()
+            raise RequestEntityTooLarge(f"ファイルサイズが上限 ({self.max_bytes // (1024 * 1024)} MB) を超えています")
+        self.sha256.update(chunk)
+        return self.file.write(chunk)
+
+    def __getattr__(self, name):
+        # read/seek/readline などは一時ファイルにそのまま任せる
+        return getattr(self.file, name)
+
+    def detach(self):
+        """書き込み済みの一時ファイルを引き取る。(SHA-256, 一時ファイルのパス) を返す"""
+        self.file.close()
+        self.claimed = True
+        return self.sha256.hexdigest(), self.path
+
+    def close(self):
+        self.file.close()
+        # 引き取られなかった一時ファイルは残さない
+        if not self.claimed and os.path.exists(self.path):
+            os.remove(self.path)
+        self.claimed = True
+
+
+class HtmlArchiveWriter:
+    """
+    research_data.html の書き込みを保存の処理から外すバックグラウンドスレッド。
+    notify() されてから delay 秒の間の保存を1回の書き込みにまとめ、write() を呼ぶ。
+    """
+
+    def __init__(self, write, delay):
+        self._write = write
+        self.delay = delay
+        self._pending = False
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock() # スレッドと flush() の書き込みを重ねない
+        self._thread = None
+        self._closing = False
+
+    def notify(self):
+        """HTMLを書き直す必要があることを知らせる"""
+        with self._cond:
+            self._pending = True
+            if self._thread is None and not self._closing:
+                # fork後の子プロセスで作られるよう、最初の保存のときに起動する
+                self._thread = threading.Thread(target=self._run, name='html-archive', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.delay
+                while not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closing:
+                    return
+            self.flush()
+
+    def flush(self):
+        """書き直しが必要ならすぐに書き込む"""
+        with self._write_lock:
+            with self._cond:
+                if not self._pending:
+                    return
+                self._pending = False
+            try:
+                self._write()
+            except Exception as e:
+                print(f"HTMLファイルの保存エラー: {e}")
+                metrics.inc('research_record_errors_total', operation='save_html')
+                with self._cond:
+                    self._pending = True # 次の周期で再試行する
+
+    def close(self):
+        """スレッドを止め、書き込み待ちのHTMLを書き込む"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+class DecodedImageCache:
+    """
+    PDF/PNG出力用に縮小・デコード済みの画像 (NumPy配列) のLRUキャッシュ。
+    ファイルごとに更新時刻と幅ごとの配列を持ち、ファイルが更新されていればそのファイルの配列をすべて捨てる。
+    配列の合計バイト数が上限を超えたら、最後に使ってから長いファイルのものから捨てる。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.items = OrderedDict() # パス -> (更新時刻, {幅: 配列})
+
+    def get(self, path, max_width):
+        """幅max_width以下に縮小した画像の配列を返す"""
+        mtime = os.stat(path).st_mtime_ns
+        cached = self.items.get(path)
+        if cached is not None and cached[0] != mtime:
+            self._drop(path)
+            cached = None
+        if cached is not None:
+            self.items.move_to_end(path)
+            array = cached[1].get(max_width)
+            if array is not None:
+                return array
+        else:
+            cached = self.items[path] = (mtime, {})
+        array = self._decode(path, max_width)
+        cached[1][max_width] = array
+        self.current_bytes += array.nbytes
+        while self.current_bytes > self.max_bytes and len(self.items) > 1:
+            self._drop(next(iter(self.items)))
+        return array
+
+    def _drop(self, path):
+        _, arrays = self.items.pop(path)
+        self.current_bytes -= sum(array.nbytes for array in arrays.values())
+
+    @staticmethod
+    def _decode(path, max_width):
+        _load_plotting()
+        with Image.open(path) as img:
+            if img.width > max_width:
+                # JPEGは縮小しながらデコードできる
+                img.draft('RGB', (max_width, max(1, round(img.height * max_width / img.width))))
+            img = ImageOps.exif_transpose(img)
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+            if img.width > max_width:
+                img = img.resize((max_width, max(1, round(img.height * max_width / img.width))), Image.LANCZOS)
+            return np.asarray(img)
+
+
+class SearchIndex:
+    """
+    エントリー本文の転置インデックス。
+    分かち書きのない日本語でも引けるよう、文字bigramを単位として索引する。
+    """
+
+    def __init__(self):
+        self.postings = {} # bigram -> {doc_id: 出現回数}
+        self.doc_text = {} # doc_id -> 正規化済みテキスト
+        # doc_id -> bigramの総数 (文書ごとのbigramの表は持たず、削除時はテキストから数え直す)
+        self.doc_length = {}
+
+    @staticmethod
+    def normalize(text):
+        return unicodedata.normalize('NFKC', text).lower()
+
+    @staticmethod
+    def ngrams(text):
+        """正規化済みテキストの文字bigramを数える (空白をまたぐbigramは作らない)"""
+        grams = {}
+        for chunk in text.split():
+            if len(chunk) == 1:
+                grams[chunk] = grams.get(chunk, 0) + 1
+            for i in range(len(chunk) - 1):
+                gram = chunk[i:i + 2]
+                grams[gram] = grams.get(gram, 0) + 1
+        return grams
+
+    def add(self, doc_id, text):
+        self.remove(doc_id)
+        text = self.normalize(text)
+        grams = self.ngrams(text)
+        postings = self.postings
+        for gram, count in grams.items():
+            docs = postings.get(gram)
+            if docs is None:
+                postings[sys.intern(gram)] = {doc_id: count}
+            else:
+                docs[doc_id] = count
+        self.doc_length[doc_id] = sum(grams.values())
+        self.doc_text[doc_id] = text
+
+    def remove(self, doc_id):
+        text = self.doc_text.pop(doc_id, None)
+        if text is None:
+            return
+        for gram in self.ngrams(text):
+            docs = self.postings.get(gram)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[gram]
+        self.doc_length.pop(doc_id, None)
+
+    def search(self, query, limit=50):
+        """空白区切りの全語を含む文書を (doc_id, score) のスコア順で返す"""
+        terms = self.normalize(query).split()
+        if not terms:
+            return []
+        total_docs = len(self.doc_text) or 1
+        candidates = None
+        term_grams = []
+        for term in terms:
+            grams = list(self.ngrams(term)) if len(term) > 1 else []
+            term_grams.append(grams)
+            if not grams:
+                # 1文字の語は索引では引けないので本文を走査する
+                matched = {doc_id for doc_id, text in self.doc_text.items() if term in text}
+            else:
+                # 出現文書の少ないbigramから順に絞り込む
+                matched = None
+                for gram in sorted(grams, key=lambda g: len(self.postings.get(g, ()))):
+                    docs = self.postings.get(gram)
+                    if not docs:
+                        matched = set()
+                        break
+                    matched = set(docs) if matched is None else matched & docs.keys()
+                    if not matched:
+                        break
+                # bigramが揃っていても連続していない場合を除く
+                matched = {doc_id for doc_id in matched if term in self.doc_text[doc_id]}
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                return []
+
+        scored = []
+        for doc_id in candidates:
+            length_norm = math.sqrt(self.doc_length[doc_id] or 1)
+            score = 0.0
+            for term, grams in zip(terms, term_grams):
+                if grams:
+                    for gram in grams:
+                        docs = self.postings[gram]
+                        score += docs[doc_id] * math.log(1 + total_docs / len(docs))
+                else:
+                    score += self.doc_text[doc_id].count(term)
+            scored.append((doc_id, score / length_norm))
+        scored.sort(key=lambda x: x[1], reverse=True)
+        return scored[:limit]
+
+    def snippet(self, doc_id, query, width=40):
+        """最初に一致した語の前後を抜き出す"""
+        text = self.doc_text.get(doc_id, '')
+        for term in self.normalize(query).split():
+            pos = text.find(term)
+            if pos >= 0:
+                start = max(pos - width // 2, 0)
+                return ('…' if start > 0 else '') + text[start:pos + len(term) + width // 2].replace('\n', ' ') + '…'
+        return text[:width]
+
+
+class ImageCatalog:
+    """
+    画像選択用の画像カタログ。完成エントリーの画像1枚ごとに日付・出典のエントリー・種類・タグを持つ。
+    エントリーの追加・更新・削除のたびにそのエントリーの分だけ差し替え、新しい日付順に返す。
+    """
+
+    # 画像を持つエントリーの種類 -> フィールド (研究会報告の画像は他のエントリーの画像の参照なので含めない)
+    SOURCE_FIELDS = {'daily': 'today_completed_images', 'experiment': 'results_images', 'participation': 'images'}
+
+    def __init__(self):
+        self.items = {} # (日付, エントリーid, -位置) -> 画像の情報
+        self.texts = {} # キー -> 検索用の正規化済みテキスト
+        self.order = [] # itemsのキーの昇順
+        self.record_keys = {} # エントリーid -> キーのリスト
+
+    def _entries(self, record, title):
+        """エントリーの画像の (キー, 画像の情報, 検索用テキスト) を返す"""
+        field = self.SOURCE_FIELDS.get(record['type'])
+        data = record['data']
+        names = data.get(field) if field else None
+        if record.get('status') == 'draft' or not isinstance(names, list):
+            return []
+        date = str(data.get('date') or data.get('experiment_date') or record['timestamp'][:10])
+        tags = split_tags(data.get('tags', ''))
+        results = []
+        for pos, filename in enumerate(names):
+            item = {'filename': filename, 'entry_id': record['id'], 'source_type': record['type'],
+                    'source_field': field, 'date': date, 'title': title, 'tags': tags}
+            text = SearchIndex.normalize(" ".join([filename, record['type'], field, title] + tags))
+            results.append(((date, record['id'], -pos), item, text))
+        return results
+
+    def rebuild(self, records):
+        """(レコード, タイトル) の列からカタログを作り直す"""
+        self.items, self.texts, self.record_keys = {}, {}, {}
+        for record, title in records:
+            keys = []
+            for key, item, text in self._entries(record, title):
+                self.items[key] = item
+                self.texts[key] = text
+                keys.append(key)
+            if keys:
+                self.record_keys[record['id']] = keys
+        self.order = sorted(self.items)
+
+    def add(self, record, title):
+        self.remove(record['id'])
+        keys = []
+        for key, item, text in self._entries(record, title):
+            self.items[key] = item
+            self.texts[key] = text
+            bisect.insort(self.order, key)
+            keys.append(key)
+        if keys:
+            self.record_keys[record['id']] = keys
+
+    def remove(self, record_id):
+        for key in self.record_keys.pop(record_id, ()):
+            del self.items[key]
+            del self.texts[key]
+            pos = bisect.bisect_left(self.order, key)
+            if pos < len(self.order) and self.order[pos] == key:
+                del self.order[pos]
+
+    def query(self, text=None, entry_type=None, tag=None, date_from=None, date_to=None, offset=0, limit=50):
+        """
+        条件に合う画像を新しい順に offset 件目から limit 件 (Noneなら全件) 返す。
+        戻り値は (画像の情報のリスト, 条件に合う総数)。
+        """
+        terms = SearchIndex.normalize(text).split() if text else []
+        items = []
+        total = 0
+        for key in reversed(self.order):
+            item = self.items[key]
+            if entry_type and item['source_type'] != entry_type:
+                continue
+            if date_from and item['date'] < date_from:
+                continue
+            if date_to and item['date'] > date_to:
+                continue
+            if tag and tag not in item['tags']:
+                continue
+            if terms and not all(term in self.texts[key] for term in terms):
+                continue
+            if total >= offset and (limit is None or len(items) < limit):
+                items.append(item)
+            total += 1
+        return items, total
+
+
+class SqliteImageCatalog:
+    """
+    ImageCatalog と同じ問い合わせを SqliteStorage の image_refs・tags テーブルに対して行う画像カタログ。
+    テーブルは保存のたびにストレージが更新するので、エントリーの追加・更新・削除では何もしない。
+    """
+
+    def __init__(self, storage, titles):
+        self.storage = storage
+        self.titles = titles
+        self.source_field_sql = "CASE r.type " + " ".join(
+            f"WHEN '{entry_type}' THEN '{field}'" for entry_type, field in ImageCatalog.SOURCE_FIELDS.items()) + " END"
+
+    def rebuild(self, records):
+        pass
+
+    def add(self, record, title):
+        pass
+
+    def remove(self, record_id):
+        pass
+
+    def query(self, text=None, entry_type=None, tag=None, date_from=None, date_to=None, offset=0, limit=50):
+        """ImageCatalog.query と同じ (種類・日付・タグはSQLで絞り込み、テキストは取り出した行に対して調べる)"""
+        where = ["r.kind = 'entries'", "r.status IS NOT 'draft'", f"i.field = {self.source_field_sql}"]
+        params = []
+        if entry_type:
+            where.append("r.type = ?")
+            params.append(entry_type)
+        if date_from:
+            where.append("r.date >= ?")
+            params.append(date_from)
+        if date_to:
+            where.append("r.date <= ?")
+            params.append(date_to)
+        if tag:
+            where.append("EXISTS (SELECT 1 FROM tags t WHERE t.record_id = r.id AND t.tag = ?)")
+            params.append(tag)
+        sql = ("FROM image_refs i JOIN records r ON r.id = i.record_id WHERE " + " AND ".join(where))
+        select = ("SELECT i.filename, r.id, r.type, i.field, r.date, r.summary " + sql +
+                  " ORDER BY r.date DESC, r.id DESC, i.position")
+        terms = SearchIndex.normalize(text).split() if text else []
+        if terms:
+            rows = self.storage.conn.execute(select, params).fetchall()
+        else:
+            total = self.storage.conn.execute("SELECT COUNT(*) " + sql, params).fetchone()[0]
+            rows = self.storage.conn.execute(select + " LIMIT ? OFFSET ?",
+                                             params + [-1 if limit is None else limit, offset]).fetchall()
+        items = []
+        for filename, record_id, source_type, field, date, summary in rows:
+            title = self.titles(record_id)
+            if title is None:
+                continue # 他のプロセスが追加した (次の読み込みで一覧に入る)
+            tags = split_tags(json.loads(summary).get('tags', ''))
+            items.append({'filename': filename, 'entry_id': record_id, 'source_type': source_type,
+                          'source_field': field, 'date': date, 'title': title, 'tags': tags})
+        if not terms:
+            return items, total
+        items = [item for item in items
+                 if all(term in SearchIndex.normalize(" ".join([item['filename'], item['source_type'], item['source_field'],
+                                                                 item['title']] + item['tags'])) for term in terms)]
+        return items[offset:] if limit is None else items[offset:offset + limit], len(items)
+
+
+class StatsColumns:
+    """
+    統計用に完成エントリーの項目を列ごとのNumPy配列で持つ (1エントリー1行、削除した行は空きとして再利用する)。
+    エントリーの追加・更新・削除のたびにその行だけを書き換え、集計は配列全体に対してまとめて行う。
+    """
+
+    TYPES = ('daily', 'experiment', 'participation', 'research_meeting')
+    EPOCH = datetime(1970, 1, 1)
+
+    def __init__(self, capacity=1024):
+        _load_numpy()
+        self.rows = {} # エントリーid -> 行
+        self.free = [] # 削除して空いた行
+        self.size = 0 # 一度でも使った行の数
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.type = np.zeros(capacity, dtype=np.int8) # TYPES の番号
+        self.day = np.zeros(capacity, dtype=np.int32) # 日付欄の日付 (1970-01-01からの日数)
+        self.hours = np.full(capacity, np.nan) # 日報の来た時間〜帰る時間 (時間)
+        self.work_type = np.full(capacity, -1, dtype=np.int16) # 日報の勤務形態の番号
+        self.todo_total = np.zeros(capacity, dtype=np.int32) # 日報の「今日のTODO」の行数
+        self.todo_done = np.zeros(capacity, dtype=np.int32) # 「今日できたこと」の行数 (TODOの行数まで)
+        self.tags = np.full((capacity, 4), -1, dtype=np.int32) # タグの番号 (足りなければ列を増やす)
+        self.tag_names, self.tag_ids = [], {}
+        self.work_type_names, self.work_type_ids = [], {}
+
+    @staticmethod
+    def _code(names, ids, value):
+        code = ids.get(value)
+        if code is None:
+            code = ids[value] = len(names)
+            names.append(value)
+        return code
+
+    @classmethod
+    def day_number(cls, date):
+        """'YYYY-MM-DD' の1970-01-01からの日数 (日付でなければNone)"""
+        try:
+            return (datetime.strptime(str(date)[:10], '%Y-%m-%d') - cls.EPOCH).days
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _minutes(value):
+        try:
+            hour, minute = str(value).split(':')[:2]
+            return int(hour) * 60 + int(minute)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _line_count(text):
+        return sum(1 for line in text.splitlines() if line.strip()) if isinstance(text, str) else 0
+
+    def _grow(self):
+        capacity = len(self.valid) * 2
+
+        def grow(array, fill):
+            grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            grown[:len(array)] = array
+            return grown
+        self.valid, self.type, self.day = grow(self.valid, False), grow(self.type, 0), grow(self.day, 0)
+        self.hours, self.work_type = grow(self.hours, np.nan), grow(self.work_type, -1)
+        self.todo_total, self.todo_done = grow(self.todo_total, 0), grow(self.todo_done, 0)
+        self.tags = grow(self.tags, -1)
+
+    def put(self, record):
+        """完成エントリーの行を追加・更新する"""
+        row = self.rows.get(record['id'])
+        if row is None:
+            if self.free:
+                row = self.free.pop()
+            else:
+                if self.size == len(self.valid):
+                    self._grow()
+                row = self.size
+                self.size += 1
+            self.rows[record['id']] = row
+        data = LazyData.full(record['data'])
+        day = self.day_number(record_date(record))
+        self.valid[row] = True
+        self.type[row] = self.TYPES.index(record['type']) if record['type'] in self.TYPES else 0
+        self.day[row] = day if day is not None else self.day_number(record['timestamp'])
+        self.hours[row] = np.nan
+        self.work_type[row] = -1
+        self.todo_total[row] = self.todo_done[row] = 0
+        if record['type'] == 'daily':
+            arrival, departure = self._minutes(data.get('arrival_time')), self._minutes(data.get('departure_time'))
+            if arrival is not None and departure is not None and departure > arrival:
+                self.hours[row] = (departure - arrival) / 60
+            if data.get('work_type'):
+                self.work_type[row] = self._code(self.work_type_names, self.work_type_ids, data['work_type'])
+            total = self._line_count(data.get('today_todo'))
+            self.todo_total[row] = total
+            self.todo_done[row] = min(self._line_count(data.get('today_completed')), total)
+        tags = [self._code(self.tag_names, self.tag_ids, tag) for tag in dict.fromkeys(split_tags(data.get('tags')))]
+        if len(tags) > self.tags.shape[1]:
+            self.tags = np.pad(self.tags, ((0, 0), (0, len(tags) - self.tags.shape[1])), constant_values=-1)
+        self.tags[row] = -1
+        self.tags[row, :len(tags)] = tags
+
+    def remove(self, record_id):
+        row = self.rows.pop(record_id, None)
+        if row is not None:
+            self.valid[row] = False
+            self.tags[row] = -1
+            self.free.append(row)
+
+    def summarize(self, date_from=None, date_to=None, top_tags=20):
+        """日付欄が date_from〜date_to の完成エントリーを集計する (ResearchDiaryCore.stats() の戻り値)"""
+        n = self.size
+        mask = self.valid[:n].copy()
+        day_from, day_to = self.day_number(date_from or ''), self.day_number(date_to or '')
+        if day_from is not None:
+            mask &= self.day[:n] >= day_from
+        if day_to is not None:
+            mask &= self.day[:n] <= day_to
+        types, days = self.type[:n][mask], self.day[:n][mask]
+        hours, work_types = self.hours[:n][mask], self.work_type[:n][mask]
+        todo_total, todo_done = self.todo_total[:n][mask], self.todo_done[:n][mask]
+        attended = ~np.isnan(hours)
+
+        weekly = []
+        if len(days):
+            weeks = (days + 3) // 7 # 月曜始まりの週 (1970-01-01は木曜)
+            first = int(weeks.min())
+            span = int(weeks.max()) - first + 1
+            index = weeks - first
+            counts = np.bincount(index * len(self.TYPES) + types, minlength=span * len(self.TYPES))
+            counts = counts.reshape(span, len(self.TYPES))
+            week_hours = np.bincount(index[attended], weights=hours[attended], minlength=span)
+            week_days = np.bincount(index[attended], minlength=span)
+            week_todo = np.bincount(index, weights=todo_total, minlength=span)
+            week_done = np.bincount(index, weights=todo_done, minlength=span)
+            starts = (np.arange(first, first + span) * 7 - 3).astype('datetime64[D]')
+            for i in range(span):
+                weekly.append({
+                    'week': str(starts[i]),
+                    'entries': {entry_type: int(counts[i, t]) for t, entry_type in enumerate(self.TYPES)},
+                    'attendance_days': int(week_days[i]),
+                    'attendance_hours': round(float(week_hours[i]), 2),
+                    'todo_total': int(week_todo[i]),
+                    'todo_done': int(week_done[i]),
+                })
+
+        tag_ids = self.tags[:n][mask].ravel()
+        tag_counts = np.bincount(tag_ids[tag_ids >= 0], minlength=len(self.tag_names))
+        top = [i for i in np.argsort(-tag_counts, kind='stable')[:top_tags] if tag_counts[i]]
+        work_type_counts = np.bincount(work_types[work_types >= 0], minlength=len(self.work_type_names))
+        total_hours = float(hours[attended].sum())
+        total_todo, total_done = int(todo_total.sum()), int(todo_done.sum())
+        return {
+            'date_from': date_from, 'date_to': date_to,
+            'entries': int(mask.sum()),
+            'by_type': dict(zip(self.TYPES, (int(c) for c in np.bincount(types, minlength=len(self.TYPES))))),
+            'attendance': {
+                'days': int(attended.sum()),
+                'total_hours': round(total_hours, 2),
+                'mean_hours': round(total_hours / attended.sum(), 2) if attended.any() else None,
+                'by_work_type': {self.work_type_names[i]: int(c) for i, c in enumerate(work_type_counts) if c},
+            },
+            'tags': [(self.tag_names[i], int(tag_counts[i])) for i in top],
+            'todo': {'total': total_todo, 'done': total_done,
+                     'rate': round(total_done / total_todo, 3) if total_todo else None},
+            'weekly': weekly,
+        }
+
+
+def _write_json_atomic(path, obj, target, **dump_options):
+    """JSONを一時ファイルに書き出してfsyncしてから置き換え、書き込み途中のファイルを読まれないようにする"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, **{'ensure_ascii': False, 'indent': 2, **dump_options})
+            f.flush()
+            os.fsync(f.fileno())
+            metrics.inc('research_record_bytes_written_total', f.tell(), target=target)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class JsonFileStorage:
+    """完成エントリー・下書きをそれぞれ1つのJSONファイルに丸ごと書き出す保存方式"""
+
+    # 起動用スナップショット (RecordSnapshot) を使えるか (signature() が終了後も同じ値を返す方式のみ)
+    supports_snapshot = True
+    # タグ・画像の参照を保存先の索引で引けるか (SqliteStorage の tagged_ids() / image_catalog())
+    queries_records = False
+
+    def __init__(self, data_file, draft_file):
+        self.data_file = data_file
+        self.draft_file = draft_file
+        self._known_signature = None # 最後に読み込み・書き込みした後の signature() (読み込み前はNone)
+
+    def _path(self, kind):
+        return self.data_file if kind == 'entries' else self.draft_file
+
+    def _read_snapshot(self, path):
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return []
+
+    def _write_snapshot(self, path, records):
+        _write_json_atomic(path, records, 'snapshot')
+        self._known_signature = self.signature()
+
+    def load(self):
+        """(entries, drafts) を返す"""
+        result = self._read_snapshot(self.data_file), self._read_snapshot(self.draft_file)
+        self._known_signature = self.signature()
+        return result
+
+    def attach(self, entries, drafts):
+        """load() の代わりに起動用スナップショットから読み込んだ (entries, drafts) を受け取る"""
+        self._known_signature = self.signature()
+
+    def snapshot_signature(self):
+        """
+        起動用スナップショットを使えるかを判定するための、保存されている内容を表す値。
+        読み込んだ後にこのプロセス以外 (git pull・手での編集など) で変更されていればNone (スナップショットを書き出さない)。
+        """
+        signature = self.signature()
+        if self._known_signature is not None and signature != self._known_signature:
+            return None
+        return signature
+
+    def save_record(self, kind, record, records):
+        """1件の追加・更新を保存 (この方式では全件を書き直す)"""
+        self.save_all(kind, records)
+
+    def delete_record(self, kind, record_id, records):
+        """1件の削除を保存 (この方式では全件を書き直す)"""
+        self.save_all(kind, records)
+
+    def save_all(self, kind, records):
+        self._write_snapshot(self._path(kind), records)
+
+    def _signature_paths(self):
+        return [self.data_file, self.draft_file]
+
+    def signature(self):
+        """保存されている内容が他のプロセスに変更されたかを判定するための値"""
+        result = []
+        for path in self._signature_paths():
+            try:
+                st = os.stat(path)
+                result.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except OSError:
+                result.append(None)
+        return tuple(result)
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self, entries, drafts):
+        pass
+
+    def reopen(self):
+        pass
+
+    def close(self, entries=None, drafts=None):
+        pass
+
+
+class JournalStorage(JsonFileStorage):
+    """
+    追記専用ジャーナル + スナップショットによる保存方式。
+    変更1件ごとに1行をジャーナルへ追記してfsyncし、一定件数たまったら
+    research_data.json / research_drafts.json (スナップショット) に畳み込む。
+    """
+
+    def __init__(self, data_file, draft_file, journal_file, compact_every=500):
+        super().__init__(data_file, draft_file)
+        self.journal_file = journal_file
+        self.compact_every = compact_every
+        self.journal_records = 0
+
+    def load(self):
+        entries = {e['id']: e for e in self._read_snapshot(self.data_file)}
+        drafts = {d['id']: d for d in self._read_snapshot(self.draft_file)}
+        self.journal_records = 0
+        if os.path.exists(self.journal_file):
+            self._truncate_torn_tail()
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中でクラッシュした末尾行は捨てる
+                        print(f"ジャーナルの不完全な行を無視しました: {line[:80]!r}")
+                        continue
+                    target = entries if op['kind'] == 'entries' else drafts
+                    if op['op'] == 'put':
+                        target[op['record']['id']] = op['record']
+                    elif op['op'] == 'delete':
+                        target.pop(op['id'], None)
+                    elif op['op'] == 'reset':
+                        target.clear()
+                        target.update((r['id'], r) for r in op['records'])
+                    self.journal_records += 1
+        self._known_signature = self.signature()
+        return list(entries.values()), list(drafts.values())
+
+    def attach(self, entries, drafts):
+        # スナップショットは畳み込み後に書き出すので、ジャーナルは空
+        self.journal_records = 0
+        self._known_signature = self.signature()
+
+    def _truncate_torn_tail(self):
+        """改行で終わっていない末尾 (書き込み途中のクラッシュ) を切り詰める"""
+        with open(self.journal_file, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                good_size = data.rfind(b"\n") + 1
+                print(f"ジャーナルの不完全な末尾を切り詰めました: {data[good_size:][:80]!r}")
+                f.truncate(good_size)
+
+    def _append(self, op):
+        line = json.dumps(op, ensure_ascii=False) + "\n"
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_records += 1
+        self._known_signature = self.signature()
+        metrics.inc('research_record_bytes_written_total', len(line.encode('utf-8')), target='journal')
+
+    def save_record(self, kind, record, records):
+        self._append({'op': 'put', 'kind': kind, 'record': record})
+
+    def delete_record(self, kind, record_id, records):
+        self._append({'op': 'delete', 'kind': kind, 'id': record_id})
+
+    def save_all(self, kind, records):
+        self._append({'op': 'reset', 'kind': kind, 'records': records})
+
+    def _signature_paths(self):
+        return [self.data_file, self.draft_file, self.journal_file]
+
+    def needs_compaction(self):
+        return self.journal_records >= self.compact_every
+
+    def compact(self, entries, drafts):
+        """ジャーナルをスナップショットに畳み込み、ジャーナルを空にする"""
+        self._write_snapshot(self.data_file, entries)
+        self._write_snapshot(self.draft_file, drafts)
+        # スナップショット書き込み後にクラッシュしても、put/deleteの再適用は冪等なので安全
+        with open(self.journal_file, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_records = 0
+        self._known_signature = self.signature()
+
+    def close(self, entries=None, drafts=None):
+        if entries is not None and drafts is not None and self.journal_records:
+            self.compact(entries, drafts)
+
+
+class ShardedFileStorage:
+    """
+    エントリー・下書きを1件1ファイルのJSONとして、日付の年月ごとのディレクトリに保存する方式。
+    notebook/entries/2024/05/<id>.json のように分かれるので、gitで管理すると変更したエントリーの分だけが差分になる。
+    画像は従来どおり images/ に内容のハッシュをファイル名として置く。
+    """
+
+    supports_snapshot = True
+    queries_records = False
+
+    def __init__(self, root_dir, generation_file):
+        self.root_dir = root_dir
+        # 変更のたびに書き換え、他のプロセスの変更の検出に使う (notebook/ の外に置いてgitの差分にしない)
+        self.generation_file = generation_file
+        self._paths = {} # (kind, id) -> 保存先のパス
+        # 最後に読み込み・書き込みした後の種類・年・月のディレクトリの更新時刻 (読み込み前はNone)。
+        # generation_file はgitの管理外なので、git pullなどによるファイルの追加・置き換え・削除はディレクトリの更新時刻で検出する
+        self._known_dirs = None
+        self._scanned_dirs = None # 直前の snapshot_signature() で調べた結果
+
+    def _record_path(self, kind, record):
+        date = record_date(record)
+        year, month = date[:4], date[5:7]
+        if not (year.isdigit() and month.isdigit()):
+            year, month = record['timestamp'][:4], record['timestamp'][5:7]
+        return os.path.join(self.root_dir, kind, year, month, f"{urllib.parse.quote(record['id'], safe='')}.json")
+
+    def _bump_generation(self):
+        tmp_path = f"{self.generation_file}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp_path, self.generation_file)
+
+    def is_empty(self):
+        return not any(os.path.isdir(os.path.join(self.root_dir, kind)) for kind in ('entries', 'drafts'))
+
+    def _scan_dirs(self):
+        """
+        種類・年・月のディレクトリの {パス: 更新時刻}。
+        ファイルを作る・置き換える・消すと親ディレクトリの更新時刻が変わるので、レコードのファイルは調べない (月の数に比例)。
+        """
+        dirs = {}
+        for kind in ('entries', 'drafts'):
+            pending = [(os.path.join(self.root_dir, kind), 2)]
+            while pending:
+                path, depth = pending.pop()
+                try:
+                    dirs[path] = os.stat(path).st_mtime_ns
+                    if depth:
+                        pending.extend((entry.path, depth - 1) for entry in os.scandir(path) if entry.is_dir())
+                except OSError:
+                    pass
+        return dirs
+
+    def _remember_dirs(self, path):
+        """このプロセスが path を書き込み・削除した後の、月・年・種類のディレクトリの更新時刻を記録する"""
+        if self._known_dirs is None:
+            return
+        directory = os.path.dirname(path)
+        for _ in range(3):
+            try:
+                self._known_dirs[directory] = os.stat(directory).st_mtime_ns
+            except OSError:
+                self._known_dirs.pop(directory, None)
+            directory = os.path.dirname(directory)
+
+    def load(self):
+        records = {'entries': {}, 'drafts': {}}
+        self._paths = {}
+        for kind, loaded in records.items():
+            for dirpath, dirnames, filenames in os.walk(os.path.join(self.root_dir, kind)):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if not filename.endswith('.json'):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        with open(path, 'r', encoding='utf-8') as f:
+                            record = json.load(f)
+                    except ValueError as e:
+                        print(f"読み込めないファイルを無視しました: {path} ({e})")
+                        continue
+                    previous = loaded.get(record['id'])
+                    if previous is not None:
+                        # 日付を変えて保存する途中で止まると古いファイルが残るので、新しい方を使う
+                        stale_path = path
+                        if previous['timestamp'] <= record['timestamp']:
+                            stale_path = self._paths[(kind, record['id'])]
+                        os.remove(stale_path)
+                        if stale_path == path:
+                            continue
+                    loaded[record['id']] = record
+                    self._paths[(kind, record['id'])] = path
+        self._known_dirs = self._scan_dirs()
+        return [sorted(loaded.values(), key=lambda r: (r['timestamp'], r['id'])) for loaded in records.values()]
+
+    def attach(self, entries, drafts):
+        # 保存先のパスは日付から決まるので、ファイルを走査せずに求める
+        self._paths = {}
+        for kind, records in (('entries', entries), ('drafts', drafts)):
+            for record in records:
+                self._paths[(kind, record['id'])] = self._record_path(kind, record)
+        # スナップショットの検証で調べた結果が、読み込んだ内容に対応する
+        self._known_dirs = self._scanned_dirs if self._scanned_dirs is not None else self._scan_dirs()
+
+    def _write(self, kind, record):
+        path = self._record_path(kind, record)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_json_atomic(path, record, 'record', sort_keys=True)
+        self._remember_dirs(path)
+        old_path = self._paths.get((kind, record['id']))
+        self._paths[(kind, record['id'])] = path
+        if old_path and old_path != path and os.path.exists(old_path):
+            os.remove(old_path)
+            self._remember_dirs(old_path)
+
+    def _remove(self, kind, record_id):
+        path = self._paths.pop((kind, record_id), None)
+        if path and os.path.exists(path):
+            os.remove(path)
+            self._remember_dirs(path)
+
+    def save_record(self, kind, record, records):
+        self._write(kind, record)
+        self._bump_generation()
+
+    def delete_record(self, kind, record_id, records):
+        self._remove(kind, record_id)
+        self._bump_generation()
+
+    def save_all(self, kind, records):
+        live_ids = set()
+        for record in records:
+            self._write(kind, record)
+            live_ids.add(record['id'])
+        for stored_kind, record_id in list(self._paths):
+            if stored_kind == kind and record_id not in live_ids:
+                self._remove(kind, record_id)
+        self._bump_generation()
+
+    def signature(self):
+        # 書き込みのたびに変わる乱数 (同じ時刻の書き込みでも区別できるよう、statではなく内容を比べる)
+        try:
+            with open(self.generation_file, 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return '' # まだ一度も書き込んでいない (Noneはclose()後を表すので使わない)
+
+    def snapshot_signature(self):
+        """
+        起動用スナップショットを使えるかを判定するための、generation_file の内容と年月のディレクトリの更新時刻のハッシュ。
+        読み込んだ後にこのプロセス以外 (git pullなど) でファイルが追加・置き換え・削除されていればNone (スナップショットを書き出さない)。
+        ファイルをその場で書き換える編集 (ディレクトリの更新時刻が変わらない) は検出しない。
+        """
+        dirs = self._scan_dirs()
+        self._scanned_dirs = dirs
+        if self._known_dirs is not None and dirs != self._known_dirs:
+            return None
+        digest = hashlib.sha256(self.signature().encode('utf-8'))
+        for path, mtime_ns in sorted(dirs.items()):
+            digest.update(f"\n{os.path.relpath(path, self.root_dir)}\0{mtime_ns}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self, entries, drafts):
+        pass
+
+    def reopen(self):
+        pass
+
+    def close(self, entries=None, drafts=None):
+        pass
+
+
+class SqliteStorage:
+    """
+    SQLite (WALモード) による保存方式。
+    エントリー・下書きを1行1レコードで持ち、変更した1件だけを書き込む。id・種類・日付・タグ・画像の参照に索引を張る。
+    起動時は一覧に使う列 (data以外のフィールドと LazyData.SUMMARY_FIELDS) だけを読み、本文は使うときに主キーで読む。
+    タグでの絞り込みと画像カタログは tags / image_refs テーブルに問い合わせる。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            type TEXT NOT NULL,
+            status TEXT,
+            date TEXT,
+            timestamp TEXT,
+            body TEXT NOT NULL,
+            head TEXT,
+            summary TEXT,
+            has_rest INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_records_kind ON records(kind);
+        CREATE INDEX IF NOT EXISTS idx_records_type ON records(type, date);
+        CREATE INDEX IF NOT EXISTS idx_records_date ON records(date);
+        CREATE TABLE IF NOT EXISTS tags (
+            record_id TEXT NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+            tag TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tags_tag ON tags(tag);
+        CREATE INDEX IF NOT EXISTS idx_tags_record ON tags(record_id);
+        CREATE TABLE IF NOT EXISTS image_refs (
+            record_id TEXT NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+            field TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            filename TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_image_refs_record ON image_refs(record_id);
+        CREATE INDEX IF NOT EXISTS idx_image_refs_filename ON image_refs(filename);
+    """
+    # PRAGMA user_version。上げたら _migrate() で既存のデータベースを移行する
+    SCHEMA_VERSION = 2
+
+    # data_versionは接続ごとの値で、次の起動時の値と比べられないので起動用スナップショットは使わない
+    supports_snapshot = False
+    queries_records = True
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._inherited_conns = []
+        self._connect()
+        self.conn.executescript(self.SCHEMA)
+        self._migrate()
+
+    def _connect(self):
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+
+    def _migrate(self):
+        """一覧用の列・タグ・画像の参照を持たない以前の版のデータベースを、本文から埋め直す"""
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] >= self.SCHEMA_VERSION:
+            return
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(records)")}
+        with self.conn:
+            for column, column_type in (('head', 'TEXT'), ('summary', 'TEXT'), ('has_rest', 'INTEGER')):
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE records ADD COLUMN {column} {column_type}")
+            rows = self.conn.execute("SELECT kind, body FROM records ORDER BY rowid").fetchall()
+            for kind, body in rows:
+                self._insert(*self._row(kind, json.loads(body)))
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        if rows:
+            print(f"SQLiteのデータベースを移行しました: {len(rows)} 件")
+
+    def reopen(self):
+        """fork後の子プロセスで接続を作り直す (親プロセスの接続は閉じずに使わないでおく)"""
+        self._inherited_conns.append(self.conn)
+        self._connect()
+
+    @staticmethod
+    def _row(kind, record):
+        """レコードを records テーブルの1行とタグ・画像の参照に分ける (本文はここで読むので、書き込み前に呼ぶ)"""
+        data = LazyData.full(record.get('data') or {})
+        head = {key: value for key, value in record.items() if key != 'data'}
+        summary = {key: data[key] for key in LazyData.SUMMARY_FIELDS if key in data}
+        has_rest = any(key not in LazyData.SUMMARY_FIELDS for key in data)
+        body = json.dumps(dict(record, data=data), ensure_ascii=False)
+        values = (record['id'], kind, record['type'], record.get('status'), record_date(record), record['timestamp'],
+                  body, json.dumps(head, ensure_ascii=False), json.dumps(summary, ensure_ascii=False), int(has_rest))
+        tags = [(record['id'], tag) for tag in dict.fromkeys(split_tags(data.get('tags')))]
+        images = [(record['id'], field, position, filename)
+                  for field in IMAGE_FIELDS if isinstance(data.get(field), list)
+                  for position, filename in enumerate(data[field])]
+        return values, tags, images
+
+    def _insert(self, values, tags, images):
+        metrics.inc('research_record_bytes_written_total', len(values[6].encode('utf-8')), target='sqlite')
+        self.conn.execute(
+            "INSERT INTO records (id, kind, type, status, date, timestamp, body, head, summary, has_rest) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET kind=excluded.kind, type=excluded.type, status=excluded.status, "
+            "date=excluded.date, timestamp=excluded.timestamp, body=excluded.body, head=excluded.head, "
+            "summary=excluded.summary, has_rest=excluded.has_rest", values)
+        # 更新ではON DELETE CASCADEが働かないので、前の版のタグ・画像の参照は消してから入れる
+        self.conn.execute("DELETE FROM tags WHERE record_id = ?", (values[0],))
+        self.conn.execute("DELETE FROM image_refs WHERE record_id = ?", (values[0],))
+        self.conn.executemany("INSERT INTO tags (record_id, tag) VALUES (?, ?)", tags)
+        self.conn.executemany("INSERT INTO image_refs (record_id, field, position, filename) VALUES (?, ?, ?, ?)",
+                              images)
+
+    def load(self):
+        """一覧用の列だけを読み、本文は SqliteLazyData が使うときに load_rest() で読む"""
+        result = {'entries': [], 'drafts': []}
+        for record_id, kind, head, summary, has_rest in self.conn.execute(
+                "SELECT id, kind, head, summary, has_rest FROM records ORDER BY rowid"):
+            record = json.loads(head)
+            summary = json.loads(summary)
+            record['data'] = SqliteLazyData(summary, (self, record_id)) if has_rest else summary
+            result[kind].append(record)
+        return result['entries'], result['drafts']
+
+    def load_rest(self, record_id):
+        """レコードの data のうち LazyData.SUMMARY_FIELDS 以外のフィールド (主キーで1行読む)"""
+        row = self.conn.execute("SELECT body FROM records WHERE id = ?", (record_id,)).fetchone()
+        if row is None:
+            return {} # 他のプロセスが削除した (次の読み込みで一覧からも消える)
+        data = json.loads(row[0]).get('data') or {}
+        return {key: value for key, value in data.items() if key not in LazyData.SUMMARY_FIELDS}
+
+    def save_record(self, kind, record, records):
+        row = self._row(kind, record)
+        with self.conn:
+            self._insert(*row)
+
+    def delete_record(self, kind, record_id, records):
+        with self.conn:
+            # タグ・画像の参照は ON DELETE CASCADE で消える
+            self.conn.execute("DELETE FROM records WHERE id = ? AND kind = ?", (record_id, kind))
+
+    def save_all(self, kind, records):
+        # 本文を読む前に行を消さないよう、先にすべての行を作る
+        rows = [self._row(kind, record) for record in records]
+        with self.conn:
+            self.conn.execute("DELETE FROM records WHERE kind = ?", (kind,))
+            for row in rows:
+                self._insert(*row)
+
+    def tagged_ids(self, tags):
+        """tags のいずれかを持つレコードのidの昇順のリスト (tags索引)"""
+        tags = list(tags)
+        if not tags:
+            return []
+        return [row[0] for row in self.conn.execute(
+            f"SELECT DISTINCT record_id FROM tags WHERE tag IN ({', '.join('?' * len(tags))}) ORDER BY record_id",
+            tags)]
+
+    def image_catalog(self, titles):
+        """image_refs テーブルに問い合わせる画像カタログ (titles(エントリーid) は一覧の行のタイトル)"""
+        return SqliteImageCatalog(self, titles)
+
+    def signature(self):
+        # 他の接続がコミットしたときだけ変わる
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def is_empty(self):
+        return self.conn.execute("SELECT 1 FROM records LIMIT 1").fetchone() is None
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self, entries, drafts):
+        pass
+
+    def close(self, entries=None, drafts=None):
+        self.conn.close()
+
+
+def migrate_json_to_sqlite(data_file, draft_file, journal_file, storage):
+    """既存の research_data.json / research_drafts.json (+未畳み込みのジャーナル) をSQLiteへ一括移行"""
+    entries, drafts = JournalStorage(data_file, draft_file, journal_file).load()
+    with storage.conn:
+        for record in entries:
+            storage._insert(*storage._row('entries', record))
+        for record in drafts:
+            storage._insert(*storage._row('drafts', record))
+    print(f"SQLiteへ移行しました: 完成 {len(entries)} 件, 下書き {len(drafts)} 件")
+    return len(entries), len(drafts)
+
+
+def create_storage(backend, script_dir):
+    """保存方式名からストレージを生成 ('json', 'journal', 'sharded' または 'sqlite')"""
+    data_file = os.path.join(script_dir, "research_data.json")
+    draft_file = os.path.join(script_dir, "research_drafts.json")
+    journal_file = os.path.join(script_dir, "research_journal.jsonl")
+    if backend == 'json':
+        return JsonFileStorage(data_file, draft_file)
+    if backend == 'journal':
+        return JournalStorage(data_file, draft_file, journal_file)
+    if backend == 'sqlite':
+        storage = SqliteStorage(os.path.join(script_dir, "research_data.sqlite3"))
+        if storage.is_empty() and (os.path.exists(data_file) or os.path.exists(draft_file)):
+            migrate_json_to_sqlite(data_file, draft_file, journal_file, storage)
+        return storage
+    if backend == 'sharded':
+        storage = ShardedFileStorage(os.path.join(script_dir, "notebook"),
+                                     os.path.join(script_dir, ".research_record.generation"))
+        if storage.is_empty() and (os.path.exists(data_file) or os.path.exists(draft_file)):
+            entries, drafts = JournalStorage(data_file, draft_file, journal_file).load()
+            storage.save_all('entries', entries)
+            storage.save_all('drafts', drafts)
+            print(f"1件1ファイルの保存方式へ移行しました: 完成 {len(entries)} 件, 下書き {len(drafts)} 件")
+        return storage
+    raise ValueError(f"不明なストレージ: {backend}")
+
+
+class LazyData(dict):
+    """
+    起動用スナップショットから読み込んだエントリーのdata。
+    一覧・画像カタログ・画像の参照数に使うフィールド (SUMMARY_FIELDS) だけを持って作り、
+    それ以外のフィールドに触れたとき (閲覧・編集・出力など) に残りの本文をスナップショットから復元する。
+    本文の読み方はサブクラスで _load_rest() / _has_rest() を差し替えて変える (SqliteLazyData)。
+    """
+
+    __slots__ = ('_body',)
+
+    # タイトル・日付・タグ・画像の参照
+    SUMMARY_FIELDS = frozenset(['name', 'purpose', 'content', 'meeting_title', 'date', 'experiment_date', 'tags']
+                               + IMAGE_FIELDS)
+    # 残りの本文が空のときのmarshalの長さ
+    EMPTY_BODY_LENGTH = len(marshal.dumps({}))
+    _lock = threading.Lock()
+
+    def __init__(self, summary, body):
+        super().__init__(summary)
+        self._body = body # (mmap, 位置, 長さ)。復元後はNone
+
+    def _load_rest(self, body):
+        """残りの本文のdict"""
+        mm, offset, length = body
+        return marshal.loads(mm[offset:offset + length])
+
+    def _has_rest(self, body):
+        """残りの本文にフィールドがあるか"""
+        return body[2] > self.EMPTY_BODY_LENGTH
+
+    def body_bytes(self):
+        """未復元なら残りの本文のmarshalのバイト列 (復元済みならNone)"""
+        body = self._body
+        if body is None:
+            return None
+        mm, offset, length = body
+        return mm[offset:offset + length]
+
+    def _materialize(self):
+        if self._body is not None:
+            with LazyData._lock:
+                if self._body is not None:
+                    dict.update(self, self._load_rest(self._body))
+                    self._body = None
+                    metrics.inc('research_record_lazy_decodes_total')
+        return self
+
+    def __getitem__(self, key):
+        if self._body is not None and key not in self.SUMMARY_FIELDS:
+            self._materialize()
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if self._body is not None and key not in self.SUMMARY_FIELDS:
+            self._materialize()
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        if self._body is not None and key not in self.SUMMARY_FIELDS:
+            self._materialize()
+        return dict.__contains__(self, key)
+
+    def __bool__(self):
+        body = self._body
+        if body is not None:
+            return dict.__len__(self) > 0 or self._has_rest(body)
+        return dict.__len__(self) > 0
+
+    def copy(self):
+        """本文も含む普通のdict (復元した本文はこのLazyDataには残さない)"""
+        body = self._body
+        result = dict(dict.items(self)) # dict.copy() はオーバーライドしたkeys()を使うので避ける
+        if body is not None:
+            result.update(self._load_rest(body))
+        return result
+
+    @staticmethod
+    def full(data):
+        """
+        dataがLazyDataなら本文も含む一時的なdictを、そうでなければdataをそのまま返す。
+        全件を読む処理 (検索の索引・HTML・検査) はこれを使い、メモリに本文を残さない。
+        """
+        return data.copy() if isinstance(data, LazyData) else data
+
+    def __reduce_ex__(self, protocol):
+        # 別プロセス (PDF出力など) やcopyには普通のdictとして渡す
+        return dict, (self.copy(),)
+
+    def _whole(name):
+        """残りの本文を復元してから dict の name を呼ぶメソッド"""
+        method = getattr(dict, name)
+
+        def wrapper(self, *args, **kwargs):
+            self._materialize()
+            return method(self, *args, **kwargs)
+        wrapper.__name__ = name
+        return wrapper
+
+    for _name in ('__iter__', '__len__', '__eq__', '__ne__', '__repr__', 'keys', 'items', 'values',
+                  '__setitem__', '__delitem__', 'pop', 'popitem', 'setdefault', 'update', 'clear'):
+        locals()[_name] = _whole(_name)
+    del _name, _whole
+
+
+class SqliteLazyData(LazyData):
+    """SqliteStorage から読み込んだエントリーのdata。残りの本文は使うときに主キーでSQLiteから読む"""
+
+    __slots__ = ()
+
+    def _load_rest(self, body):
+        storage, record_id = body
+        return storage.load_rest(record_id)
+
+    def _has_rest(self, body):
+        return True # 残りの本文があるレコードだけをこのクラスで作る
+
+    def body_bytes(self):
+        body = self._body
+        return marshal.dumps(self._load_rest(body)) if body is not None else None
+
+
+class RecordSnapshot:
+    """
+    起動を速くするためのエントリー・下書きのバイナリスナップショット (.research_record.snapshot)。
+    終了時に書き出し、次の起動で保存方式の signature() が書き出したときと同じなら、JSONを読む代わりに使う。
+    ファイルは [ヘッダー | 各レコードの本文 (marshal) | 索引 (marshal)] で、起動時は mmap して索引だけを読む。
+    索引には各レコードのdata以外のフィールドと LazyData.SUMMARY_FIELDS の値を持ち、本文は LazyData が必要なときに復元する。
+    """
+
+    MAGIC = b'RRSNAP01'
+    HEADER = struct.Struct('<8sQQ') # MAGIC, 索引の位置, 索引の長さ
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def _split(record):
+        """レコードを (data以外のフィールド, 一覧用のフィールド, 残りの本文のmarshal) に分ける"""
+        fields = {key: value for key, value in record.items() if key != 'data'}
+        data = record.get('data') or {}
+        summary_fields = LazyData.SUMMARY_FIELDS
+        if isinstance(data, LazyData):
+            summary = {key: dict.__getitem__(data, key) for key in summary_fields if dict.__contains__(data, key)}
+            body = data.body_bytes()
+            if body is not None:
+                return fields, summary, body
+        else:
+            summary = {key: data[key] for key in summary_fields if key in data}
+        return fields, summary, marshal.dumps({key: value for key, value in dict.items(data)
+                                               if key not in summary_fields})
+
+    def write(self, signature, entries, drafts):
+        """スナップショットを一時ファイルに書き出してから置き換える"""
+        index = {'python': list(sys.version_info[:2]), 'signature': signature, 'entries': [], 'drafts': []}
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(self.HEADER.pack(self.MAGIC, 0, 0))
+                for kind, records in (('entries', entries), ('drafts', drafts)):
+                    for record in records:
+                        fields, summary, body = self._split(record)
+                        index[kind].append((fields, summary, f.tell(), len(body)))
+                        f.write(body)
+                index_offset = f.tell()
+                index_bytes = marshal.dumps(index)
+                f.write(index_bytes)
+                f.seek(0)
+                f.write(self.HEADER.pack(self.MAGIC, index_offset, len(index_bytes)))
+                f.flush()
+                os.fsync(f.fileno())
+                metrics.inc('research_record_bytes_written_total', index_offset + len(index_bytes), target='snapshot')
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load(self, signature):
+        """signature が書き出したときと同じなら (entries, drafts) を返し、使えなければNoneを返す"""
+        try:
+            with open(self.path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None # ファイルがない・空
+        try:
+            magic, index_offset, index_length = self.HEADER.unpack_from(mm, 0)
+            if magic != self.MAGIC:
+                return None
+            index = marshal.loads(mm[index_offset:index_offset + index_length])
+        except (struct.error, EOFError, ValueError, TypeError):
+            print("起動用スナップショットが壊れているため使いません")
+            return None
+        if index['python'] != list(sys.version_info[:2]) or index['signature'] != signature:
+            return None # 他のプロセスが変更した・異なるバージョンのPythonで書き出した
+        result = []
+        for kind in ('entries', 'drafts'):
+            records = []
+            for fields, summary, offset, length in index[kind]:
+                fields['data'] = LazyData(summary, (mm, offset, length))
+                records.append(fields)
+            result.append(records)
+        return result
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class GitCommitter:
+    """
+    データディレクトリのgitリポジトリに、変更をまとめて定期的にコミットするバックグラウンドスレッド。
+    notify() されてから interval 秒の間の変更を1つのコミットにする (gitコマンドを使う)。
+    lock はステージからコミットまでの間、ファイルの書き込みを止めるコンテキストマネージャーを返す関数
+    (書き込み途中のファイルをコミットせず、複数ワーカーのgitコマンドも同時に実行しない)。
+    """
+
+    # コミットするファイル (存在するものだけ)
+    TRACKED_PATHS = ['notebook', 'images', 'research_ledger.jsonl',
+                     'research_data.json', 'research_drafts.json', 'research_journal.jsonl']
+    # user.name / user.email が設定されていないときのコミットの作者
+    DEFAULT_AUTHOR = ('研究記録アプリ', 'research-record@localhost')
+    # 書き込み途中の一時ファイル (_write_json_atomic とアップロード) はコミットしない
+    EXCLUDED_PATHS = [':(exclude)*.tmp', f':(exclude)*{UPLOAD_TMP_SUFFIX}']
+
+    def __init__(self, repo_dir, interval, lock=None):
+        self.repo_dir = repo_dir
+        self.interval = interval
+        self.lock = lock
+        self.enabled = True
+        self._pending = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closing = False
+
+    def _git(self, *args, check=True):
+        return subprocess.run(['git', *args], cwd=self.repo_dir, capture_output=True, text=True, check=check)
+
+    def ensure_repo(self):
+        """データディレクトリがgitリポジトリでなければ作る"""
+        try:
+            if self._git('rev-parse', '--is-inside-work-tree', check=False).returncode != 0:
+                self._git('init', '-q')
+                print(f"gitリポジトリを作成しました: {self.repo_dir}")
+        except OSError as e:
+            print(f"警告: gitを実行できないため自動コミットを無効にします ({e})")
+            self.enabled = False
+
+    def notify(self):
+        """変更があったことを知らせる (コミットは後でまとめて行う)"""
+        if not self.enabled:
+            return
+        with self._cond:
+            if self._closing:
+                return
+            self._pending = True
+            if self._thread is None:
+                # fork後の子プロセスで作られるよう、最初の変更のときに起動する
+                self._thread = threading.Thread(target=self._run, name='git-commit', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.interval
+                while not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closing:
+                    return
+            self.commit()
+
+    def _identity(self):
+        if self._git('config', 'user.email', check=False).stdout.strip():
+            return []
+        name, email = self.DEFAULT_AUTHOR
+        return ['-c', f'user.name={name}', '-c', f'user.email={email}']
+
+    @staticmethod
+    def _message(changes):
+        """git diff --name-status の行からコミットメッセージを作る"""
+        records = [line for line in changes if line.split('\t')[-1].startswith('notebook/')]
+        images = [line for line in changes if line.split('\t')[-1].startswith('images/')]
+        if records or images:
+            subject = f"研究記録を更新 (エントリー {len(records)} 件, 画像 {len(images)} 件)"
+        else:
+            subject = f"研究記録を更新 ({len(changes)} ファイル)"
+        body = [line.replace('\t', ' ') for line in changes[:50]]
+        if len(changes) > 50:
+            body.append(f"... ほか {len(changes) - 50} ファイル")
+        return subject + "\n\n" + "\n".join(body)
+
+    def commit(self):
+        """保留中の変更をコミットし、コミットしたファイル数を返す"""
+        with self._cond:
+            self._pending = False
+        if not self.enabled:
+            return 0
+        try:
+            with self.lock() if self.lock is not None else nullcontext():
+                paths = [p for p in self.TRACKED_PATHS if os.path.exists(os.path.join(self.repo_dir, p))]
+                if not paths:
+                    return 0
+                paths += self.EXCLUDED_PATHS
+                self._git('add', '-A', '--', *paths)
+                changes = self._git('-c', 'core.quotePath=false', 'diff', '--cached', '--name-status', '--',
+                                    *paths).stdout.splitlines()
+                if not changes:
+                    return 0
+                # パスを指定して、利用者が別にステージした変更はコミットに含めない
+                # (一時ファイルしかないディレクトリはgitが知らないパスになるので、変更のあったものだけを指定する)
+                changed = sorted({path.split('/')[0] for line in changes for path in line.split('\t')[1:]})
+                self._git(*self._identity(), 'commit', '-q', '-m', self._message(changes), '--',
+                          *changed, *self.EXCLUDED_PATHS)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"gitへの自動コミットに失敗しました: {getattr(e, 'stderr', None) or e}")
+            metrics.inc('research_record_errors_total', operation='git_commit')
+            with self._cond:
+                self._pending = True # 次の周期で再試行する
+            return 0
+        metrics.inc('research_record_git_commits_total')
+        return len(changes)
+
+    def close(self):
+        """スレッドを止め、残っている変更をコミットする"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        if self._pending:
+            self.commit()
+
+
+def _leaf_hash(leaf):
+    """台帳の葉のハッシュ (RFC 6962と同じく葉と節点を区別する接頭辞を付ける)"""
+    body = json.dumps(leaf, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(b'\x00' + body.encode('utf-8')).digest()
+
+
+def _node_hash(left, right):
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+
+def _hash_file(path):
+    """ファイルの内容のSHA-256 (ファイルがなければNone)"""
+    sha256 = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+    except OSError:
+        return None
+    return sha256.hexdigest()
+
+
+def ledger_record_digest(record, image_digests):
+    """台帳に記録するエントリーのダイジェスト (本文と、参照している画像の内容のハッシュを含む)"""
+    payload = {'id': record['id'], 'type': record['type'], 'timestamp': record['timestamp'],
+               'data': LazyData.full(record['data']), 'images': image_digests}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _verify_records(images_dir, records):
+    """
+    エントリーのダイジェストを画像ファイルを読み直して計算する (verifyのワーカープロセスでも使う)。
+    [(id, ダイジェスト, hashフィールドが本文と一致するか)] を返す。
+    """
+    results = []
+    for record in records:
+        data = LazyData.full(record['data'])
+        record = dict(record, data=data)
+        names = [name for field in IMAGE_FIELDS if isinstance(data.get(field), list) for name in data[field]]
+        image_digests = {name: _hash_file(os.path.join(images_dir, name)) for name in names}
+        hash_ok = record.get('hash') == ResearchDiaryCore.generate_hash(data)
+        results.append((record['id'], ledger_record_digest(record, image_digests), hash_ok))
+    return results
+
+
+class IntegrityLedger:
+    """
+    完成エントリーの変更履歴を葉とするMerkle木の台帳 (RFC 6962と同じ木の形)。
+    追加・更新・削除のたびに葉を1つ追記し、各時点の根のハッシュを台帳ファイルに残す。
+    完全二分木になった部分木のハッシュを段ごとに持つので、追記・根の計算・包含証明はO(log n)。
+    """
+
+    def __init__(self, ledger_file):
+        self.ledger_file = ledger_file
+        self.leaves = [] # 葉の内容 {'seq', 'op', 'id', 'digest', 'time'}
+        self.levels = [[]] # levels[l][k] = 葉 k*2^l 〜 (k+1)*2^l - 1 の部分木のハッシュ
+        self.latest = {} # id -> そのidの最新の葉の番号
+        # 台帳ファイルは起動時には読まず、最初に使うときに読み込む
+        self.loaded = False
+        self._load_lock = threading.Lock()
+
+    @property
+    def size(self):
+        self._ensure_loaded()
+        return len(self.leaves)
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            with self._load_lock:
+                if not self.loaded:
+                    self.load()
+
+    def unload(self):
+        """読み込んだ内容を捨て、次に使うときに台帳ファイルを読み直す"""
+        self.loaded = False
+
+    def has_records(self):
+        """台帳ファイルに記録があるか (読み込まずに判定する)"""
+        if self.loaded:
+            return bool(self.leaves)
+        try:
+            return os.path.getsize(self.ledger_file) > 0
+        except OSError:
+            return False
+
+    def load(self):
+        self.leaves, self.levels, self.latest = [], [[]], {}
+        self.loaded = True
+        if not os.path.exists(self.ledger_file):
+            return
+        with open(self.ledger_file, 'rb') as f:
+            content = f.read()
+        complete = content[:content.rfind(b'\n') + 1]
+        if len(complete) != len(content):
+            # 書き込み途中で終了した末尾の行を切り詰める
+            with open(self.ledger_file, 'r+b') as f:
+                f.truncate(len(complete))
+            print("台帳の不完全な末尾を切り詰めました")
+        for line in complete.decode('utf-8').splitlines():
+            if line.strip():
+                entry = json.loads(line)
+                entry.pop('root', None)
+                self._push(entry)
+
+    def _push(self, leaf):
+        self.leaves.append(leaf)
+        self.latest[leaf['id']] = len(self.leaves) - 1
+        self.levels[0].append(_leaf_hash(leaf))
+        level = 0
+        while len(self.levels[level]) % 2 == 0:
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            self.levels[level + 1].append(_node_hash(*self.levels[level][-2:]))
+            level += 1
+
+    def _subtree_hash(self, start, end):
+        """葉 start 〜 end-1 の部分木のハッシュ"""
+        n = end - start
+        if n == 0:
+            return hashlib.sha256(b'').digest()
+        if n & (n - 1) == 0:
+            level = n.bit_length() - 1
+            return self.levels[level][start >> level]
+        k = 1 << ((n - 1).bit_length() - 1) # nより小さい最大の2の累乗
+        return _node_hash(self._subtree_hash(start, start + k), self._subtree_hash(start + k, end))
+
+    def root(self, size=None):
+        """先頭 size 件 (省略時は全件) の葉からなる木の根のハッシュ (16進)"""
+        return self._subtree_hash(0, self.size if size is None else size).hex()
+
+    def append(self, op, record_id, digest):
+        """葉を1つ追記し、追記後の根のハッシュを返す"""
+        return self.append_many([(op, record_id, digest)])
+
+    def append_many(self, changes):
+        """[(op, id, ダイジェスト)] をまとめて追記し、追記後の根のハッシュを返す"""
+        now = datetime.now().isoformat(timespec='seconds')
+        lines = []
+        for op, record_id, digest in changes:
+            leaf = {'seq': self.size, 'op': op, 'id': record_id, 'digest': digest, 'time': now}
+            self._push(leaf)
+            lines.append(json.dumps(dict(leaf, root=self.root()), ensure_ascii=False) + "\n")
+        with open(self.ledger_file, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        return self.root()
+
+    def current(self):
+        """{id: ダイジェスト} 台帳上で削除されていないエントリーの最新のダイジェスト"""
+        self._ensure_loaded()
+        return {record_id: self.leaves[index]['digest'] for record_id, index in self.latest.items()
+                if self.leaves[index]['op'] == 'put'}
+
+    def _path(self, index, start, end):
+        n = end - start
+        if n == 1:
+            return []
+        k = 1 << ((n - 1).bit_length() - 1)
+        if index < k:
+            return self._path(index, start, start + k) + [self._subtree_hash(start + k, end)]
+        return self._path(index - k, start + k, end) + [self._subtree_hash(start, start + k)]
+
+    def prove(self, record_id):
+        """エントリーの最新の葉が現在の根に含まれることの証明 (台帳になければNone)"""
+        self._ensure_loaded()
+        index = self.latest.get(record_id)
+        if index is None:
+            return None
+        return {'leaf': self.leaves[index], 'index': index, 'size': self.size,
+                'path': [h.hex() for h in self._path(index, 0, self.size)], 'root': self.root()}
+
+    @staticmethod
+    def verify_proof(proof):
+        """prove() の証明を、台帳の他の葉を使わずに検証する (RFC 9162 2.1.3.2)"""
+        index, size = proof['index'], proof['size']
+        if index >= size:
+            return False
+        fn, sn = index, size - 1
+        result = _leaf_hash(proof['leaf'])
+        for sibling in (bytes.fromhex(h) for h in proof['path']):
+            if sn == 0:
+                return False
+            if fn & 1 or fn == sn:
+                result = _node_hash(sibling, result)
+                while not fn & 1 and fn != 0:
+                    fn >>= 1
+                    sn >>= 1
+            else:
+                result = _node_hash(result, sibling)
+            fn >>= 1
+            sn >>= 1
+        return sn == 0 and result.hex() == proof['root']
+
+    def check_log(self, size=None, root=None):
+        """
+        台帳ファイルを読み直し、各行に記録された根が葉から計算し直した根と一致するかを確認して問題のリストを返す。
+        size・rootを渡すと、先頭 size 件の根がそれと一致するか (読み込み後・記録後に書き換えられていないか) も確認する。
+        """
+        problems = []
+        replay = IntegrityLedger(self.ledger_file)
+        replay.loaded = True # 読み込まずに1行ずつ積み直す
+        if os.path.exists(self.ledger_file):
+            with open(self.ledger_file, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        else:
+            lines = []
+        for line_no, line in enumerate(lines, start=1):
+            if not line.endswith("\n"):
+                break # 追記中の行
+            if line.strip():
+                entry = json.loads(line)
+                recorded_root = entry.pop('root', None)
+                if entry.get('seq') != replay.size:
+                    problems.append(f"台帳 {line_no}行目: 通し番号が連続していません ({entry.get('seq')})")
+                replay._push(entry)
+                if recorded_root != replay.root():
+                    problems.append(f"台帳 {line_no}行目: 記録された根のハッシュが一致しません")
+        if size is not None:
+            if replay.size < size:
+                problems.append(f"台帳の葉が {size} 件より少なくなっています ({replay.size} 件)")
+            elif replay.root(size) != root:
+                problems.append(f"台帳の先頭 {size} 件の根のハッシュが {root} と一致しません")
+        return problems
+
+
+class ListRow:
+    """
+    一覧表示用の1行 (テンプレートからは row.title のように参照する)。
+    エントリー・下書きごとに1つ作って一覧・検索で使い回すので、dictではなく __slots__ で持つ。
+    """
+
+    __slots__ = ('id', 'type', 'date', 'title', 'tags', 'tag_list', 'status')
+
+    def __init__(self, id, type, date, title, tags, tag_list, status):
+        self.id = id
+        self.type = type
+        self.date = date
+        self.title = title
+        self.tags = tags
+        self.tag_list = tag_list
+        self.status = status
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
 
 class ResearchDiaryCore:
-    def __init__(self, script_dir):
+    def __init__(self, script_dir, storage=None, load=True):
+        started = time.perf_counter()
         self.script_dir = script_dir
         self.images_dir = os.path.join(self.script_dir, "images")
         if not os.path.exists(self.images_dir):
             os.makedirs(self.images_dir)
+        # サムネイルは元画像の内容のSHA-256をキーにして保存する
+        self.thumbnails_dir = os.path.join(self.script_dir, "thumbnails")
+        self._image_digests = {} # filename -> (mtime_ns, size, sha256)
+        self._image_refs = {} # filename -> 参照しているエントリー・下書きの数
+        self._record_images = {} # id -> 参照している画像ファイル名のリスト
+        # アップロード1ファイルあたりの上限と、画像の検証・サムネイル生成用のスレッドプール
+        self.max_image_bytes = int(os.environ.get('RESEARCH_RECORD_MAX_IMAGE_MB', '50')) * 1024 * 1024
+        self._image_executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix='image')
 
         self.data_file = os.path.join(self.script_dir, "research_data.json")
         self.draft_file = os.path.join(self.script_dir, "research_drafts.json")
         self.html_file = os.path.join(self.script_dir, "research_data.html")
+        # HTMLの各断片の位置と fingerprint (再起動後もHTMLを再生成せずに断片を再利用する)
+        self.html_index_file = os.path.join(self.script_dir, ".research_data.html.index")
+
+        # 読み込みは並行、書き込みは1つずつ行う。
+        # RESEARCH_RECORD_PROCESS_LOCK=1 のときは書き込みをプロセス間でも直列化し、他のプロセスの変更を読み直す
+        self.records_lock = ReadWriteLock()
+        self.process_lock = None
+        if os.environ.get('RESEARCH_RECORD_PROCESS_LOCK', '') not in ('', '0'):
+            self.enable_process_lock()
+        self._storage_signature = None # 最後に読み込み・書き込みしたときのストレージのsignature()
+        self.closed = False
+        # RESEARCH_RECORD_GIT=1 のとき、変更をデータディレクトリのgitリポジトリにまとめてコミットする
+        self.git_committer = None
+        if os.environ.get('RESEARCH_RECORD_GIT', '') not in ('', '0'):
+            self.enable_git_commits(float(os.environ.get('RESEARCH_RECORD_GIT_COMMIT_SECONDS', '60')))
+
+        # 保存方式 (RESEARCH_RECORD_STORAGE=json で従来の全件書き出しに戻せる)
+        if storage is None:
+            storage = create_storage(os.environ.get('RESEARCH_RECORD_STORAGE', 'journal'), self.script_dir)
+        self.storage = storage
 
         self.entries = []
         self.drafts = []
+        # entries/drafts がストレージから正常に読み込んだものか (読み込みに失敗した空の一覧で保存先を上書きしないため)
+        self.records_loaded = False
+        # 完成エントリーの変更履歴のMerkle木 (改ざんの検出用)
+        self.ledger = IntegrityLedger(os.path.join(self.script_dir, "research_ledger.jsonl"))
+        self._index = {} # id -> エントリーまたは下書き
+        self._list_rows = {} # id -> 一覧表示用の行
+        self._list_order = [] # 一覧表示用の行のid (昇順)
+        self._list_subsets = {} # ('type'|'status'|'tag', 値) -> その値を持つ行のid (昇順)
+        self._list_dates = [] # 一覧表示用の行の (日付, id) (昇順)
+        self._html_order = [] # HTMLアーカイブの並び順 ((timestamp, id) の昇順)
+        self._html_keys = {} # id -> _html_order での (timestamp, id)
+        self._search_index = None # 全文検索の索引 (最初の検索で作る: _ensure_search_index)
+        self._search_index_lock = threading.Lock()
+        # 統計用の列 (最初の stats() で作る) と、データの版ごとの集計結果・グラフのキャッシュ
+        self._data_version = 0 # エントリー・下書きを変更するたびに増やす
+        self._stats_columns = None
+        self._stats_lock = threading.Lock()
+        self._stats_cache = OrderedDict() # (版, date_from, date_to) -> stats() の結果
+        self._stats_charts = OrderedDict() # (版, グラフ名, date_from, date_to) -> (PNG, ETag)
+        self._stats_chart_lock = threading.Lock() # pyplotはスレッドセーフでないので1つずつ描く
+        self._image_catalog = ImageCatalog()
+        # 終了時に書き出し、次の起動でJSONの代わりに読む (RESEARCH_RECORD_SNAPSHOT=0 で使わない)
+        self.snapshot = None
+        if storage.supports_snapshot and os.environ.get('RESEARCH_RECORD_SNAPSHOT', '1') != '0':
+            self.snapshot = RecordSnapshot(os.path.join(self.script_dir, ".research_record.snapshot"))
+        # 下書きのパッチ (自動保存) の書き込みをまとめる間隔 (秒)
+        self._draft_autosaver = DraftAutosaver(
+            self._persist_drafts, float(os.environ.get('RESEARCH_RECORD_DRAFT_FLUSH_SECONDS', '2')))
 
-        self.setup_fonts()
-        self.load_data()
+        # HTMLアーカイブの差分更新用キャッシュ: id -> (fingerprint, html断片)
+        # Falseにすると保存のたびに全エントリーを再生成する
+        self.incremental_html = True
+        self._html_fragments = {}
+        self._html_index_loaded = False # html_index_file から断片を読み込んだか (最初の保存時に一度だけ)
+        # HTMLファイルは保存の処理では書かず、一定間隔 (秒) ごとにまとめてバックグラウンドで書き直す
+        self._html_writer = HtmlArchiveWriter(
+            self._write_html, float(os.environ.get('RESEARCH_RECORD_HTML_FLUSH_SECONDS', '2')))
 
-    def setup_fonts(self):
-        """日本語フォントの設定 (matplotlib用)"""
-        try:
-            font_paths = [
-                "C:/Windows/Fonts/msgothic.ttc", "C:/Windows/Fonts/meiryo.ttc", "C:/Windows/Fonts/NotoSansCJK-Regular.ttc",
-                "/System/Library/Fonts/Hiragino Sans GB.ttc", "/Library/Fonts/Hiragino Sans GB.ttc", "/System/Library/Fonts/Arial Unicode MS.ttf",
-                "/usr/share/fonts/truetype/noto-cjk/NotoSansCJK-Regular.ttc", "/usr/share/fonts/truetype/takao-gothic/TakaoPGothic.ttf",
-                "/usr/share/fonts/truetype/vlgothic/VL-PGothic-Regular.ttf", "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
-                "/usr/share/fonts/truetype/fonts-japanese-gothic.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-            ]
-
-            self.font_path = None
-            for font_path in font_paths:
-                if os.path.exists(font_path):
-                    self.font_path = font_path
-                    break
-
-            if self.font_path:
-                font_prop = fm.FontProperties(fname=self.font_path)
-                plt.rcParams['font.family'] = font_prop.get_name()
-                fm.fontManager.addfont(self.font_path) # Ensure font is added
+        # PDF/PNG出力の描画 (フォントと縮小済み画像のキャッシュを持つ。ジョブのワーカープロセスでは単独で使う)
+        self.renderer = ExportRenderer(self.script_dir, self.images_dir)
+        # PDF/PNG出力のジョブキュー (出力はエントリーのハッシュごとにキャッシュし、合計が上限を超えたら古いものから削除)
+        self.export_jobs = ExportJobQueue(
+            self.script_dir, self.images_dir, os.path.join(self.script_dir, "exports"),
+            max_bytes=int(os.environ.get('RESEARCH_RECORD_EXPORT_CACHE_MB', '512')) * 1024 * 1024)
+
+        if load:
+            self.load_data()
+        metrics.set('research_record_startup_seconds', time.perf_counter() - started)
+
+    def enable_process_lock(self):
+        """複数プロセスで同じデータを扱うためのプロセス間ロックを有効にし、有効になったかを返す"""
+        if self.process_lock is None:
+            if fcntl is None:
+                print("警告: このOSではプロセス間ロックを使えません。")
+                return False
+            self.process_lock = ProcessFileLock(os.path.join(self.script_dir, ".research_record.lock"))
+        return True
+
+    def enable_git_commits(self, interval=60):
+        """変更を interval 秒ごとにまとめてgitにコミットするようにする"""
+        if self.git_committer is None:
+            self.git_committer = GitCommitter(self.script_dir, interval, lock=self._quiescent)
+            self.git_committer.ensure_repo()
+
+    def after_fork(self):
+        """
+        fork直後の子プロセスで呼ぶ。スレッド・ロック・ファイルロック・DB接続など
+        親プロセスと共有できないものを作り直す (読み込み済みのエントリーはそのまま使う)。
+        """
+        self.records_lock = ReadWriteLock()
+        self._search_index_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats_chart_lock = threading.Lock()
+        self._image_executor = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix='image')
+        self.export_jobs = ExportJobQueue(self.script_dir, self.images_dir, self.export_jobs.cache_dir, max_bytes=self.export_jobs.max_bytes)
+        if self.process_lock is not None:
+            # flockは開いたファイルごとのロックなので、親と同じファイルオブジェクトでは排他にならない
+            self.process_lock = ProcessFileLock(self.process_lock.path)
+        self._draft_autosaver = DraftAutosaver(self._persist_drafts, self._draft_autosaver.delay)
+        self._html_writer = HtmlArchiveWriter(self._write_html, self._html_writer.delay)
+        if self.git_committer is not None:
+            self.git_committer = GitCommitter(self.script_dir, self.git_committer.interval, lock=self._quiescent)
+        self.storage.reopen()
+        if self._storage_signature is not None:
+            self._storage_signature = self.storage.signature()
+        metrics.after_fork()
+
+    @contextmanager
+    def _writing(self):
+        """エントリー・下書きを変更する区間 (他のプロセスが変更していれば先に読み直す)"""
+        with self.records_lock.write() as outermost:
+            if not outermost or self.process_lock is None:
+                yield
             else:
-                available_fonts = [f.name for f in fm.fontManager.ttflist]
-                japanese_fonts = [
-                    'Noto Sans CJK JP', 'Noto Sans JP', 'Takao PGothic',
-                    'VL PGothic', 'IPAexGothic', 'IPAGothic', 'Hiragino Sans GB',
-                    'Meiryo', 'MS Gothic', 'Yu Gothic'
-                ]
-                for font in japanese_fonts:
-                    if font in available_fonts:
-                        plt.rcParams['font.family'] = font
-                        self.font_path = font # Store the found font name for textwrap
-                        break
-                else:
-                    plt.rcParams['font.family'] = 'DejaVu Sans'
-                    print("警告: 日本語フォントが見つかりませんでした。デフォルトフォントを使用します。")
+                with self.process_lock:
+                    if self._storage_signature is not None and self.storage.signature() != self._storage_signature:
+                        self.load_data()
+                    try:
+                        yield
+                    finally:
+                        if self._storage_signature is not None: # close()後はストレージを使わない
+                            self._storage_signature = self.storage.signature()
+            if outermost and self.git_committer is not None:
+                self.git_committer.notify()
 
-            plt.rcParams['axes.unicode_minus'] = False # Enable minus sign in Japanese fonts
-            print(f"matplotlib font set to: {plt.rcParams['font.family']}") # Debugging font setting
+    @contextmanager
+    def _quiescent(self):
+        """他のスレッド・プロセスがファイルを書き込まない区間 (データは読み直さず、gitへの通知もしない)"""
+        with self.records_lock.write() as outermost:
+            if not outermost or self.process_lock is None:
+                yield
+            else:
+                with self.process_lock:
+                    yield
 
-        except Exception as e:
-            print(f"フォント設定エラー: {e}")
-            plt.rcParams['font.family'] = 'DejaVu Sans'
-            plt.rcParams['axes.unicode_minus'] = False
+    @contextmanager
+    def _reading(self):
+        """エントリー・下書きを読む区間"""
+        if (self.process_lock is not None and self._storage_signature is not None
+                and not self.records_lock.held() and self.storage.signature() != self._storage_signature):
+            with self._writing():
+                pass # 他のプロセスの変更を読み直す
+        with self.records_lock.read():
+            yield
 
-    def save_image(self, file_storage_object):
+    def create_upload_file(self):
+        """アップロード受信用の一時ファイルを作成 (Flaskのリクエストから呼ばれる)"""
+        return HashingUploadFile(self.images_dir, self.max_image_bytes)
+
+    def _store_upload(self, file_storage_object):
         """
-        画像ファイルを専用ディレクトリに保存し、新しいファイル名を返す。
-        file_storage_objectはFlaskのrequest.filesから来るもの。
+        アップロードされた画像を内容のSHA-256をファイル名として専用ディレクトリに保存し、そのファイル名を返す。
+        同じ内容の画像が既にあれば新たに保存せず既存のファイル名を返す。
         """
-        if not file_storage_object:
-            return None
+        tmp_path = None
         try:
             # FlaskのFileStorageオブジェクトからファイル名を抽出
             original_filename = file_storage_object.filename
-            file_ext = os.path.splitext(original_filename)[1]
-            unique_filename = f"{uuid.uuid4().hex}{file_ext}"
+            file_ext = os.path.splitext(original_filename)[1].lower()
+
+            stream = file_storage_object.stream
+            if isinstance(stream, HashingUploadFile):
+                # 受信時に一時ファイルへ書き出し・ハッシュ計算済み
+                digest, tmp_path = stream.detach()
+            else:
+                # 一時ファイルへ書き出しながらハッシュを計算する
+                sha256 = hashlib.sha256()
+                fd, tmp_path = tempfile.mkstemp(dir=self.images_dir, suffix=UPLOAD_TMP_SUFFIX)
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                        sha256.update(chunk)
+                        f.write(chunk)
+                digest = sha256.hexdigest()
+            unique_filename = f"{digest}{file_ext}"
             new_path = os.path.join(self.images_dir, unique_filename)
 
-            # ファイルを保存
-            file_storage_object.save(new_path)
+            if os.path.exists(new_path):
+                # 同じ内容の画像が保存済み。GCの猶予期間を延ばすため更新時刻だけ更新する
+                os.remove(tmp_path)
+                os.utime(new_path)
+                metrics.inc('research_record_image_bytes_total', os.path.getsize(new_path), stage='upload_duplicate')
+            else:
+                os.replace(tmp_path, new_path)
+                metrics.inc('research_record_image_bytes_total', os.path.getsize(new_path), stage='upload')
+            tmp_path = None
             return unique_filename
         except Exception as e:
             print(f"画像保存エラー: {e}")
+            metrics.inc('research_record_errors_total', operation='store_upload')
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+
+    def _validate_image(self, filename):
+        """Pillowで画像として読めるかを確認"""
+        _load_imaging()
+        try:
+            with Image.open(self.get_image_path(filename)) as img:
+                img.verify()
+            return True
+        except Exception as e:
+            print(f"画像として読み込めないファイルを除外しました: {filename} ({e})")
+            return False
+
+    @instrumented('save_images')
+    def save_images(self, file_storage_objects):
+        """
+        複数の画像を保存し、有効な画像のファイル名のリストを返す。
+        検証は画像処理用スレッドプールで並列に行い、サムネイル生成は待たずにバックグラウンドで続ける。
+        """
+        saved_names = []
+        for file_storage_object in file_storage_objects:
+            if file_storage_object and file_storage_object.filename != '':
+                saved_name = self._store_upload(file_storage_object)
+                if saved_name:
+                    saved_names.append(saved_name)
+
+        validations = [(name, self._image_executor.submit(self._validate_image, name)) for name in saved_names]
+        valid_names = []
+        for name, validation in validations:
+            # 無効な画像はどこからも参照されないので、いずれgc_imagesで削除される
+            if validation.result():
+                valid_names.append(name)
+                self._image_executor.submit(self.generate_thumbnails, name)
+        return valid_names
+
+    def save_image(self, file_storage_object):
+        """
+        画像ファイルを専用ディレクトリに保存し、ファイル名を返す。
+        file_storage_objectはFlaskのrequest.filesから来るもの。
+        """
+        if not file_storage_object:
             return None
+        saved_names = self.save_images([file_storage_object])
+        return saved_names[0] if saved_names else None
+
+    def _record_image_names(self, record):
+        """エントリーが参照している画像ファイル名のリスト"""
+        data = record['data']
+        return [name for field in IMAGE_FIELDS if isinstance(data.get(field), list) for name in data[field]]
+
+    @instrumented('gc_images')
+    @writes_records
+    def gc_images(self, grace_seconds=3600):
+        """
+        どのエントリー・下書きからも参照されていない画像とそのサムネイルを削除し、削除したファイル名を返す。
+        アップロード直後でまだ保存されていない画像を消さないよう、更新から grace_seconds 経ったものだけが対象。
+        ファイル名が内容のハッシュでない画像 (旧形式) は削除しない。
+        データを正常に読み込めていないときは、参照の一覧が不完全なので何もしない。
+        """
+        removed = []
+        if not self.records_loaded:
+            print("データを読み込めていないため、画像の削除を行いません")
+            return removed
+        deadline = time.time() - grace_seconds
+        for name in os.listdir(self.images_dir):
+            path = os.path.join(self.images_dir, name)
+            try:
+                if name.endswith(UPLOAD_TMP_SUFFIX):
+                    # 保存途中で中断されたアップロード
+                    if os.path.getmtime(path) < deadline:
+                        os.remove(path)
+                    continue
+                if not CAS_IMAGE_RE.match(name) or self._image_refs.get(name) or os.path.getmtime(path) >= deadline:
+                    continue
+                os.remove(path)
+                self._image_digests.pop(name, None)
+                digest = name[:64]
+                for size in THUMBNAIL_SIZES:
+                    thumb_path = self._thumbnail_path(digest, size)
+                    if os.path.exists(thumb_path):
+                        os.remove(thumb_path)
+                removed.append(name)
+            except OSError as e:
+                print(f"画像の削除に失敗しました: {name} ({e})")
+        return removed
 
     def get_image_path(self, filename):
         """ファイル名から完全パスを取得"""
@@ -107,31 +2491,94 @@ class ResearchDiaryCore:
             return os.path.join(self.images_dir, filename)
         return None
 
-    def load_image_as_base64(self, filename):
-        """画像ファイルをBase64として読み込み（HTML出力用）"""
+    def image_digest(self, filename):
+        """画像ファイルの内容のSHA-256 (ファイルが変わらない限り再計算しない)"""
+        if CAS_IMAGE_RE.match(filename):
+            # ファイル名が内容のハッシュなので読み込む必要はない
+            return filename[:64]
+        image_path = self.get_image_path(filename)
+        stat = os.stat(image_path)
+        cached = self._image_digests.get(filename)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        sha256 = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        self._image_digests[filename] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def _thumbnail_path(self, digest, size):
+        return os.path.join(self.thumbnails_dir, digest[:2], f"{digest}_{size}.jpg")
+
+    @instrumented('generate_thumbnails')
+    def generate_thumbnails(self, filename, sizes=THUMBNAIL_SIZES):
+        """画像のサムネイルを指定サイズ分まとめて生成 (既にあるものは作らない)"""
         try:
-            image_path = self.get_image_path(filename)
-            if image_path and os.path.exists(image_path):
-                with open(image_path, 'rb') as f:
-                    return base64.b64encode(f.read()).decode('utf-8')
+            digest = self.image_digest(filename)
+            missing = [s for s in sorted(sizes, reverse=True) if not os.path.exists(self._thumbnail_path(digest, s))]
+            if not missing:
+                return digest
+            os.makedirs(os.path.dirname(self._thumbnail_path(digest, missing[0])), exist_ok=True)
+            _load_imaging()
+            with Image.open(self.get_image_path(filename)) as img:
+                # JPEGは縮小しながらデコードできるので、最大サイズに合わせて読み込む
+                img.draft('RGB', (missing[0], missing[0]))
+                thumb = ImageOps.exif_transpose(img).convert('RGB')
+            # 大きいサイズから順に縮小し、前の結果を次の縮小元に使う
+            for size in missing:
+                thumb.thumbnail((size, size), Image.LANCZOS)
+                thumb_path = self._thumbnail_path(digest, size)
+                tmp_path = f"{thumb_path}.{uuid.uuid4().hex}.tmp"
+                thumb.save(tmp_path, format='JPEG', quality=85)
+                os.replace(tmp_path, thumb_path)
+                metrics.inc('research_record_image_bytes_total', os.path.getsize(thumb_path), stage='thumbnail')
+            return digest
         except Exception as e:
-            print(f"画像読み込みエラー: {e}")
-        return None
+            print(f"サムネイル生成エラー: {filename} ({e})")
+            metrics.inc('research_record_errors_total', operation='generate_thumbnails')
+            return None
+
+    def get_thumbnail(self, filename, size):
+        """
+        指定サイズ以上で最小のサムネイルの (パス, ETag) を返す。
+        まだなければその場で生成する。生成できなければNone。
+        """
+        size = next((s for s in THUMBNAIL_SIZES if s >= size), THUMBNAIL_SIZES[-1])
+        digest = self.generate_thumbnails(filename, sizes=[size])
+        if digest is None:
+            return None
+        return self._thumbnail_path(digest, size), f"{digest}-{size}"
 
     def generate_id(self, entry_type):
         """IDとタイムスタンプの生成"""
         timestamp = datetime.now().isoformat(timespec='seconds').replace(':', '-') # Avoid colon in filename for safety
-        return f"{entry_type}-{timestamp}"
-
-    def generate_hash(self, data):
-        """改ざん防止のためのハッシュ生成"""
-        temp_data = data.copy()
-        for key in ['today_completed_images', 'results_images', 'images', 'weekly_activity_images']:
-            if key in temp_data and isinstance(temp_data[key], list):
-                temp_data[key] = sorted(temp_data[key]) # Ensure consistent order for hashing
-        data_str = json.dumps(temp_data, sort_keys=True, ensure_ascii=False)
+        new_id = f"{entry_type}-{timestamp}"
+        # 同じ秒に作成されたIDとの衝突を避ける
+        suffix = 2
+        unique_id = new_id
+        while unique_id in self._index:
+            unique_id = f"{new_id}-{suffix}"
+            suffix += 1
+        return unique_id
+
+    @staticmethod
+    def generate_hash(data):
+        """
+        改ざん防止のためのハッシュ生成。
+        画像のファイル名は内容のSHA-256なので、画像を読み直さずに画像の内容もハッシュに含まれる。
+        """
+        data = LazyData.full(data)
+        # 画像の並び順によらないハッシュにする (画像がなければdataをコピーしない)
+        image_lists = {key: sorted(data[key]) for key in IMAGE_FIELDS if isinstance(data.get(key), list)}
+        if image_lists:
+            data = {**data, **image_lists}
+        data_str = json.dumps(data, sort_keys=True, ensure_ascii=False)
         return hashlib.sha256(data_str.encode('utf-8')).hexdigest()
 
+    @instrumented('add_entry')
+    @writes_records
     def add_entry(self, entry_data):
         """エントリーの追加（最終保存）"""
         entry = {
@@ -143,77 +2590,268 @@ class ResearchDiaryCore:
             'status': 'completed'
         }
         self.entries.append(entry)
+        self._index[entry['id']] = entry
+        self._on_record_changed(entry)
+        self.storage.save_record('entries', entry, self.entries)
+        self.ledger.append('put', entry['id'], self.record_digest(entry))
 
         # Corresponding draft should be removed if it exists
         if 'draft_id' in entry_data and entry_data['draft_id']:
-            self.drafts = [d for d in self.drafts if d['id'] != entry_data['draft_id']]
+            draft = self._index.get(entry_data['draft_id'])
+            if draft is not None and draft.get('status') == 'draft':
+                self._remove_record(draft)
+                self.storage.delete_record('drafts', draft['id'], self.drafts)
 
-        self.save_data()
+        self._after_entries_changed()
 
+    @instrumented('update_entry')
+    @writes_records
     def update_entry(self, entry_id, new_entry_data):
         """既存のエントリーを更新"""
-        for i, entry in enumerate(self.entries):
-            if entry['id'] == entry_id:
-                self.entries[i]['data'] = new_entry_data['data']
-                self.entries[i]['hash'] = self.generate_hash(new_entry_data['data'])
-                self.entries[i]['timestamp'] = datetime.now().isoformat()
-                self.save_data()
-                return True
-        # Check drafts if it's a draft being updated to completed
-        for i, draft in enumerate(self.drafts):
-            if draft['id'] == entry_id:
-                # Promote draft to completed entry
-                self.drafts.pop(i) # Remove from drafts
-                self.add_entry({'type': new_entry_data['type'], 'data': new_entry_data['data']})
-                return True
-        return False
+        record = self._index.get(entry_id)
+        if record is None:
+            return False
+        if record.get('status') == 'draft':
+            # Promote draft to completed entry (add_entry removes the draft)
+            self.add_entry({'type': new_entry_data['type'], 'data': new_entry_data['data'], 'draft_id': entry_id})
+            return True
+        record['data'] = new_entry_data['data']
+        record['hash'] = self.generate_hash(new_entry_data['data'])
+        record['timestamp'] = datetime.now().isoformat()
+        self._on_record_changed(record)
+        self.storage.save_record('entries', record, self.entries)
+        self.ledger.append('put', record['id'], self.record_digest(record))
+        self._after_entries_changed()
+        return True
 
 
+    @instrumented('save_draft')
+    @writes_records
     def save_draft(self, entry_data):
         """下書きの保存"""
         draft_id = entry_data.get('draft_id')
         if not draft_id:
             draft_id = self.generate_id(f"draft_{entry_data['type']}")
 
+        existing = self._index.get(draft_id)
+        if existing is not None and existing.get('status') != 'draft':
+            existing = None
         draft = {
             'id': draft_id,
             'type': entry_data['type'],
             'timestamp': datetime.now().isoformat(),
             'data': entry_data['data'],
-            'status': 'draft'
+            'status': 'draft',
+            'version': (existing.get('version', 0) if existing is not None else 0) + 1 # 自動保存の競合検出用
         }
 
-        for i, d in enumerate(self.drafts):
-            if d['id'] == draft_id:
-                self.drafts[i] = draft
-                break
+        if existing is not None:
+            # リスト内の位置を探さずに済むよう、既存の辞書をその場で書き換える
+            # (読み込み中の他のスレッドから空の辞書が見えないよう、clearせずに各キーを置き換える)
+            for key in existing.keys() - draft.keys():
+                del existing[key]
+            existing.update(draft)
+            draft = existing
         else:
             self.drafts.append(draft)
-        self.save_drafts()
+            self._index[draft_id] = draft
+        self._on_record_changed(draft)
+        self.storage.save_record('drafts', draft, self.drafts)
+        self._maybe_compact()
         return draft_id
 
+    @instrumented('patch_draft')
+    @writes_records
+    def patch_draft(self, draft_id, version, patch):
+        """
+        下書きの一部のフィールドだけを更新し、新しい版を返す (下書きがなければNone)。
+        patchは {フィールド: 値} で、値がNoneのフィールドは削除する。
+        versionが現在の版と違えば DraftConflict。ストレージへの書き込みはまとめて後で行う。
+        """
+        draft = self._index.get(draft_id)
+        if draft is None or draft.get('status') != 'draft':
+            return None
+        if version != draft.get('version', 0):
+            raise DraftConflict(dict(draft))
+        data = dict(draft['data'])
+        for key, value in patch.items():
+            if value is None:
+                data.pop(key, None)
+            else:
+                data[key] = value
+        draft['data'] = data # 辞書ごと差し替え、読み込み中のスレッドに書きかけのdataを見せない
+        draft['timestamp'] = datetime.now().isoformat()
+        draft['version'] = version + 1
+        self._on_record_changed(draft)
+        metrics.inc('research_record_draft_patches_total')
+        if self.process_lock is not None:
+            # 複数プロセスのときは他のプロセスが読み直せるようすぐに書き込む
+            self._persist_drafts([draft_id])
+        else:
+            self._draft_autosaver.mark(draft_id)
+        return draft['version']
+
+    @writes_records
+    def _persist_drafts(self, draft_ids):
+        """パッチを当てた下書きをストレージに書き込む (削除・完成済みになったものは飛ばす)"""
+        for draft_id in draft_ids:
+            draft = self._index.get(draft_id)
+            if draft is not None and draft.get('status') == 'draft':
+                self.storage.save_record('drafts', draft, self.drafts)
+                metrics.inc('research_record_draft_writes_total')
+        self._maybe_compact()
+
+    @instrumented('delete_entry')
+    @writes_records
     def delete_entry(self, entry_id):
         """エントリーを削除（完成、下書き両方から）"""
-        original_len_entries = len(self.entries)
-        self.entries = [entry for entry in self.entries if entry['id'] != entry_id]
-        original_len_drafts = len(self.drafts)
-        self.drafts = [draft for draft in self.drafts if draft['id'] != entry_id]
-
-        if len(self.entries) < original_len_entries or len(self.drafts) < original_len_drafts:
-            self.save_data()
-            self.save_drafts()
-            return True
-        return False
+        record = self._index.get(entry_id)
+        if record is None:
+            return False
+        self._remove_record(record)
+        if record.get('status') == 'draft':
+            self.storage.delete_record('drafts', entry_id, self.drafts)
+            self._maybe_compact()
+            self.save_html()
+        else:
+            self.storage.delete_record('entries', entry_id, self.entries)
+            self.ledger.append('delete', entry_id, None)
+            self._after_entries_changed()
+        return True
 
-    def get_entry_by_id(self, entry_id):
-        """IDに基づいてエントリーまたは下書きを取得"""
-        for entry in self.entries:
-            if entry['id'] == entry_id:
-                return entry
+    def _remove_record(self, record):
+        """エントリーまたは下書きをリストと索引から取り除く"""
+        records = self.drafts if record.get('status') == 'draft' else self.entries
+        for i in range(len(records) - 1, -1, -1):
+            if records[i] is record:
+                del records[i]
+                break
+        self._index.pop(record['id'], None)
+        self._on_record_removed(record)
+
+    def _rebuild_index(self):
+        """id -> レコードの索引を作り直す"""
+        self._index = {}
         for draft in self.drafts:
-            if draft['id'] == entry_id:
-                return draft
-        return None
+            self._index[draft['id']] = draft
+        for entry in self.entries: # 同じidがあれば完成エントリーを優先
+            self._index[entry['id']] = entry
+        self._rebuild_views()
+
+    def _rebuild_views(self):
+        """索引から一覧表示用のビューを作り直す"""
+        self._list_rows = {}
+        for record in self._index.values():
+            self._list_rows[record['id']] = self._make_list_row(record)
+        self._list_order = sorted(self._list_rows)
+        self._list_subsets = {}
+        for record_id in self._list_order:
+            row = self._list_rows[record_id]
+            for key in self._list_row_keys(row):
+                self._list_subsets.setdefault(key, []).append(record_id)
+        self._list_dates = sorted((row.date, row.id) for row in self._list_rows.values())
+        self._html_keys = {record['id']: (record['timestamp'], record['id']) for record in self._index.values()}
+        self._html_order = sorted(self._html_keys.values())
+        for stale_id in self._html_fragments.keys() - self._html_keys.keys():
+            del self._html_fragments[stale_id]
+        # 全文検索の索引・統計用の列は本文をすべて読むので、最初に使うまで作らない
+        self._search_index = None
+        self._stats_columns = None
+        self._data_version += 1
+        self._image_refs = {}
+        self._record_images = {}
+        for record in self._index.values():
+            self._track_image_refs(record)
+        # タイトルは一覧の行で作ったものを使う (画像カタログは完成エントリーだけなので「(下書き)」は付かない)
+        if self.storage.queries_records:
+            self._image_catalog = self.storage.image_catalog(self._list_title)
+        else:
+            self._image_catalog = ImageCatalog()
+            self._image_catalog.rebuild((entry, self._list_rows[entry['id']].title) for entry in self.entries)
+
+    def _track_image_refs(self, record):
+        """エントリーの画像参照を参照数に反映 (以前の参照は差し引く)"""
+        self._release_image_refs(record['id'])
+        names = self._record_image_names(record)
+        for name in names:
+            self._image_refs[name] = self._image_refs.get(name, 0) + 1
+        self._record_images[record['id']] = names
+
+    def _release_image_refs(self, record_id):
+        for name in self._record_images.pop(record_id, ()):
+            count = self._image_refs.get(name, 0) - 1
+            if count > 0:
+                self._image_refs[name] = count
+            else:
+                self._image_refs.pop(name, None)
+
+    def _on_record_changed(self, record):
+        """エントリーまたは下書きの追加・更新をビューに反映"""
+        old_row = self._list_rows.get(record['id'])
+        if old_row is None:
+            bisect.insort(self._list_order, record['id'])
+        else:
+            self._unindex_list_row(old_row)
+        row = self._list_rows[record['id']] = self._make_list_row(record)
+        self._index_list_row(row)
+        self._move_html_key(record['id'], (record['timestamp'], record['id']))
+        if self._search_index is not None:
+            self._search_index.add(record['id'], self._searchable_text(record))
+        if self._stats_columns is not None and record.get('status') != 'draft':
+            self._stats_columns.put(record)
+        self._data_version += 1
+        self._track_image_refs(record)
+        self._image_catalog.add(record, self._list_rows[record['id']].title)
+
+    def _on_record_removed(self, record):
+        """エントリーまたは下書きの削除をビューに反映"""
+        row = self._list_rows.pop(record['id'], None)
+        if row is not None:
+            _remove_sorted(self._list_order, record['id'])
+            self._unindex_list_row(row)
+        self._move_html_key(record['id'], None)
+        self._html_fragments.pop(record['id'], None)
+        if self._search_index is not None:
+            self._search_index.remove(record['id'])
+        if self._stats_columns is not None and record.get('status') != 'draft':
+            self._stats_columns.remove(record['id'])
+        self._data_version += 1
+        self._release_image_refs(record['id'])
+        self._image_catalog.remove(record['id'])
+
+    def _list_title(self, record_id):
+        row = self._list_rows.get(record_id)
+        return row.title if row is not None else None
+
+    def _list_row_keys(self, row):
+        """list_entries の絞り込みに使う部分一覧のキー (タグを引ける保存方式ではタグの部分一覧は持たない)"""
+        keys = [('type', row.type), ('status', row.status)]
+        if not self.storage.queries_records:
+            keys.extend(('tag', tag) for tag in set(row.tag_list))
+        return keys
+
+    def _index_list_row(self, row):
+        for key in self._list_row_keys(row):
+            bisect.insort(self._list_subsets.setdefault(key, []), row.id)
+        bisect.insort(self._list_dates, (row.date, row.id))
+
+    def _unindex_list_row(self, row):
+        for key in self._list_row_keys(row):
+            subset = self._list_subsets.get(key)
+            if subset is not None:
+                _remove_sorted(subset, row.id)
+                if not subset:
+                    del self._list_subsets[key]
+        _remove_sorted(self._list_dates, (row.date, row.id))
+
+    @reads_records
+    def get_entry_by_id(self, entry_id):
+        """
+        IDに基づいてエントリーまたは下書きを取得 (他のスレッドの更新の影響を受けないようコピーを返す)。
+        スナップショットから読み込んだ本文はコピーにだけ復元し、レコードには残さない。
+        """
+        record = self._index.get(entry_id)
+        return dict(record, data=LazyData.full(record['data'])) if record is not None else None
 
     def get_entry_title(self, entry):
         """エントリーのタイトルを取得"""
@@ -227,71 +2865,414 @@ class ResearchDiaryCore:
             return f"研究会報告 - {entry['data'].get('meeting_title', '無題')}"
         return "不明"
 
+    LIST_STATUS_LABELS = {'completed': '完成', 'draft': '下書き'}
+
+    def _make_list_row(self, record):
+        """一覧表示用の行を作成 (種類・タグは同じ文字列が多いのでinternして共有する)"""
+        is_draft = record.get('status') == 'draft'
+        tags = record['data'].get('tags', '')
+        return ListRow(
+            id=record['id'],
+            type=sys.intern(record['type']),
+            date=record_date(record),
+            title=self.get_entry_title(record) + (" (下書き)" if is_draft else ""),
+            tags=sys.intern(tags) if isinstance(tags, str) else tags,
+            tag_list=[sys.intern(tag) for tag in split_tags(tags)],
+            status=self.LIST_STATUS_LABELS['draft' if is_draft else 'completed']
+        )
+
+    @reads_records
     def get_all_entries_for_list(self):
         """表示用のエントリーと下書きの結合リストを返す"""
-        combined = []
-        for entry in self.entries:
-            combined.append({
-                'id': entry['id'],
-                'type': entry['type'],
-                'date': entry['timestamp'][:10],
-                'title': self.get_entry_title(entry),
-                'tags': entry['data'].get('tags', ''),
-                'status': '完成'
-            })
-        for draft in self.drafts:
-            combined.append({
-                'id': draft['id'],
-                'type': draft['type'],
-                'date': draft['timestamp'][:10],
-                'title': self.get_entry_title(draft) + " (下書き)",
-                'tags': draft['data'].get('tags', ''),
-                'status': '下書き'
-            })
-        combined.sort(key=lambda x: x['id'], reverse=True)
-        return combined
+        return [self._list_rows[entry_id] for entry_id in reversed(self._list_order)]
+
+    @instrumented('list_entries')
+    @reads_records
+    def list_entries(self, cursor=None, limit=50, entry_type=None, status=None, date_from=None, date_to=None, tag=None):
+        """
+        一覧表示用の行をIDの降順で1ページ分返す。
+        cursorには前のページの最後のIDを渡す。戻り値は (行のリスト, 次のページのcursor)。次のページがなければcursorはNone。
+        種類・状態・タグで絞り込むときはその値を持つ行だけの部分一覧を、日付で絞り込むときは日付順の一覧の範囲を使い、
+        最も小さいものをたどって残りの条件を確かめる。
+        """
+        status_label = self.LIST_STATUS_LABELS.get(status) if status else None
+        candidates = [self._list_order]
+        for key in (('type', entry_type), ('status', status_label), ('tag', tag)):
+            if key[1]:
+                candidates.append(self._list_subsets.get(key, []))
+        if tag and self.storage.queries_records:
+            candidates[-1] = self.storage.tagged_ids([tag])
+        if date_from or date_to:
+            start = bisect.bisect_left(self._list_dates, (date_from,)) if date_from else 0
+            # (日付, id) は (日付,) より大きいので、date_to の日の行は (date_to + 1文字,) より前に並ぶ
+            end = bisect.bisect_left(self._list_dates, (date_to + '\uffff',)) if date_to else len(self._list_dates)
+            if end - start < min(len(ids) for ids in candidates):
+                candidates.append(sorted(record_id for _, record_id in self._list_dates[start:end]))
+        ids = min(candidates, key=len)
+
+        pos = (bisect.bisect_left(ids, cursor) if cursor else len(ids)) - 1
+        rows = []
+        while pos >= 0 and len(rows) <= limit: # 次のページがあるかを知るため1行多く探す
+            row = self._list_rows.get(ids[pos])
+            pos -= 1
+            if row is None:
+                continue # 保存先の索引にだけある (他のプロセスが追加した) 行
+            if entry_type and row.type != entry_type:
+                continue
+            if status_label and row.status != status_label:
+                continue
+            if date_from and row.date < date_from:
+                continue
+            if date_to and row.date > date_to:
+                continue
+            if tag and tag not in row.tag_list:
+                continue
+            rows.append(row)
 
+        if len(rows) > limit:
+            return rows[:limit], rows[limit - 1].id
+        return rows, None
+
+    def _searchable_text(self, record):
+        """検索対象となる本文 (dataの文字列フィールド全て)"""
+        return "\n".join(value for value in LazyData.full(record['data']).values() if isinstance(value, str))
+
+    def _ensure_search_index(self):
+        """全文検索の索引を返す (まだなければ全エントリー・下書きから作る)。読み込みの区間で呼ぶ"""
+        search_index = self._search_index
+        if search_index is None:
+            with self._search_index_lock:
+                search_index = self._search_index
+                if search_index is None:
+                    with metrics.timer('research_record_operation_seconds', timing_name='search_index',
+                                       operation='build_search_index'):
+                        search_index = SearchIndex()
+                        for record in self._index.values():
+                            search_index.add(record['id'], self._searchable_text(record))
+                    self._search_index = search_index
+        return search_index
+
+    @instrumented('search')
+    @reads_records
+    def search(self, query, limit=50):
+        """全文検索。一覧表示用の行にスコアと抜粋を加えたものをスコア順で返す"""
+        search_index = self._ensure_search_index()
+        results = []
+        for doc_id, score in search_index.search(query, limit):
+            row = self._list_rows[doc_id].to_dict()
+            row['score'] = round(score, 3)
+            row['snippet'] = search_index.snippet(doc_id, query)
+            results.append(row)
+        return results
+
+    @reads_records
     def get_all_images_for_selection(self):
-        """画像選択用の全画像リストを返す"""
-        image_list = []
-        for entry in self.entries:
-            if entry['type'] == 'daily' and entry['data'].get('today_completed_images'):
-                for img_name in entry['data']['today_completed_images']:
-                    image_list.append({'filename': img_name, 'source_type': 'daily', 'source_field': 'today_completed_images'})
-            elif entry['type'] == 'experiment' and entry['data'].get('results_images'):
-                for img_name in entry['data']['results_images']:
-                    image_list.append({'filename': img_name, 'source_type': 'experiment', 'source_field': 'results_images'})
-        return image_list
+        """画像選択用の全画像リストを返す (新しい順)"""
+        return self._image_catalog.query(limit=None)[0]
 
+    @instrumented('query_images')
+    @reads_records
+    def query_images(self, text=None, entry_type=None, tag=None, date_from=None, date_to=None, offset=0, limit=50):
+        """画像選択用に画像カタログを絞り込み、(1ページ分の画像, 総数) を返す"""
+        return self._image_catalog.query(text=text, entry_type=entry_type, tag=tag, date_from=date_from,
+                                         date_to=date_to, offset=offset, limit=limit)
 
-    def save_data(self):
-        """完成エントリーをJSONに保存"""
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+    # 集計結果・グラフのキャッシュの件数
+    STATS_CACHE_SIZE = 16
+    STATS_CHARTS = ('entries', 'attendance', 'todo', 'tags')
+
+    @staticmethod
+    def _cache_put(cache, key, value, max_size):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+
+    @instrumented('stats')
+    @reads_records
+    def stats(self, date_from=None, date_to=None):
+        """
+        完成エントリーの統計 (種類・週ごとの件数、日報の出席日数・在室時間・勤務形態、タグの頻度、TODOの達成率)。
+        日付欄の date_from〜date_to ('YYYY-MM-DD') で絞り込む。結果はデータの版ごとにキャッシュする。
+        """
+        with self._stats_lock:
+            key = (self._data_version, date_from, date_to)
+            result = self._stats_cache.get(key)
+            if result is None:
+                if self._stats_columns is None:
+                    with metrics.timer('research_record_operation_seconds', timing_name='stats_columns',
+                                       operation='build_stats_columns'):
+                        columns = StatsColumns(max(len(self.entries), 1024))
+                        for entry in self.entries:
+                            columns.put(entry)
+                    self._stats_columns = columns
+                result = self._stats_columns.summarize(date_from, date_to)
+                result['version'] = self._data_version
+                self._cache_put(self._stats_cache, key, result, self.STATS_CACHE_SIZE)
+            return dict(result) # キャッシュした結果を呼び出し側に書き換えられないようにする
+
+    def render_stats_chart(self, name, date_from=None, date_to=None):
+        """統計のグラフ (STATS_CHARTS のいずれか) のPNGを (PNGのバイト列, ETag) で返す。データの版ごとにキャッシュする"""
+        if name not in self.STATS_CHARTS:
+            return None
+        stats = self.stats(date_from, date_to)
+        key = (stats['version'], name, date_from, date_to)
+        with self._stats_chart_lock:
+            cached = self._stats_charts.get(key)
+            if cached is None:
+                with metrics.timer('research_record_operation_seconds', timing_name='stats_chart',
+                                   operation='render_stats_chart'):
+                    png = self._draw_stats_chart(name, stats)
+                # 他のプロセスでは版の番号が別の内容を指すので、ETagはPNGの内容から作る
+                cached = (png, hashlib.sha256(png).hexdigest()[:32])
+                self._cache_put(self._stats_charts, key, cached, self.STATS_CACHE_SIZE)
+            return cached
+
+    def _draw_stats_chart(self, name, stats):
+        self.renderer.setup_fonts()
+        weekly = stats['weekly']
+        weeks = np.array([week['week'] for week in weekly], dtype='datetime64[D]')
+        fig, ax = plt.subplots(figsize=(9, 3.6))
+        if name == 'entries':
+            bottom = np.zeros(len(weekly))
+            for entry_type, label in zip(StatsColumns.TYPES, ('日報', '実験', '参加報告', '研究会報告')):
+                counts = np.array([week['entries'][entry_type] for week in weekly])
+                ax.bar(weeks, counts, width=6, bottom=bottom, label=label)
+                bottom += counts
+            ax.set_ylabel('件数 / 週')
+            ax.legend(loc='upper left')
+        elif name == 'attendance':
+            ax.bar(weeks, [week['attendance_hours'] for week in weekly], width=6, color='tab:green')
+            ax.set_ylabel('在室時間 / 週 (時間)')
+        elif name == 'todo':
+            rates = [week['todo_done'] / week['todo_total'] * 100 if week['todo_total'] else np.nan for week in weekly]
+            ax.plot(weeks, rates, marker='.', color='tab:orange')
+            ax.set_ylim(0, 105)
+            ax.set_ylabel('TODO達成率 (%)')
+        elif name == 'tags':
+            tags = stats['tags'][::-1]
+            ax.barh([tag for tag, _ in tags], [count for _, count in tags], color='tab:purple')
+            ax.set_xlabel('件数')
+        if name != 'tags':
+            fig.autofmt_xdate()
+        if not weekly:
+            ax.text(0.5, 0.5, 'データがありません', ha='center', va='center', transform=ax.transAxes)
+        fig.tight_layout()
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', dpi=100)
+        plt.close(fig)
+        return buf.getvalue()
+
+
+    def record_digest(self, record):
+        """台帳に記録するエントリーのダイジェスト (画像は保存済みの内容のハッシュを使う)"""
+        image_digests = {}
+        for name in self._record_image_names(record):
+            try:
+                image_digests[name] = self.image_digest(name)
+            except OSError:
+                image_digests[name] = None
+        return ledger_record_digest(record, image_digests)
+
+    def _sync_ledger(self, rehash_images=False):
+        """
+        台帳を現在の完成エントリーに合わせる (台帳に記録されていない追加・変更・削除を葉として追記する)。
+        rehash_images=True のときは画像のダイジェストをファイル名ではなく画像ファイルを読み直して求める。
+        """
+        recorded = self.ledger.current()
+        entries = sorted(self.entries, key=lambda e: e['timestamp'])
+        if rehash_images:
+            digests = {record_id: digest for record_id, digest, _ in _verify_records(self.images_dir, entries)}
+        else:
+            digests = {entry['id']: self.record_digest(entry) for entry in entries}
+        changes = []
+        for entry in entries:
+            digest = digests[entry['id']]
+            if recorded.pop(entry['id'], None) != digest:
+                changes.append(('put', entry['id'], digest))
+        changes.extend(('delete', record_id, None) for record_id in sorted(recorded))
+        if changes:
+            self.ledger.append_many(changes)
+        return changes
+
+    @writes_records
+    def sync_ledger(self):
+        """台帳と一致しないエントリーを現在の内容で記録し直し、記録した変更のリストを返す (verify で見つかった不一致を受け入れるとき)"""
+        return self._sync_ledger(rehash_images=True)
+
+    # これより多いときは verify をプロセスプールで並列に行う
+    VERIFY_PARALLEL_THRESHOLD = 500
+
+    def verify(self, workers=None):
+        """
+        ノート全体の改ざんを検査する。台帳の各行の根、各エントリーのhash、本文と画像ファイルから計算し直したダイジェストと
+        台帳の最新の葉を照合し、{'ok', 'size', 'root', 'entries', 'problems'} を返す。
+        画像の読み直しは件数が多いときプロセスプールで並列に行う。
+        """
+        with self._reading():
+            records = [dict(entry) for entry in self.entries]
+            expected = self.ledger.current()
+            size, root = self.ledger.size, self.ledger.root()
+        problems = self.ledger.check_log(size, root)
+
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and len(records) >= self.VERIFY_PARALLEL_THRESHOLD:
+            chunk_size = math.ceil(len(records) / (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                futures = [pool.submit(_verify_records, self.images_dir, records[i:i + chunk_size])
+                           for i in range(0, len(records), chunk_size)]
+                results = [result for future in futures for result in future.result()]
+        else:
+            results = _verify_records(self.images_dir, records)
+
+        for record_id, digest, hash_ok in results:
+            if not hash_ok:
+                problems.append(f"{record_id}: hashが本文と一致しません")
+            recorded = expected.pop(record_id, None)
+            if recorded is None:
+                problems.append(f"{record_id}: 台帳に記録されていません")
+            elif recorded != digest:
+                problems.append(f"{record_id}: 本文または画像が台帳の記録と一致しません")
+        problems.extend(f"{record_id}: 台帳に記録されたエントリーがありません" for record_id in sorted(expected))
+        return {'ok': not problems, 'size': size, 'root': root, 'entries': len(records), 'problems': problems}
+
+    def verify_entry(self, entry_id):
+        """
+        1件のエントリーを、他のエントリーを読み直さずに検査する。
+        台帳の包含証明を根に対して検証し、本文と画像から計算したダイジェストを証明の葉と照合する。
+        """
+        with self._reading():
+            record = self._index.get(entry_id)
+            record = dict(record) if record is not None and record.get('status') != 'draft' else None
+            proof = self.ledger.prove(entry_id)
+        problems = []
+        if record is None:
+            problems.append("完成エントリーがありません")
+        if proof is None:
+            problems.append("台帳に記録されていません")
+        elif not IntegrityLedger.verify_proof(proof):
+            problems.append("包含証明が台帳の根と一致しません")
+        elif proof['leaf']['op'] != 'put':
+            problems.append("台帳では削除されています")
+        if record is not None and proof is not None:
+            _, digest, hash_ok = _verify_records(self.images_dir, [record])[0]
+            if not hash_ok:
+                problems.append("hashが本文と一致しません")
+            if digest != proof['leaf']['digest']:
+                problems.append("本文または画像が台帳の記録と一致しません")
+        return {'ok': not problems, 'proof': proof, 'problems': problems}
+
+    def _move_html_key(self, record_id, key):
+        """HTMLアーカイブの並び順のキーを置き換える (Noneなら取り除く)"""
+        old_key = self._html_keys.pop(record_id, None)
+        if old_key == key:
+            if key is not None:
+                self._html_keys[record_id] = key
+            return
+        if old_key is not None:
+            pos = bisect.bisect_left(self._html_order, old_key)
+            if pos < len(self._html_order) and self._html_order[pos] == old_key:
+                del self._html_order[pos]
+        if key is not None:
+            bisect.insort(self._html_order, key)
+            self._html_keys[record_id] = key
+
+    def _maybe_compact(self):
+        """ストレージが必要とする場合にジャーナルをスナップショットへ畳み込む"""
+        if self.storage.needs_compaction():
+            with metrics.timer('research_record_operation_seconds', timing_name='compact', operation='compact'):
+                self.storage.compact(self.entries, self.drafts)
+
+    def _after_entries_changed(self):
+        """完成エントリーの変更後処理"""
+        self._maybe_compact()
         self.save_html() # Always generate HTML on data save
 
+    @instrumented('save_data')
+    @writes_records
+    def save_data(self):
+        """完成エントリーを全件保存"""
+        self.storage.save_all('entries', self.entries)
+        self._sync_ledger()
+        self._after_entries_changed()
+
+    @instrumented('save_drafts')
+    @writes_records
     def save_drafts(self):
-        """下書きをJSONに保存"""
-        with open(self.draft_file, 'w', encoding='utf-8') as f:
-            json.dump(self.drafts, f, ensure_ascii=False, indent=2)
+        """下書きを全件保存"""
+        self.storage.save_all('drafts', self.drafts)
+        self._maybe_compact()
+
+    def close(self):
+        """終了時の後処理 (ジャーナルの畳み込みと参照されていない画像の削除)。2回目以降の呼び出しは何もしない"""
+        if self.closed:
+            return
+        self.closed = True
+        self._image_executor.shutdown(wait=True)
+        self.export_jobs.shutdown()
+        self._draft_autosaver.close()
+        self._html_writer.close()
+        with self._writing():
+            self.gc_images()
+            if self.records_loaded:
+                self.storage.close(self.entries, self.drafts)
+            else:
+                self.storage.close() # 空の一覧でジャーナルを畳み込まない
+            self._storage_signature = None
+            self._write_snapshot()
+        if self.git_committer is not None:
+            self.git_committer.close()
+        if self.process_lock is not None:
+            self.process_lock.close()
+
+    def _write_snapshot(self):
+        """終了時に次の起動用のスナップショットを書き出す (ストレージを閉じた後に呼ぶ)"""
+        if self.snapshot is None or not self.records_loaded:
+            return
+        try:
+            with metrics.timer('research_record_operation_seconds', timing_name='write_snapshot',
+                               operation='write_snapshot'):
+                signature = self.storage.snapshot_signature()
+                if signature is None:
+                    # 読み込んだ後にファイルが変更された (git pullなど): 手元の内容は最新ではないので書き出さない
+                    self.snapshot.remove()
+                    return
+                self.snapshot.write(signature, self.entries, self.drafts)
+        except (OSError, ValueError) as e:
+            print(f"起動用スナップショットの書き出しに失敗しました: {str(e)}")
+            metrics.inc('research_record_errors_total', operation='write_snapshot')
+            self.snapshot.remove()
+
+    def _load_records(self):
+        """(entries, drafts) を、使えれば起動用スナップショットから、なければストレージから読み込む"""
+        if self.snapshot is not None:
+            loaded = self.snapshot.load(self.storage.snapshot_signature())
+            if loaded is not None:
+                self.storage.attach(*loaded)
+                return loaded
+        return self.storage.load()
 
+    @instrumented('load_data')
+    @writes_records
     def load_data(self):
-        """JSONからデータを読み込み"""
+        """ストレージからデータを読み込み"""
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    self.entries = json.load(f)
-            if os.path.exists(self.draft_file):
-                with open(self.draft_file, 'r', encoding='utf-8') as f:
-                    self.drafts = json.load(f)
+            self.entries, self.drafts = self._load_records()
+            self.records_loaded = True
         except Exception as e:
             print(f"データの読み込みに失敗しました: {str(e)}")
+            metrics.inc('research_record_errors_total', operation='load_data')
             self.entries = []
             self.drafts = []
+            self.records_loaded = False
+        self._rebuild_index()
+        self.ledger.unload()
+        if not self.ledger.has_records() and self.entries:
+            # 台帳を導入する前のデータ: 現在のエントリーを起点として記録する
+            self._sync_ledger()
+        self._storage_signature = self.storage.signature()
 
-    def save_html(self):
-        """HTMLファイルの保存"""
-        html_content = """
+    HTML_HEADER = """
         <!DOCTYPE html>
         <html lang="ja">
         <head>
@@ -317,11 +3298,145 @@ class ResearchDiaryCore:
             <h1>研究記録データ</h1>
         """
 
-        all_records = sorted(self.entries + self.drafts, key=lambda x: x['timestamp'], reverse=True)
+    HTML_FOOTER = """
+        </body>
+        </html>
+        """
+
+    def save_html(self):
+        """HTMLファイルの保存を予約する (書き込みは _html_writer のスレッドがまとめて行う)"""
+        self._html_writer.notify()
+
+    def flush_html(self):
+        """予約されているHTMLファイルの保存をすぐに行う"""
+        self._html_writer.flush()
+
+    @instrumented('save_html')
+    def _write_html(self):
+        """
+        HTMLファイルの保存 (変更のあったエントリーの断片のみ再生成)。
+        断片は読み込みロックの下で集め、ファイルへの書き込みはロックを離してから行うので保存の処理を待たせない。
+        並び順は変更のたびに更新してあるので並べ替えず、再起動後は前回のHTMLファイルから断片を読み込んで再利用する。
+        """
+        with self._reading():
+            if not self.incremental_html:
+                self._html_fragments.clear()
+            elif not self._html_index_loaded:
+                self._html_index_loaded = True
+                self._load_html_fragments()
+
+            header = self.HTML_HEADER.encode('utf-8')
+            fragments = []
+            index = []
+            offset = len(header)
+            for _, record_id in reversed(self._html_order):
+                fragment = self._get_html_fragment(self._index[record_id])
+                fragments.append(fragment)
+                index.append([record_id, list(self._html_fragments[record_id][0]), offset, len(fragment)])
+                offset += len(fragment)
+
+        tmp_path = f"{self.html_file}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(header)
+                f.writelines(fragments)
+                f.write(self.HTML_FOOTER.encode('utf-8'))
+                metrics.inc('research_record_bytes_written_total', f.tell(), target='html')
+            os.replace(tmp_path, self.html_file)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if self.incremental_html:
+            stat = os.stat(self.html_file)
+            _write_json_atomic(self.html_index_file, {'html': [stat.st_size, stat.st_mtime_ns], 'fragments': index},
+                               'html', indent=None, separators=(',', ':'))
+
+    def _load_html_fragments(self):
+        """html_index_file が今のHTMLファイルのものなら、その断片を fingerprint とともにキャッシュに入れる"""
+        try:
+            with open(self.html_index_file, 'r', encoding='utf-8') as f:
+                html_index = json.load(f)
+            stat = os.stat(self.html_file)
+            if html_index['html'] != [stat.st_size, stat.st_mtime_ns]:
+                return # HTMLファイルが別に書き換えられている
+            with open(self.html_file, 'rb') as f:
+                html = f.read()
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        for record_id, fingerprint, offset, length in html_index['fragments']:
+            if record_id in self._html_keys and record_id not in self._html_fragments:
+                self._html_fragments[record_id] = (tuple(fingerprint), html[offset:offset + length])
+
+    def _html_fingerprint(self, record):
+        """HTML断片の再生成が必要かを判定するためのキー"""
+        # 内容が変わると必ずtimestampが更新され、完成エントリーはhashも変わる
+        return (record['timestamp'], record.get('status'), record.get('hash'))
+
+    def _get_html_fragment(self, record):
+        """エントリー1件分のHTML断片を返す (キャッシュ済みなら再利用)"""
+        fingerprint = self._html_fingerprint(record)
+        cached = self._html_fragments.get(record['id'])
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+        fragment = self._render_html_fragment(record)
+        self._html_fragments[record['id']] = (fingerprint, fragment)
+        return fragment
+
+    def _render_html_fragment(self, record):
+        """
+        エントリー1件分のHTML断片を生成 (画像は research_data.html からの相対パスで参照する)。
+        全件をキャッシュするので、日本語混じりのstrより小さいUTF-8のバイト列で持つ。
+        """
+        return "".join(self._iter_record_html(record, self._linked_images_html('images'))).encode('utf-8')
+
+    @staticmethod
+    def _linked_images_html(image_dir, thumbnail_name=None):
+        """
+        画像を image_dir 内のファイルとして参照する images_html を返す。
+        thumbnail_name(filename) を渡すとサムネイルを表示し、元画像へリンクする。
+        """
+        def images_html(label, filenames):
+            if not filenames:
+                return
+            yield f'<div class="field"><span class="label">{label}:</span><div class="images">'
+            for filename in filenames:
+                href = f"{image_dir}/{urllib.parse.quote(filename)}"
+                if thumbnail_name is None:
+                    yield f'<img src="{href}" alt="{filename}" loading="lazy">'
+                else:
+                    thumb = thumbnail_name(filename)
+                    if thumb:
+                        yield f'<a href="{href}"><img src="{urllib.parse.quote(thumb)}" alt="{filename}" loading="lazy"></a>'
+            yield '</div></div>'
+        return images_html
+
+    def _inline_images_html(self, label, filenames):
+        """画像をBase64のdata URIで埋め込む images_html (ファイルは少しずつ読んで変換する)"""
+        if not filenames:
+            return
+        yield f'<div class="field"><span class="label">{label}:</span><div class="images">'
+        for filename in filenames:
+            image_path = self.get_image_path(filename)
+            try:
+                f = open(image_path, 'rb')
+            except OSError as e:
+                print(f"画像読み込みエラー: {e}")
+                continue
+            with f:
+                yield f'<img src="data:{mimetypes.guess_type(filename)[0] or "image/jpeg"};base64,'
+                # 3の倍数のバイト数ずつ変換すると、つなげても1つのBase64になる
+                for chunk in iter(lambda: f.read(3 * 256 * 1024), b''):
+                    yield base64.b64encode(chunk).decode('ascii')
+                yield f'" alt="{filename}">'
+        yield '</div></div>'
 
-        for record in all_records:
-            html_content += f"""
-            <div class="entry {'draft' if record.get('status') == 'draft' else ''}">
+    def _iter_record_html(self, record, images_html):
+        """
+        エントリー1件分のHTMLを少しずつ返す。
+        images_html(ラベル, ファイル名のリスト) は画像部分のHTMLを返すイテレータで、画像の埋め込み方を決める。
+        """
+        yield f"""
+            <div class="entry {'draft' if record.get('status') == 'draft' else ''}" id="{record['id']}">
                 <div class="entry-header">
                     <h2>{self.get_entry_title(record)} {'(下書き)' if record.get('status') == 'draft' else ''}</h2>
                     <p>ID: {record['id']}</p>
@@ -331,27 +3446,20 @@ class ResearchDiaryCore:
                 </div>
             """
 
-            if record['type'] == 'daily':
-                html_content += self._format_daily_html(record['data'])
-            elif record['type'] == 'experiment':
-                html_content += self._format_experiment_html(record['data'])
-            elif record['type'] == 'participation':
-                html_content += self._format_participation_html(record['data'])
-            elif record['type'] == 'research_meeting':
-                html_content += self._format_research_meeting_html(record['data'])
-
-            html_content += "</div>"
-
-        html_content += """
-        </body>
-        </html>
-        """
+        data = LazyData.full(record['data'])
+        if record['type'] == 'daily':
+            yield from self._format_daily_html(data, images_html)
+        elif record['type'] == 'experiment':
+            yield from self._format_experiment_html(data, images_html)
+        elif record['type'] == 'participation':
+            yield from self._format_participation_html(data, images_html)
+        elif record['type'] == 'research_meeting':
+            yield from self._format_research_meeting_html(data, images_html)
 
-        with open(self.html_file, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        yield "</div>"
 
-    def _format_daily_html(self, data):
-        html = f"""
+    def _format_daily_html(self, data, images_html):
+        yield f"""
         <div class="field"><span class="label">日付:</span> {data.get('date', '')}</div>
         <div class="field"><span class="label">勤務形態:</span> {data.get('work_type', '')}</div>
         <div class="field"><span class="label">来た時間:</span> {data.get('arrival_time', '')}</div>
@@ -361,22 +3469,15 @@ class ResearchDiaryCore:
         <div class="field"><span class="label">今日のTODO:</span> <pre>{data.get('today_todo', '')}</pre></div>
         <div class="field"><span class="label">今日できたこと:</span> <pre>{data.get('today_completed', '')}</pre></div>
         """
-        if data.get('today_completed_images'):
-            html += '<div class="field"><span class="label">今日できたこと（画像）:</span><div class="images">'
-            for filename in data['today_completed_images']:
-                base64_data = self.load_image_as_base64(filename)
-                if base64_data:
-                    html += f'<img src="data:image/jpeg;base64,{base64_data}" alt="{filename}">'
-            html += '</div></div>'
-        html += f"""
+        yield from images_html('今日できたこと（画像）', data.get('today_completed_images'))
+        yield f"""
         <div class="field"><span class="label">今日できなかったこととその理由:</span> <pre>{data.get('today_incomplete_reason', '')}</pre></div>
         <div class="field"><span class="label">明日のTODO:</span> <pre>{data.get('tomorrow_todo', '')}</pre></div>
         <div class="field"><span class="label">タグ:</span> <span class="tags">{data.get('tags', '')}</span></div>
         """
-        return html
 
-    def _format_experiment_html(self, data):
-        html = f"""
+    def _format_experiment_html(self, data, images_html):
+        yield f"""
         <div class="field"><span class="label">実験日:</span> {data.get('experiment_date', '')}</div>
         <div class="field"><span class="label">目的:</span> <pre>{data.get('purpose', '')}</pre></div>
         <div class="field"><span class="label">仮説:</span> <pre>{data.get('hypothesis', '')}</pre></div>
@@ -384,96 +3485,392 @@ class ResearchDiaryCore:
         <div class="field"><span class="label">評価方法:</span> <pre>{data.get('evaluation', '')}</pre></div>
         <div class="field"><span class="label">結果:</span> <pre>{data.get('results', '')}</pre></div>
         """
-        if data.get('results_images'):
-            html += '<div class="field"><span class="label">結果（画像）:</span><div class="images">'
-            for filename in data['results_images']:
-                base64_data = self.load_image_as_base64(filename)
-                if base64_data:
-                    html += f'<img src="data:image/jpeg;base64,{base64_data}" alt="{filename}">'
-            html += '</div></div>'
-        html += f"""
+        yield from images_html('結果（画像）', data.get('results_images'))
+        yield f"""
         <div class="field"><span class="label">評価:</span> <pre>{data.get('assessment', '')}</pre></div>
         <div class="field"><span class="label">考察:</span> <pre>{data.get('consideration', '')}</pre></div>
         <div class="field"><span class="label">コード:</span> <pre>{data.get('code', '')}</pre></div>
         <div class="field"><span class="label">Tips:</span> <pre>{data.get('tips', '')}</pre></div>
         <div class="field"><span class="label">タグ:</span> <span class="tags">{data.get('tags', '')}</span></div>
         """
-        return html
 
-    def _format_participation_html(self, data):
-        html = f"""
+    def _format_participation_html(self, data, images_html):
+        yield f"""
         <div class="field"><span class="label">内容:</span> <pre>{data.get('content', '')}</pre></div>
         """
-        if data.get('images'):
-            html += '<div class="field"><span class="label">画像:</span><div class="images">'
-            for filename in data['images']:
-                base64_data = self.load_image_as_base64(filename)
-                if base64_data:
-                    html += f'<img src="data:image/jpeg;base64,{base64_data}" alt="{filename}">'
-            html += '</div></div>'
-        html += f'<div class="field"><span class="label">タグ:</span> <span class="tags">{data.get("tags", "")}</span></div>'
-        return html
-
-    def _format_research_meeting_html(self, data):
-        html = f"""
+        yield from images_html('画像', data.get('images'))
+        yield f'<div class="field"><span class="label">タグ:</span> <span class="tags">{data.get("tags", "")}</span></div>'
+
+    def _format_research_meeting_html(self, data, images_html):
+        yield f"""
         <div class="field"><span class="label">研究会タイトル:</span> {data.get('meeting_title', '')}</div>
         <div class="field"><span class="label">現在の状況:</span> <pre>{data.get('current_status', '')}</pre></div>
         <div class="field"><span class="label">今週行ったこととそれに対する考え:</span> <pre>{data.get('weekly_activities_thoughts', '')}</pre></div>
         """
-        if data.get('weekly_activity_images'):
-            html += '<div class="field"><span class="label">今週行ったことの画像:</span><div class="images">'
-            for filename in data['weekly_activity_images']:
-                base64_data = self.load_image_as_base64(filename)
-                if base64_data:
-                    html += f'<img src="data:image/jpeg;base64,{base64_data}" alt="{filename}">'
-            html += '</div></div>'
-        html += f"""
+        yield from images_html('今週行ったことの画像', data.get('weekly_activity_images'))
+        yield f"""
         <div class="field"><span class="label">アドバイスがほしいこと:</span> <pre>{data.get('advice_needed', '')}</pre></div>
         <div class="field"><span class="label">来週取り組むこと:</span> <pre>{data.get('next_week_tasks', '')}</pre></div>
         <div class="field"><span class="label">タグ:</span> <span class="tags">{data.get('tags', '')}</span></div>
         """
-        return html
 
-    def _create_pdf_png_output(self, entry, output_filename, output_format):
-        """PDF/PNG出力の共通ロジック"""
+    # --- Static archive ---
+
+    # アーカイブの画像の扱い: 元画像をコピー / 長辺640pxのサムネイルを表示して元画像へリンク
+    ARCHIVE_IMAGE_MODES = ('original', 'thumbnail')
+    ARCHIVE_THUMBNAIL_SIZE = 640
+
+    @reads_records
+    def archive_records(self, include_drafts=False):
+        """アーカイブに書き出すエントリー (新しい順) のコピー"""
+        records = self.entries + self.drafts if include_drafts else self.entries
+        return sorted((dict(record) for record in records), key=lambda r: r['timestamp'], reverse=True)
+
+    def _archive_header(self, title, nav=''):
+        return self.HTML_HEADER.replace('<title>研究記録</title>', f'<title>{title}</title>').replace(
+            '<h1>研究記録データ</h1>', f'<h1>{title}</h1>{nav}')
+
+    def iter_archive_single_file(self, records):
+        """全エントリーを画像を埋め込んだ1つのHTMLとして少しずつ返す (メモリに載るのはエントリー1件分まで)"""
+        yield self.HTML_HEADER
+        for record in records:
+            yield from self._iter_record_html(record, self._inline_images_html)
+        yield self.HTML_FOOTER
+
+    def _write_chunks(self, path, chunks):
+        """HTMLを少しずつ一時ファイルに書き出してから置き換え、書き出したバイト数を返す"""
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
         try:
-            if self.font_path and os.path.exists(self.font_path):
-                font_prop = fm.FontProperties(fname=self.font_path)
-            else:
-                font_prop = fm.FontProperties(family='DejaVu Sans') # Fallback
-                print("警告: PDF/PNG出力用の日本語フォントパスが見つかりません。DejaVu Sansを使用します。")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                written = f.tell()
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        metrics.inc('research_record_bytes_written_total', written, target='archive')
+        return written
 
-            # A4サイズ設定 (縦横切り替え)
-            if entry['type'] in ['daily', 'research_meeting']:
-                fig, ax = plt.subplots(figsize=(11.69, 8.27)) # A4横
-            else:
-                fig, ax = plt.subplots(figsize=(8.27, 11.69)) # A4縦
-
-            if entry['type'] == 'daily':
-                self._format_daily_pdf(entry, ax, font_prop)
-            elif entry['type'] == 'experiment':
-                self._format_experiment_pdf(entry, ax, font_prop)
-            elif entry['type'] == 'participation':
-                self._format_participation_pdf(entry, ax, font_prop)
-            elif entry['type'] == 'research_meeting':
-                self._format_research_meeting_pdf(entry, ax, font_prop)
-
-            ax.axis('off')
-            plt.tight_layout()
-            plt.savefig(output_filename, format=output_format, bbox_inches='tight', dpi=300)
-            plt.close()
+    @instrumented('export_archive')
+    def export_archive(self, output_path, single_file=False, include_drafts=False, images='original'):
+        """
+        静的なHTMLアーカイブを書き出し、書き出したページ数を返す。
+        既定では output_path をディレクトリとして index.html と月ごとのページ (YYYY-MM.html) を作り、
+        画像は images/ (images='thumbnail' のときは thumbnails/ のサムネイルも) にコピーして相対パスで参照する。
+        single_file=True のときは output_path に画像を埋め込んだ1つのHTMLを書き出す。
+        """
+        records = self.archive_records(include_drafts)
+        if single_file:
+            self._write_chunks(output_path, self.iter_archive_single_file(records))
+            return 1
+        if images not in self.ARCHIVE_IMAGE_MODES:
+            raise ValueError(f"不明な画像の扱いです: {images}")
+
+        images_dir = os.path.join(output_path, 'images')
+        thumbs_dir = os.path.join(output_path, 'thumbnails')
+        os.makedirs(images_dir, exist_ok=True)
+        copied = set()
+
+        def copy_image(filename):
+            """元画像をアーカイブにコピーする (同じ内容が既にあれば飛ばす)"""
+            if filename in copied:
+                return True
+            source = self.get_image_path(filename)
+            target = os.path.join(images_dir, filename)
+            try:
+                if not (os.path.exists(target) and os.path.getsize(target) == os.path.getsize(source)):
+                    shutil.copyfile(source, target)
+            except OSError as e:
+                print(f"画像のコピーに失敗しました: {e}")
+                return False
+            copied.add(filename)
             return True
-        except Exception as e:
-            print(f"PDF/PNG作成エラー: {e}")
-            return False
+
+        def thumbnail_name(filename):
+            if not copy_image(filename):
+                return None
+            thumbnail = self.get_thumbnail(filename, self.ARCHIVE_THUMBNAIL_SIZE)
+            if thumbnail is None:
+                return f"images/{filename}"
+            name = os.path.basename(thumbnail[0])
+            target = os.path.join(thumbs_dir, name)
+            if not os.path.exists(target):
+                os.makedirs(thumbs_dir, exist_ok=True)
+                shutil.copyfile(thumbnail[0], target)
+            return f"thumbnails/{name}"
+
+        if images == 'original':
+            linked = self._linked_images_html('images')
+            def images_html(label, filenames):
+                return linked(label, [name for name in filenames or () if copy_image(name)])
+        else:
+            images_html = self._linked_images_html('images', thumbnail_name)
+
+        # 日付欄の月ごとにページを分ける (ページ内は作成日時の新しい順)
+        merged = {}
+        for record in records:
+            merged.setdefault(record_date(record)[:7], []).append(record)
+        month_names = sorted(merged, reverse=True)
+
+        def index_chunks():
+            yield self._archive_header('研究記録')
+            yield '<ul>'
+            for month in month_names:
+                yield f'<li><a href="{month}.html">{month}</a> ({len(merged[month])} 件)<ul>'
+                for record in merged[month]:
+                    yield f'<li><a href="{month}.html#{record["id"]}">{record_date(record)} {self.get_entry_title(record)}</a></li>'
+                yield '</ul></li>'
+            yield '</ul>'
+            yield self.HTML_FOOTER
+
+        def month_chunks(pos, month):
+            links = ['<a href="index.html">目次</a>']
+            if pos + 1 < len(month_names):
+                links.append(f'<a href="{month_names[pos + 1]}.html">&larr; {month_names[pos + 1]}</a>')
+            if pos > 0:
+                links.append(f'<a href="{month_names[pos - 1]}.html">{month_names[pos - 1]} &rarr;</a>')
+            nav = f'<p>{" | ".join(links)}</p>'
+            yield self._archive_header(f'研究記録 {month}', nav)
+            for record in merged[month]:
+                yield from self._iter_record_html(record, images_html)
+            yield nav
+            yield self.HTML_FOOTER
+
+        for pos, month in enumerate(month_names):
+            self._write_chunks(os.path.join(output_path, f"{month}.html"), month_chunks(pos, month))
+        self._write_chunks(os.path.join(output_path, 'index.html'), index_chunks())
+        return len(month_names) + 1
+
+    @reads_records
+    def select_entries_for_export(self, date_from=None, date_to=None, entry_type=None, tags=None):
+        """一括出力する完成エントリーを日付の古い順に返す (tagsはいずれかを含むもの)"""
+        tagged = set(self.storage.tagged_ids(tags)) if tags and self.storage.queries_records else None
+        selected = []
+        for entry in self.entries:
+            date = record_date(entry)
+            if date_from and date < date_from:
+                continue
+            if date_to and date > date_to:
+                continue
+            if entry_type and entry['type'] != entry_type:
+                continue
+            if tagged is not None:
+                if entry['id'] not in tagged:
+                    continue
+            elif tags and not set(tags) & set(split_tags(entry['data'].get('tags'))):
+                continue
+            selected.append(dict(entry))
+        selected.sort(key=lambda e: (record_date(e), e['id']))
+        return selected
+
+    def submit_bulk_export(self, entries, download_name):
+        """一括PDF出力ジョブを登録してジョブIDを返す"""
+        content_hash = hashlib.sha256("\n".join(
+            f"{e['id']}:{e.get('hash') or self.generate_hash(e['data'])}" for e in entries).encode('utf-8')).hexdigest()
+        return self.export_jobs.submit_bulk(entries, content_hash, download_name)
+
+    def submit_export(self, entry, output_format):
+        """エントリーのPDF/PNG出力ジョブを登録してジョブIDを返す"""
+        content_hash = entry.get('hash') or self.generate_hash(entry['data'])
+        return self.export_jobs.submit(entry, content_hash, output_format)
+
+    def export_download_name(self, entry, output_format):
+        """ダウンロード時のファイル名"""
+        return f"{self.get_entry_title(entry).replace(' ', '_').replace('/', '-')}.{output_format}"
 
     def export_to_pdf_logic(self, entry, filename):
         """単一エントリーのPDF出力ロジック"""
-        return self._create_pdf_png_output(entry, filename, 'pdf')
+        return self.renderer.create_output(entry, filename, 'pdf')
 
     def export_to_png_logic(self, entry, filename):
         """単一エントリーのPNG出力ロジック"""
-        return self._create_pdf_png_output(entry, filename, 'png')
+        return self.renderer.create_output(entry, filename, 'png')
+
+class ExportRenderer:
+    """
+    エントリーをPDF/PNGに描画する。フォントの設定と縮小済み画像のキャッシュを持ち、
+    データ・ストレージには触れないので、出力ジョブのワーカープロセスでは ResearchDiaryCore を作らずにこれだけを使う。
+    """
+
+    # PDF/PNG出力の解像度
+    EXPORT_DPI = 300
+
+    def __init__(self, script_dir, images_dir):
+        self.images_dir = images_dir
+        # フォントは初回のPDF/PNG出力時に設定する (解決結果は font_cache_file に保存)
+        self.font_path = None
+        self.fonts_ready = False
+        self.font_cache_file = os.path.join(script_dir, ".font_cache.json")
+        # PDF/PNG出力用の縮小済み画像のキャッシュ
+        self.image_cache = DecodedImageCache(
+            int(os.environ.get('RESEARCH_RECORD_EXPORT_IMAGE_CACHE_MB', '256')) * 1024 * 1024)
+
+    FONT_PATHS = [
+        "C:/Windows/Fonts/msgothic.ttc", "C:/Windows/Fonts/meiryo.ttc", "C:/Windows/Fonts/NotoSansCJK-Regular.ttc",
+        "/System/Library/Fonts/Hiragino Sans GB.ttc", "/Library/Fonts/Hiragino Sans GB.ttc", "/System/Library/Fonts/Arial Unicode MS.ttf",
+        "/usr/share/fonts/truetype/noto-cjk/NotoSansCJK-Regular.ttc", "/usr/share/fonts/truetype/takao-gothic/TakaoPGothic.ttf",
+        "/usr/share/fonts/truetype/vlgothic/VL-PGothic-Regular.ttf", "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+        "/usr/share/fonts/truetype/fonts-japanese-gothic.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+    ]
+
+    def _font_cache_key(self):
+        """
+        フォント解決結果のキャッシュが有効かを判定するキー
+        (matplotlibの版、候補フォントとmatplotlibのフォント一覧のキャッシュファイルの有無・更新時刻)
+        """
+        import matplotlib
+        fontlist_file = os.path.join(matplotlib.get_cachedir(), f"fontlist-v{fm.FontManager.__version__}.json")
+        candidates = []
+        for font_path in self.FONT_PATHS + [fontlist_file]:
+            try:
+                candidates.append(f"{font_path}:{os.stat(font_path).st_mtime_ns}")
+            except OSError:
+                candidates.append(f"{font_path}:-")
+        return hashlib.sha256("\n".join([matplotlib.__version__] + candidates).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _font_available(font):
+        """_resolve_font が返したフォントファイルのパスまたはフォント名が今も使えるか (Noneは見つからなかったことを表す)"""
+        if font is None:
+            return True
+        if os.path.isabs(font):
+            return os.path.exists(font)
+        return any(f.name == font for f in fm.fontManager.ttflist)
+
+    def _resolve_font(self):
+        """使う日本語フォントを探し、(フォントファイルのパスまたはフォント名, font.family) を返す"""
+        for font_path in self.FONT_PATHS:
+            if os.path.exists(font_path):
+                return font_path, fm.FontProperties(fname=font_path).get_name()
+
+        available_fonts = [f.name for f in fm.fontManager.ttflist]
+        japanese_fonts = [
+            'Noto Sans CJK JP', 'Noto Sans JP', 'Takao PGothic',
+            'VL PGothic', 'IPAexGothic', 'IPAGothic', 'Hiragino Sans GB',
+            'Meiryo', 'MS Gothic', 'Yu Gothic'
+        ]
+        for font in japanese_fonts:
+            if font in available_fonts:
+                return font, font # Store the found font name for textwrap
+        print("警告: 日本語フォントが見つかりませんでした。デフォルトフォントを使用します。")
+        return None, 'DejaVu Sans'
+
+    def setup_fonts(self):
+        """日本語フォントの設定 (matplotlib用、プロセスで最初に呼ばれたときだけ行う)"""
+        if self.fonts_ready:
+            return
+        _load_plotting()
+        try:
+            cache_key = self._font_cache_key()
+            cached = None
+            try:
+                with open(self.font_cache_file, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+            if cached and cached.get('key') == cache_key and self._font_available(cached['font_path']):
+                self.font_path, family = cached['font_path'], cached['family']
+            else:
+                self.font_path, family = self._resolve_font()
+                try:
+                    with open(self.font_cache_file, 'w', encoding='utf-8') as f:
+                        json.dump({'key': cache_key, 'font_path': self.font_path, 'family': family}, f, ensure_ascii=False)
+                except OSError as e:
+                    print(f"フォント設定のキャッシュを保存できませんでした: {e}")
+
+            if self.font_path and os.path.exists(self.font_path):
+                fm.fontManager.addfont(self.font_path) # Ensure font is added
+            plt.rcParams['font.family'] = family
+            plt.rcParams['axes.unicode_minus'] = False # Enable minus sign in Japanese fonts
+            print(f"matplotlib font set to: {plt.rcParams['font.family']}") # Debugging font setting
+
+        except Exception as e:
+            print(f"フォント設定エラー: {e}")
+            plt.rcParams['font.family'] = 'DejaVu Sans'
+            plt.rcParams['axes.unicode_minus'] = False
+        self.fonts_ready = True
+
+    def get_image_path(self, filename):
+        """ファイル名から完全パスを取得"""
+        if filename:
+            return os.path.join(self.images_dir, filename)
+        return None
+
+    def _export_font_properties(self):
+        """PDF/PNG出力用のフォント"""
+        self.setup_fonts()
+        if self.font_path and os.path.exists(self.font_path):
+            return fm.FontProperties(fname=self.font_path)
+        print("警告: PDF/PNG出力用の日本語フォントパスが見つかりません。DejaVu Sansを使用します。")
+        return fm.FontProperties(family='DejaVu Sans') # Fallback
+
+    def _open_export_image(self, img_path, ax, display_width):
+        """
+        PDF/PNG出力用に画像を読み込み、表示幅 (axesに対する割合) と出力DPIに見合う解像度まで
+        縮小したNumPy配列を返す。縮小済みの配列は出力をまたいでキャッシュする。
+        """
+        max_width = math.ceil(ax.figure.get_figwidth() * display_width * self.EXPORT_DPI)
+        return self.image_cache.get(img_path, max_width)
+
+    def _render_entry_figure(self, entry, font_prop):
+        """エントリー1件をA4の図として描画し、figureを返す"""
+        # A4サイズ設定 (縦横切り替え)
+        if entry['type'] in ['daily', 'research_meeting']:
+            fig, ax = plt.subplots(figsize=(11.69, 8.27)) # A4横
+        else:
+            fig, ax = plt.subplots(figsize=(8.27, 11.69)) # A4縦
+
+        if entry['type'] == 'daily':
+            self._format_daily_pdf(entry, ax, font_prop)
+        elif entry['type'] == 'experiment':
+            self._format_experiment_pdf(entry, ax, font_prop)
+        elif entry['type'] == 'participation':
+            self._format_participation_pdf(entry, ax, font_prop)
+        elif entry['type'] == 'research_meeting':
+            self._format_research_meeting_pdf(entry, ax, font_prop)
+
+        ax.axis('off')
+        fig.tight_layout()
+        return fig
+
+    @instrumented('render_export')
+    def create_output(self, entry, output_filename, output_format):
+        """PDF/PNG出力の共通ロジック"""
+        try:
+            fig = self._render_entry_figure(entry, self._export_font_properties())
+            fig.savefig(output_filename, format=output_format, bbox_inches='tight', dpi=self.EXPORT_DPI)
+            plt.close(fig)
+            return True
+        except Exception as e:
+            print(f"PDF/PNG作成エラー: {e}")
+            metrics.inc('research_record_errors_total', operation='render_export')
+            plt.close('all')
+            return False
+
+    @instrumented('export_bulk_pdf')
+    def export_bulk_pdf(self, entries, output_filename, progress=None):
+        """
+        複数エントリーを1つの複数ページPDFに出力する。
+        フォントと縮小済み画像のキャッシュは全ページで共有し、ページは1枚ずつ書き出して閉じる。
+        progress(完了数, 全体数) はページを書き出すたびに呼ばれる。
+        """
+        font_prop = self._export_font_properties()
+        try:
+            with PdfPages(output_filename) as pdf:
+                for done, entry in enumerate(entries, start=1):
+                    fig = self._render_entry_figure(entry, font_prop)
+                    pdf.savefig(fig, bbox_inches='tight', dpi=self.EXPORT_DPI)
+                    plt.close(fig)
+                    if progress:
+                        progress(done, len(entries))
+            return True
+        except Exception as e:
+            print(f"一括PDF作成エラー: {e}")
+            metrics.inc('research_record_errors_total', operation='export_bulk_pdf')
+            plt.close('all')
+            return False
 
     def _format_daily_pdf(self, entry, ax, font_prop):
         """日報のPDFフォーマット (共通)"""
@@ -511,10 +3908,10 @@ class ResearchDiaryCore:
                     img_path = self.get_image_path(filename)
                     if img_path and os.path.exists(img_path):
                         try:
-                            img = Image.open(img_path)
-                            img_width, img_height = img.size
-                            aspect_ratio = img_height / img_width
                             display_width = 0.2
+                            img = self._open_export_image(img_path, ax, display_width)
+                            img_height, img_width = img.shape[:2]
+                            aspect_ratio = img_height / img_width
                             display_height = display_width * aspect_ratio * (ax.get_xlim()[1] - ax.get_xlim()[0]) / (ax.get_ylim()[1] - ax.get_ylim()[0])
                             img_x = 0.05 + i * 0.25
                             img_y = y_pos - display_height - 0.01
@@ -560,10 +3957,10 @@ class ResearchDiaryCore:
                     img_path = self.get_image_path(filename)
                     if img_path and os.path.exists(img_path):
                         try:
-                            img = Image.open(img_path)
-                            img_width, img_height = img.size
-                            aspect_ratio = img_height / img_width
                             display_width = 0.2
+                            img = self._open_export_image(img_path, ax, display_width)
+                            img_height, img_width = img.shape[:2]
+                            aspect_ratio = img_height / img_width
                             display_height = display_width * aspect_ratio * (ax.get_xlim()[1] - ax.get_xlim()[0]) / (ax.get_ylim()[1] - ax.get_ylim()[0])
                             img_x = 0.05 + i * 0.25
                             img_y = y_pos - display_height - 0.01
@@ -603,10 +4000,10 @@ class ResearchDiaryCore:
                 img_path = self.get_image_path(filename)
                 if img_path and os.path.exists(img_path):
                     try:
-                        img = Image.open(img_path)
-                        img_width, img_height = img.size
-                        aspect_ratio = img_height / img_width
                         display_width = 0.2
+                        img = self._open_export_image(img_path, ax, display_width)
+                        img_height, img_width = img.shape[:2]
+                        aspect_ratio = img_height / img_width
                         display_height = display_width * aspect_ratio * (ax.get_xlim()[1] - ax.get_xlim()[0]) / (ax.get_ylim()[1] - ax.get_ylim()[0])
                         img_x = 0.05 + i * 0.25
                         img_y = y_pos - display_height - 0.01
@@ -661,10 +4058,10 @@ class ResearchDiaryCore:
                     img_path = self.get_image_path(filename)
                     if img_path and os.path.exists(img_path):
                         try:
-                            img = Image.open(img_path)
-                            img_width, img_height = img.size
-                            aspect_ratio = img_height / img_width
                             display_width = 0.25 # スライドの画像は少し大きめに
+                            img = self._open_export_image(img_path, ax, display_width)
+                            img_height, img_width = img.shape[:2]
+                            aspect_ratio = img_height / img_width
                             display_height = display_width * aspect_ratio * (ax.get_xlim()[1] - ax.get_xlim()[0]) / (ax.get_ylim()[1] - ax.get_ylim()[0])
                             
                             img_x = x_start + current_image_x_offset
@@ -688,20 +4085,369 @@ class ResearchDiaryCore:
             ax.text(x_start, 0.05, f"タグ: {data.get('tags', '')}", fontsize=10, transform=ax.transAxes, fontproperties=font_prop)
 
 
+# --- Export Jobs ---
+# エクスポート用ワーカープロセス内で使う描画 (データは読み込まない)
+_export_worker_renderer = None
+
+
+def _export_renderer(script_dir, images_dir):
+    global _export_worker_renderer
+    if _export_worker_renderer is None:
+        _export_worker_renderer = ExportRenderer(script_dir, images_dir)
+    return _export_worker_renderer
+
+
+def _render_export_job(script_dir, images_dir, entry, output_path, output_format):
+    """ワーカープロセスでエントリーをPDF/PNGに描画する (matplotlibの状態はプロセスごとに独立)"""
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    if not _export_renderer(script_dir, images_dir).create_output(entry, tmp_path, output_format):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise RuntimeError(f"{output_format.upper()}生成に失敗しました")
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def _render_bulk_export_job(script_dir, images_dir, entries, output_path, progress_path):
+    """ワーカープロセスで複数エントリーを1つのPDFに描画し、進捗をファイルに書き出す"""
+    def write_progress(done, total):
+        tmp_progress = f"{progress_path}.tmp"
+        with open(tmp_progress, 'w', encoding='utf-8') as f:
+            json.dump({'done': done, 'total': total}, f)
+        os.replace(tmp_progress, progress_path)
+
+    write_progress(0, len(entries))
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    if not _export_renderer(script_dir, images_dir).export_bulk_pdf(entries, tmp_path, progress=write_progress):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise RuntimeError("一括PDF生成に失敗しました")
+    os.replace(tmp_path, output_path)
+    os.remove(progress_path)
+    return output_path
+
+
+class ExportJobQueue:
+    """
+    PDF/PNG出力をプロセスプールで実行するジョブキュー。
+    出力はエントリーの内容のハッシュをキーにキャッシュし、変更のないエントリーは描画し直さない。
+    ジョブIDは出力ファイル名 (<キー>.<形式>) で、ジョブの状態は出力ファイルと横に置くファイル
+    (.job: ジョブの情報, .progress: 一括出力の進捗, .error: 失敗の理由) から求めるので、複数ワーカーのどれに問い合わせても同じになる。
+    キャッシュの合計が max_bytes を超えたら、最後に使ってから長いものから削除する。
+    """
+
+    # 描画内容を変えたら上げる (古いキャッシュを使わないため)
+    RENDER_VERSION = 1
+    # 完了しないまま情報だけが残っているジョブを中断されたとみなすまでの秒数
+    JOB_TTL = 3600
+    JOB_ID_RE = re.compile(r'^[0-9a-f]{64}\.(pdf|png)$')
+
+    def __init__(self, script_dir, images_dir, cache_dir, max_workers=None, max_bytes=512 * 1024 * 1024):
+        self.script_dir = script_dir
+        self.images_dir = images_dir
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or min(2, os.cpu_count() or 1)
+        self.max_bytes = max_bytes
+        self.futures = {} # このプロセスで描画中のジョブID -> Future
+        self.lock = threading.RLock() # 完了の通知は登録中のスレッドで呼ばれることがある
+        self.executor = None
+
+    def _get_executor(self):
+        if self.executor is None:
+            # fork時に他スレッドが持つロックを引き継がないようspawnで起動する
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return self.executor
+
+    def _job_id(self, key_text, output_format):
+        return f"{hashlib.sha256(key_text.encode('utf-8')).hexdigest()}.{output_format}"
+
+    def path(self, job_id):
+        """ジョブの出力ファイルのパス (不正なジョブIDならNone)"""
+        if not self.JOB_ID_RE.match(job_id):
+            return None
+        return os.path.join(self.cache_dir, job_id)
+
+    def cache_path(self, entry, content_hash, output_format):
+        return self.path(self._job_id(f"{self.RENDER_VERSION}:{entry['type']}:{content_hash}", output_format))
+
+    def submit(self, entry, content_hash, output_format):
+        """出力ジョブを登録してジョブIDを返す (キャッシュ済みなら完了済みのジョブになる)"""
+        job_id = self._job_id(f"{self.RENDER_VERSION}:{entry['type']}:{content_hash}", output_format)
+        info = {'entry_id': entry['id'], 'format': output_format, 'download_name': None, 'total': None}
+        return self._enqueue(job_id, info, _render_export_job, self.script_dir, self.images_dir, entry, self.path(job_id), output_format)
+
+    def submit_bulk(self, entries, content_hash, download_name):
+        """一括PDF出力ジョブを登録してジョブIDを返す"""
+        job_id = self._job_id(f"{self.RENDER_VERSION}:bulk:{content_hash}", 'pdf')
+        info = {'entry_id': None, 'format': 'pdf', 'download_name': download_name, 'total': len(entries)}
+        output_path = self.path(job_id)
+        return self._enqueue(job_id, info, _render_bulk_export_job, self.script_dir, self.images_dir, entries, output_path,
+                             f"{output_path}.progress")
+
+    def _enqueue(self, job_id, info, fn, *args):
+        output_path = self.path(job_id)
+        with self.lock:
+            self._expire_jobs()
+            os.makedirs(self.cache_dir, exist_ok=True)
+            _write_json_atomic(f"{output_path}.job", info, 'export_job')
+            try:
+                os.utime(output_path) # キャッシュ済み: 使った時刻を更新する (古いものから削除するため)
+            except OSError:
+                if job_id not in self.futures:
+                    # 同じ出力を描画中のジョブがなければ描画する (前回の失敗の記録は消す)
+                    self._remove_cached(f"{output_path}.error")
+                    future = self._get_executor().submit(fn, *args)
+                    future.add_done_callback(functools.partial(self._job_done, job_id, 'bulk' if info['entry_id'] is None
+                                                               else info['format'], time.perf_counter()))
+                    self.futures[job_id] = future
+            self._evict_cache(keep={job_id})
+        return job_id
+
+    def _job_done(self, job_id, kind, submitted, future):
+        error = None
+        if future.cancelled():
+            error = "ジョブが取り消されました"
+        elif future.exception() is not None:
+            error = str(future.exception()) or type(future.exception()).__name__
+        if error is not None:
+            # 他のワーカーからも失敗がわかるようにファイルに残す
+            try:
+                with open(f"{self.path(job_id)}.error", 'w', encoding='utf-8') as f:
+                    f.write(error)
+            except OSError as e:
+                print(f"出力ジョブの失敗を記録できませんでした: {e}")
+        else:
+            with self.lock: # 描画した出力の分、古いキャッシュを削除する
+                self._evict_cache(keep={job_id})
+        metrics.observe('research_record_export_job_seconds', time.perf_counter() - submitted, kind=kind)
+        metrics.inc('research_record_export_jobs_total', kind=kind, result='error' if error else 'done')
+
+    def _expire_jobs(self):
+        for job_id in [job_id for job_id, future in self.futures.items() if future.done()]:
+            del self.futures[job_id]
+
+    def job_info(self, job_id):
+        """ジョブの情報 {'entry_id', 'format', 'download_name', 'total'} (不明なジョブはNone)"""
+        path = self.path(job_id)
+        if path is None:
+            return None
+        try:
+            with open(f"{path}.job", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def progress(self, job_id, total):
+        """一括出力ジョブの進捗 {'done': 完了ページ数, 'total': 全ページ数}"""
+        try:
+            with open(f"{self.path(job_id)}.progress", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'done': 0, 'total': total}
+
+    def status(self, job_id):
+        """ジョブの状態を返す ('queued', 'running', 'done', 'error')。不明なジョブはNone"""
+        info = self.job_info(job_id)
+        if info is None:
+            return None
+        path = self.path(job_id)
+        error = None
+        future = self.futures.get(job_id)
+        if os.path.exists(path):
+            state = 'done'
+        elif os.path.exists(f"{path}.error"):
+            state = 'error'
+            try:
+                with open(f"{path}.error", 'r', encoding='utf-8') as f:
+                    error = f.read()
+            except OSError:
+                error = "出力に失敗しました"
+        elif future is not None and not future.done():
+            state = 'running' if future.running() else 'queued'
+        elif future is None and time.time() - os.path.getmtime(f"{path}.job") < self.JOB_TTL:
+            state = 'running' # 他のワーカーが描画中
+        else:
+            state, error = 'error', "出力が中断されました"
+        result = {'id': job_id, 'entry_id': info['entry_id'], 'format': info['format'], 'status': state, 'error': error}
+        if info['total'] is not None:
+            result['progress'] = ({'done': info['total'], 'total': info['total']} if state == 'done'
+                                  else self.progress(job_id, info['total']))
+        return result
+
+    def wait(self, job_id, timeout=None):
+        """ジョブの完了を待ち、出力ファイルのパスを返す (失敗時はNone)"""
+        future = self.futures.get(job_id)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except Exception as e:
+                print(f"PDF/PNG作成エラー: {e}")
+                return None
+        return self.result_path(job_id)
+
+    def result_path(self, job_id):
+        """完了したジョブの出力ファイルのパス"""
+        path = self.path(job_id)
+        if path is not None and os.path.exists(path):
+            return path
+        return None
+
+    def _evict_cache(self, keep=()):
+        """
+        キャッシュの合計が max_bytes 以下になるまで、最後に使ってから長い出力から削除する。
+        このプロセスで描画中のジョブと keep のジョブの出力は残す。削除した出力のジョブの情報も消す (状態は「不明」になる)。
+        JOB_TTL より古い一時ファイル・ジョブの情報は、中断されたジョブのものとして削除する。
+        """
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        deadline = time.time() - self.JOB_TTL
+        protected = set(keep) | set(self.futures)
+        files, total = [], 0
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if not self.JOB_ID_RE.match(name):
+                if stat.st_mtime < deadline:
+                    self._remove_cached(path)
+                continue
+            total += stat.st_size
+            if name not in protected:
+                files.append((stat.st_mtime, stat.st_size, path))
+        for mtime, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if self._remove_cached(path):
+                total -= size
+                metrics.inc('research_record_export_cache_evictions_total')
+                for suffix in ('.job', '.error', '.progress'):
+                    self._remove_cached(f"{path}{suffix}")
+
+    @staticmethod
+    def _remove_cached(path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            print(f"出力のキャッシュを削除できませんでした: {path} ({e})")
+            return False
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+
 # --- Flask App Setup ---
+class UploadRequest(Request):
+    """アップロードファイルを受信しながら画像ディレクトリへ書き出すリクエスト"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if filename:
+            return core_app.create_upload_file()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
 app = Flask(__name__)
+app.request_class = UploadRequest
+# 1リクエストあたりのアップロード上限
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('RESEARCH_RECORD_MAX_REQUEST_MB', '500')) * 1024 * 1024
+# レスポンスにServer-Timingヘッダー (処理ごとの所要時間) を付ける
+app.config['SERVER_TIMING'] = os.environ.get('RESEARCH_RECORD_SERVER_TIMING', '') not in ('', '0')
 # Get the directory of the current script (app.py)
 script_dir = os.path.dirname(os.path.abspath(__file__))
+# データ・画像の保存先 (既定はapp.pyと同じディレクトリ)
+data_dir = os.environ.get('RESEARCH_RECORD_DATA_DIR') or script_dir
 # Initialize our core logic, passing the script directory
-core_app = ResearchDiaryCore(script_dir)
+# エクスポート用のワーカープロセス (spawn) がこのモジュールを読み込んだときはアプリ本体を初期化しない
+if multiprocessing.parent_process() is None:
+    core_app = ResearchDiaryCore(data_dir)
+    atexit.register(core_app.close)
+
+# --- Instrumentation ---
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics.start_request()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    timings = metrics.finish_request()
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or 'unknown'
+    metrics.observe('research_record_http_request_seconds', elapsed, endpoint=endpoint, method=request.method)
+    metrics.inc('research_record_http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+    if response.status_code >= 500:
+        metrics.inc('research_record_errors_total', operation=f"http:{endpoint}")
+    if app.config['SERVER_TIMING']:
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+        entries.append(f"total;dur={elapsed * 1000:.1f}")
+        response.headers['Server-Timing'] = ", ".join(entries)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus形式のメトリクス"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # --- Routes ---
 
 @app.route('/')
 def index():
     """メイン画面: エントリーリストを表示"""
-    entries_for_display = core_app.get_all_entries_for_list()
-    return render_template('index.html', entries=entries_for_display)
+    filters = {key: request.args.get(key) or None for key in ['type', 'status', 'date_from', 'date_to', 'tag']}
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+    except ValueError:
+        limit = 50
+    entries_for_display, next_cursor = core_app.list_entries(
+        cursor=request.args.get('cursor') or None, limit=limit, entry_type=filters['type'], status=filters['status'],
+        date_from=filters['date_from'], date_to=filters['date_to'], tag=filters['tag'])
+    return render_template('index.html', entries=entries_for_display, filters=filters, limit=limit,
+                           next_cursor=next_cursor, is_first_page=not request.args.get('cursor'))
+
+@app.route('/search')
+def search():
+    """全文検索の結果を表示"""
+    query = request.args.get('q', '').strip()
+    results = core_app.search(query) if query else []
+    return render_template('search.html', query=query, results=results)
+
+def _stats_filters():
+    return {key: request.args.get(key) or None for key in ['date_from', 'date_to']}
+
+@app.route('/stats')
+def stats_dashboard():
+    """統計ダッシュボード (日付欄の期間で絞り込める)"""
+    filters = _stats_filters()
+    return render_template('stats.html', stats=core_app.stats(filters['date_from'], filters['date_to']), filters=filters)
+
+@app.route('/api/stats')
+def api_stats():
+    """統計 (ResearchDiaryCore.stats() の結果) をJSONで返す"""
+    filters = _stats_filters()
+    return jsonify(core_app.stats(filters['date_from'], filters['date_to']))
+
+@app.route('/stats/<name>.png')
+def stats_chart(name):
+    """統計ダッシュボードのグラフ (データが変わるまでキャッシュしたPNG)"""
+    filters = _stats_filters()
+    chart = core_app.render_stats_chart(name, filters['date_from'], filters['date_to'])
+    if chart is None:
+        return "グラフが見つかりません", 404
+    png, etag = chart
+    return send_file(io.BytesIO(png), mimetype='image/png', etag=etag, conditional=True, max_age=0)
 
 @app.route('/create/<entry_type>', methods=['GET', 'POST'])
 def create_entry(entry_type):
@@ -711,26 +4457,16 @@ def create_entry(entry_type):
     """
     current_data = {}
     draft_id = None
-    all_images_for_selection = []
-
-    if entry_type == 'research_meeting':
-        all_images_for_selection = core_app.get_all_images_for_selection()
 
     if request.method == 'POST':
         form_data = request.form.to_dict()
+        autosave_draft_id = form_data.pop('autosave_draft_id', None) or None
         images_to_save = {}
 
         # Handle image uploads for daily/experiment/participation
         if entry_type == 'daily':
             if 'today_completed_images_upload' in request.files:
-                uploaded_files = request.files.getlist('today_completed_images_upload')
-                saved_filenames = []
-                for file in uploaded_files:
-                    if file.filename != '':
-                        saved_name = core_app.save_image(file)
-                        if saved_name:
-                            saved_filenames.append(saved_name)
-                form_data['today_completed_images'] = saved_filenames
+                form_data['today_completed_images'] = core_app.save_images(request.files.getlist('today_completed_images_upload'))
 
             # Handle existing images passed from form (for drafts/edits)
             existing_images = request.form.getlist('today_completed_images_existing')
@@ -742,14 +4478,7 @@ def create_entry(entry_type):
 
         elif entry_type == 'experiment':
             if 'results_images_upload' in request.files:
-                uploaded_files = request.files.getlist('results_images_upload')
-                saved_filenames = []
-                for file in uploaded_files:
-                    if file.filename != '':
-                        saved_name = core_app.save_image(file)
-                        if saved_name:
-                            saved_filenames.append(saved_name)
-                form_data['results_images'] = saved_filenames
+                form_data['results_images'] = core_app.save_images(request.files.getlist('results_images_upload'))
 
             existing_images = request.form.getlist('results_images_existing')
             if existing_images:
@@ -760,14 +4489,7 @@ def create_entry(entry_type):
 
         elif entry_type == 'participation':
             if 'images_upload' in request.files:
-                uploaded_files = request.files.getlist('images_upload')
-                saved_filenames = []
-                for file in uploaded_files:
-                    if file.filename != '':
-                        saved_name = core_app.save_image(file)
-                        if saved_name:
-                            saved_filenames.append(saved_name)
-                form_data['images'] = saved_filenames
+                form_data['images'] = core_app.save_images(request.files.getlist('images_upload'))
 
             existing_images = request.form.getlist('images_existing')
             if existing_images:
@@ -784,10 +4506,11 @@ def create_entry(entry_type):
 
         # Determine if it's a save or a draft
         if 'save_button' in request.form:
-            core_app.add_entry({'type': entry_type, 'data': form_data})
+            # 自動保存で作られた下書きは完成した記録に置き換える
+            core_app.add_entry({'type': entry_type, 'data': form_data, 'draft_id': autosave_draft_id})
             return redirect(url_for('index'))
         elif 'draft_button' in request.form:
-            draft_id = core_app.save_draft({'type': entry_type, 'data': form_data})
+            draft_id = core_app.save_draft({'type': entry_type, 'data': form_data, 'draft_id': autosave_draft_id})
             return redirect(url_for('edit_entry', entry_id=draft_id)) # Redirect back to the draft for continuous editing
 
     # GET request or initial form display
@@ -800,7 +4523,6 @@ def create_entry(entry_type):
     return render_template(template_map.get(entry_type, 'index.html'),
                            data=current_data,
                            draft_id=draft_id,
-                           all_images_for_selection=json.dumps(all_images_for_selection), # Pass as JSON string
                            datetime=datetime)
 
 
@@ -816,48 +4538,27 @@ def edit_entry(entry_id):
     current_data = entry['data']
     entry_type = entry['type']
     is_draft = entry.get('status') == 'draft'
-    all_images_for_selection = []
-
-    if entry_type == 'research_meeting':
-        all_images_for_selection = core_app.get_all_images_for_selection()
 
     if request.method == 'POST':
         form_data = request.form.to_dict()
+        autosave_draft_id = form_data.pop('autosave_draft_id', None) or None
         
         # Handle image uploads/updates (similar to create_entry)
         if entry_type == 'daily':
             # Existing images from the form (already saved filenames)
             existing_images = request.form.getlist('today_completed_images_existing')
             # New uploads
-            uploaded_files = request.files.getlist('today_completed_images_upload')
-            saved_filenames = []
-            for file in uploaded_files:
-                if file.filename != '':
-                    saved_name = core_app.save_image(file)
-                    if saved_name:
-                        saved_filenames.append(saved_name)
+            saved_filenames = core_app.save_images(request.files.getlist('today_completed_images_upload'))
             form_data['today_completed_images'] = existing_images + saved_filenames
 
         elif entry_type == 'experiment':
             existing_images = request.form.getlist('results_images_existing')
-            uploaded_files = request.files.getlist('results_images_upload')
-            saved_filenames = []
-            for file in uploaded_files:
-                if file.filename != '':
-                    saved_name = core_app.save_image(file)
-                    if saved_name:
-                        saved_filenames.append(saved_name)
+            saved_filenames = core_app.save_images(request.files.getlist('results_images_upload'))
             form_data['results_images'] = existing_images + saved_filenames
 
         elif entry_type == 'participation':
             existing_images = request.form.getlist('images_existing')
-            uploaded_files = request.files.getlist('images_upload')
-            saved_filenames = []
-            for file in uploaded_files:
-                if file.filename != '':
-                    saved_name = core_app.save_image(file)
-                    if saved_name:
-                        saved_filenames.append(saved_name)
+            saved_filenames = core_app.save_images(request.files.getlist('images_upload'))
             form_data['images'] = existing_images + saved_filenames
 
         elif entry_type == 'research_meeting':
@@ -868,10 +4569,16 @@ def edit_entry(entry_id):
         if 'save_button' in request.form:
             # If it was a draft, promote to completed. If completed, just update.
             core_app.update_entry(entry_id, {'type': entry_type, 'data': form_data})
+            if autosave_draft_id and autosave_draft_id != entry_id:
+                # 完成済みの記録の編集中に自動保存された下書きは不要になる
+                autosave_draft = core_app.get_entry_by_id(autosave_draft_id)
+                if autosave_draft and autosave_draft.get('status') == 'draft':
+                    core_app.delete_entry(autosave_draft_id)
             return redirect(url_for('index'))
         elif 'draft_button' in request.form:
             # Update the existing draft or save as a new draft if it was a completed entry being edited
-            core_app.save_draft({'type': entry_type, 'data': form_data, 'draft_id': entry_id if is_draft else None})
+            core_app.save_draft({'type': entry_type, 'data': form_data,
+                                 'draft_id': entry_id if is_draft else autosave_draft_id})
             return redirect(url_for('edit_entry', entry_id=entry_id)) # Keep editing the same ID
     
     # GET request to display form with current data
@@ -885,10 +4592,121 @@ def edit_entry(entry_id):
                            data=current_data,
                            entry_id=entry_id, # Pass entry_id for edit mode
                            is_draft=is_draft,
-                           all_images_for_selection=json.dumps(all_images_for_selection), # Pass as JSON string
+                           draft_version=entry.get('version', 0),
                            datetime=datetime)
 
 
+# --- Image catalog API ---
+
+@app.route('/api/images')
+def api_images():
+    """
+    画像選択用の画像カタログ (新しい順)。
+    q (ファイル名・出典のタイトル・タグの部分一致), type, tag, date_from, date_to で絞り込み、offset/limit でページを指定する。
+    """
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', 60)), 1), 200)
+    except ValueError:
+        return jsonify({'error': '不正なリクエストです'}), 400
+    items, total = core_app.query_images(
+        text=request.args.get('q') or None, entry_type=request.args.get('type') or None,
+        tag=request.args.get('tag') or None, date_from=request.args.get('date_from') or None,
+        date_to=request.args.get('date_to') or None, offset=offset, limit=limit)
+    next_offset = offset + len(items)
+    return jsonify({
+        'items': [dict(item, thumbnail=url_for('serve_image', filename=item['filename'], size=THUMBNAIL_SIZES[0]))
+                  for item in items],
+        'total': total,
+        'offset': offset,
+        'next_offset': next_offset if next_offset < total else None,
+    })
+
+# --- Draft autosave API ---
+
+# 自動保存のJSONの最大サイズ (画像はフォームの送信で別に受け取る)
+DRAFT_PATCH_MAX_BYTES = 1024 * 1024
+# 自動保存で送られる画像のファイル名リストの欄 -> データのフィールド
+AUTOSAVE_LIST_FIELDS = {
+    'today_completed_images_existing': 'today_completed_images',
+    'results_images_existing': 'results_images',
+    'images_existing': 'images',
+    'weekly_activity_images_referenced': 'weekly_activity_images',
+}
+AUTOSAVE_IGNORED_FIELDS = {'draft_id', 'autosave_draft_id', 'save_button', 'draft_button'}
+ENTRY_TYPES = ('daily', 'experiment', 'participation', 'research_meeting')
+
+def _draft_patch_from_fields(fields):
+    """自動保存で送られたフォームの欄 {name: 値} をデータのパッチにする (不正ならNone)"""
+    if not isinstance(fields, dict):
+        return None
+    patch = {}
+    for name, value in fields.items():
+        if name in AUTOSAVE_IGNORED_FIELDS:
+            continue
+        if name in AUTOSAVE_LIST_FIELDS:
+            if value is not None and not (isinstance(value, list) and all(isinstance(v, str) for v in value)):
+                return None
+            patch[AUTOSAVE_LIST_FIELDS[name]] = value
+        elif value is None or isinstance(value, str):
+            patch[name] = value
+        else:
+            return None
+    return patch
+
+def _draft_json_request():
+    """自動保存のリクエストのJSONを返す (大きすぎる・JSONでなければNone)"""
+    if request.content_length is not None and request.content_length > DRAFT_PATCH_MAX_BYTES:
+        return None
+    payload = request.get_json(silent=True)
+    return payload if isinstance(payload, dict) else None
+
+@app.route('/api/drafts', methods=['POST'])
+def api_create_draft():
+    """自動保存の最初の送信: フォーム全体から下書きを作る"""
+    payload = _draft_json_request()
+    if payload is None or payload.get('type') not in ENTRY_TYPES:
+        return jsonify({'error': '不正なリクエストです'}), 400
+    patch = _draft_patch_from_fields(payload.get('fields'))
+    if patch is None:
+        return jsonify({'error': '不正なフィールドがあります'}), 400
+    data = {key: value for key, value in patch.items() if value is not None}
+    draft_id = core_app.save_draft({'type': payload['type'], 'data': data})
+    draft = core_app.get_entry_by_id(draft_id)
+    return jsonify({'draft_id': draft_id, 'version': draft.get('version', 0)}), 201
+
+@app.route('/api/drafts/<draft_id>', methods=['GET'])
+def api_get_draft(draft_id):
+    """下書きの内容と版"""
+    draft = core_app.get_entry_by_id(draft_id)
+    if not draft or draft.get('status') != 'draft':
+        return jsonify({'error': '下書きが見つかりません'}), 404
+    return jsonify({'draft_id': draft_id, 'type': draft['type'], 'version': draft.get('version', 0),
+                    'timestamp': draft['timestamp'], 'data': draft['data']})
+
+@app.route('/api/drafts/<draft_id>', methods=['PATCH'])
+def api_patch_draft(draft_id):
+    """
+    変更のあった欄だけを送る自動保存。{"version": 元にした版, "fields": {name: 値 (nullで削除)}}
+    版が古ければ 409 と現在の版・データを返すので、クライアントは版を合わせて送り直す。
+    """
+    payload = _draft_json_request()
+    version = payload.get('version') if payload is not None else None
+    if not isinstance(version, int) or isinstance(version, bool):
+        return jsonify({'error': '不正なリクエストです'}), 400
+    patch = _draft_patch_from_fields(payload.get('fields'))
+    if patch is None:
+        return jsonify({'error': '不正なフィールドがあります'}), 400
+    try:
+        new_version = core_app.patch_draft(draft_id, version, patch)
+    except DraftConflict as e:
+        return jsonify({'error': str(e), 'draft_id': draft_id, 'version': e.draft.get('version', 0),
+                        'data': e.draft['data']}), 409
+    if new_version is None:
+        return jsonify({'error': '下書きが見つかりません'}), 404
+    return jsonify({'draft_id': draft_id, 'version': new_version})
+
+
 @app.route('/view/<entry_id>')
 def view_entry(entry_id):
     """単一のエントリーを表示"""
@@ -905,40 +4723,284 @@ def delete_entry(entry_id):
         return redirect(url_for('index'))
     return "削除に失敗しました", 500
 
-@app.route('/export_pdf/<entry_id>')
-def export_pdf(entry_id):
-    """PDFをエクスポートしてダウンロード"""
+# 同期エクスポートで描画の完了を待つ最大秒数
+EXPORT_WAIT_TIMEOUT = 120
+
+def _export_now(entry_id, output_format):
+    """出力ジョブを登録して完了を待ち、ダウンロードさせる (キャッシュ済みなら即座に返る)"""
     entry = core_app.get_entry_by_id(entry_id)
     if not entry:
         return "エントリーが見つかりません", 404
+    job_id = core_app.submit_export(entry, output_format)
+    output_path = core_app.export_jobs.wait(job_id, timeout=EXPORT_WAIT_TIMEOUT)
+    if output_path:
+        return send_file(output_path, as_attachment=True, download_name=core_app.export_download_name(entry, output_format))
+    return f"{output_format.upper()}生成に失敗しました", 500
 
-    temp_dir = tempfile.gettempdir()
-    temp_pdf_path = os.path.join(temp_dir, f"{entry_id}.pdf")
-
-    if core_app.export_to_pdf_logic(entry, temp_pdf_path):
-        return send_file(temp_pdf_path, as_attachment=True, download_name=f"{core_app.get_entry_title(entry).replace(' ', '_').replace('/', '-')}.pdf")
-    return "PDF生成に失敗しました", 500
+@app.route('/export_pdf/<entry_id>')
+def export_pdf(entry_id):
+    """PDFをエクスポートしてダウンロード"""
+    return _export_now(entry_id, 'pdf')
 
 @app.route('/export_png/<entry_id>')
 def export_png(entry_id):
     """PNGをエクスポートしてダウンロード"""
+    return _export_now(entry_id, 'png')
+
+@app.route('/export/<entry_id>/<output_format>', methods=['POST'])
+def submit_export(entry_id, output_format):
+    """PDF/PNG出力ジョブを登録してジョブIDを返す"""
+    if output_format not in ('pdf', 'png'):
+        return jsonify({'error': '不明な出力形式です'}), 400
     entry = core_app.get_entry_by_id(entry_id)
     if not entry:
-        return "エントリーが見つかりません", 404
+        return jsonify({'error': 'エントリーが見つかりません'}), 404
+    job_id = core_app.submit_export(entry, output_format)
+    return jsonify({'job_id': job_id,
+                    'status_url': url_for('export_job_status', job_id=job_id),
+                    'download_url': url_for('export_job_download', job_id=job_id)}), 202
+
+@app.route('/export_bulk', methods=['GET', 'POST'])
+def export_bulk():
+    """条件に合う完成エントリーをまとめて1つのPDFに出力する (POSTでジョブを登録)"""
+    if request.method == 'GET':
+        return render_template('bulk_export.html')
+    params = request.get_json(silent=True) or request.form
+    date_from = params.get('date_from') or None
+    date_to = params.get('date_to') or None
+    entry_type = params.get('type') or None
+    tags = split_tags(params.get('tags'))
+    entries = core_app.select_entries_for_export(date_from, date_to, entry_type, tags)
+    if not entries:
+        return jsonify({'error': '条件に合うエントリーがありません'}), 404
+    download_name = f"研究記録_{date_from or '最初'}_{date_to or '最新'}.pdf"
+    job_id = core_app.submit_bulk_export(entries, download_name)
+    return jsonify({'job_id': job_id, 'total': len(entries),
+                    'status_url': url_for('export_job_status', job_id=job_id),
+                    'download_url': url_for('export_job_download', job_id=job_id)}), 202
+
+@app.route('/export_archive')
+def export_archive():
+    """画像を埋め込んだ1つのHTMLのアーカイブを、生成しながらダウンロードさせる"""
+    records = core_app.archive_records(include_drafts=request.args.get('drafts') == '1')
+    return Response(core_app.iter_archive_single_file(records), content_type='text/html; charset=utf-8',
+                    headers={'Content-Disposition': 'attachment; filename="research_archive.html"'})
 
-    temp_dir = tempfile.gettempdir()
-    temp_png_path = os.path.join(temp_dir, f"{entry_id}.png")
+@app.route('/export/jobs/<job_id>')
+def export_job_status(job_id):
+    """出力ジョブの状態"""
+    state = core_app.export_jobs.status(job_id)
+    if state is None:
+        return jsonify({'error': 'ジョブが見つかりません'}), 404
+    return jsonify(state)
 
-    if core_app.export_to_png_logic(entry, temp_png_path):
-        return send_file(temp_png_path, as_attachment=True, download_name=f"{core_app.get_entry_title(entry).replace(' ', '_').replace('/', '-')}.png")
-    return "PNG生成に失敗しました", 500
+@app.route('/export/jobs/<job_id>/download')
+def export_job_download(job_id):
+    """完了した出力ジョブの結果をダウンロード"""
+    info = core_app.export_jobs.job_info(job_id)
+    if info is None:
+        return "ジョブが見つかりません", 404
+    output_path = core_app.export_jobs.result_path(job_id)
+    if not output_path:
+        return f"ジョブは完了していません (状態: {core_app.export_jobs.status(job_id)['status']})", 409
+    entry = core_app.get_entry_by_id(info['entry_id']) if info['entry_id'] else None
+    download_name = info['download_name'] or (core_app.export_download_name(entry, info['format']) if entry else os.path.basename(output_path))
+    return send_file(output_path, as_attachment=True, download_name=download_name)
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    """アップロードサイズの上限超過"""
+    return f"アップロードできるサイズの上限を超えています: {e.description}", 413
+
+# 画像・サムネイルのブラウザキャッシュ期間 (秒)。ETagで再検証できる
+IMAGE_CACHE_MAX_AGE = 7 * 24 * 3600
 
 @app.route('/images/<filename>')
 def serve_image(filename):
-    """画像をWeb経由で提供するためのルート"""
-    return send_file(core_app.get_image_path(filename), mimetype='image/jpeg')
+    """画像をWeb経由で提供するためのルート (?size=160 などでサムネイル)"""
+    image_path = core_app.get_image_path(filename)
+    if not os.path.isfile(image_path):
+        return "画像が見つかりません", 404
+    size = request.args.get('size', type=int)
+    if size:
+        thumbnail = core_app.get_thumbnail(filename, size)
+        if thumbnail:
+            thumb_path, etag = thumbnail
+            return send_file(thumb_path, mimetype='image/jpeg', etag=etag, conditional=True, max_age=IMAGE_CACHE_MAX_AGE)
+    return send_file(image_path, mimetype=mimetypes.guess_type(filename)[0] or 'image/jpeg',
+                     conditional=True, max_age=IMAGE_CACHE_MAX_AGE)
 
-if __name__ == '__main__':
+# --- Serving ---
+class PooledWSGIServer(WSGIServer):
+    """
+    リクエストを固定数のスレッドで処理するwsgirefのサーバー (標準ライブラリだけで動く本番用サーバー)。
+    スレッドはfork後に最初のリクエストを受けたときに作る。
+    """
+
+    threads = 8
+    pool = None
+
+    def process_request(self, request, client_address):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='http')
+        self.pool.submit(self._handle_request, request, client_address)
+
+    def _handle_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True) # 処理中のリクエストを終えてから閉じる
+
+
+def _serve_until_signal(httpd):
+    """SIGTERM/SIGINTを受けるまでリクエストを処理し、処理中のリクエストと保存待ちの書き込みを終えてから戻る"""
+    def request_shutdown(signum, frame):
+        # serve_forever()と同じスレッドからshutdown()を呼ぶと終わらないので別スレッドで呼ぶ
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+        core_app.close()
+
+
+def serve_wsgiref(host, port, workers, threads):
+    """
+    標準ライブラリのサーバーで起動する。workers > 1 のときは待ち受けソケットを作ってからforkし、
+    読み込み済みのcore_appを各ワーカーに引き継ぐ (POSIXのみ。ワーカーごとの状態は serve() を参照)。
+    """
+    httpd = make_server(host, port, app, server_class=PooledWSGIServer)
+    httpd.threads = threads
+    if workers <= 1:
+        _serve_until_signal(httpd)
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                core_app.after_fork()
+                _serve_until_signal(httpd)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def stop_children(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop_children)
+    signal.signal(signal.SIGINT, stop_children)
+    for pid in children:
+        os.waitpid(pid, 0)
+    httpd.server_close()
+
+
+def serve_waitress(host, port, threads):
+    """waitress (マルチスレッド・1プロセス) で起動する"""
+    import waitress
+
+    server = waitress.create_server(app, host=host, port=port, threads=threads)
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        core_app.close()
+
+
+def serve_gunicorn(host, port, workers, threads):
+    """gunicornで起動する。アプリはマスタープロセスで読み込んでからワーカーをforkする (preload)"""
+    from gunicorn.app.base import BaseApplication
+
+    class ResearchRecordApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': f"{host}:{port}", 'workers': workers, 'threads': threads,
+                'preload_app': True, 'graceful_timeout': 30,
+                'post_fork': lambda server, worker: core_app.after_fork(),
+                'worker_exit': lambda server, worker: core_app.close(),
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    ResearchRecordApplication().run()
+
+
+def _module_available(name):
+    try:
+        __import__(name)
+        return True
+    except ImportError:
+        return False
+
+
+def serve(bind, workers=1, threads=8, server='auto'):
+    """
+    本番用のWSGIサーバーで起動する。
+    server='auto' のときは、複数ワーカーならgunicorn、1ワーカーならwaitressを使い、なければ標準ライブラリのサーバーを使う。
+
+    複数ワーカーのときは読み込み済みの core_app をforkで各ワーカーに引き継ぐが、その後の状態はワーカーごとに別になる。
+    - エントリー・下書きと一覧・検索・統計・画像一覧のビュー、HTMLの断片: プロセス間ロックで書き込みを1つずつ行い、
+      他のワーカーが保存していれば読み直す (このためプロセス間ロックを使えなければ起動しない)
+    - 下書きのパッチ: まとめずにすぐ書き込む (版の番号がワーカー間でずれないように)
+    - 出力ジョブ: 描画中のFutureはワーカーごとだが、状態は exports/ のファイルから求める
+    - フォント・縮小済み画像・統計グラフのキャッシュと /metrics の値: ワーカーごと
+    """
+    host, _, port = bind.rpartition(':')
+    host, port = host or '127.0.0.1', int(port)
+    if workers > 1 and not hasattr(os, 'fork'):
+        print("警告: このOSでは複数ワーカーで起動できません。1ワーカーで起動します。")
+        workers = 1
+    if workers > 1 and not core_app.enable_process_lock():
+        # ロックなしでは各ワーカーが古いデータに上書きし、下書きの版もずれる
+        raise SystemExit("エラー: 複数ワーカーで起動するにはプロセス間ロックが必要です。--workers 1 で起動してください。")
+    if server == 'auto':
+        if workers > 1:
+            server = 'gunicorn' if _module_available('gunicorn') else 'wsgiref'
+        else:
+            server = 'waitress' if _module_available('waitress') else 'wsgiref'
+    if server == 'waitress' and workers > 1:
+        print("警告: waitressは1プロセスで動作します。--workers は無視されます。")
+
+    # 読み込み済みのレコードとビューは終了まで残るので、GCの走査の対象から外す。
+    # ワーカーをforkする前に一度だけ行い (コピーオンライトのページを汚さない)、先に回収しておいたゴミは固定しない
+    gc.collect()
+    gc.freeze()
+    print(f"研究記録アプリを起動しました: http://{host}:{port} ({server}, workers={workers}, threads={threads})", flush=True)
+    if server == 'gunicorn':
+        serve_gunicorn(host, port, workers, threads)
+    elif server == 'waitress':
+        serve_waitress(host, port, threads)
+    else:
+        serve_wsgiref(host, port, workers, threads)
+
+
+def run_dev_server():
+    """開発用サーバーで起動し、ブラウザを開く"""
     host = os.environ.get('FLASK_RUN_HOST', 'localhost')
     port = os.environ.get('FLASK_RUN_PORT', '5000')
     if os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
@@ -949,4 +5011,74 @@ if __name__ == '__main__':
 
         threading.Timer(1, open_browser).start()
 
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
+
+
+def run_verify(entry_id=None, workers=None, expect_root=None, sync=False):
+    """台帳によるノートの検査を行って結果を出力し、終了コードを返す"""
+    if entry_id:
+        result = core_app.verify_entry(entry_id)
+        print(json.dumps(result['proof'], ensure_ascii=False, indent=2))
+    else:
+        started = time.perf_counter()
+        result = core_app.verify(workers=workers)
+        print(f"エントリー {result['entries']} 件を検査しました ({time.perf_counter() - started:.1f} 秒)")
+        print(f"台帳: {result['size']} 件  根のハッシュ: {result['root']}")
+    problems = list(result['problems'])
+    if expect_root:
+        size, _, root = expect_root.partition(':')
+        problems.extend(p for p in core_app.ledger.check_log(int(size), root) if p not in problems)
+    for problem in problems:
+        print(f"NG {problem}")
+    if not problems:
+        print("OK 改ざんは見つかりませんでした")
+    if sync and problems:
+        changes = core_app.sync_ledger()
+        print(f"台帳に {len(changes)} 件の変更を記録しました")
+    return 0 if not problems else 1
+
+
+def run_archive(output, single_file=False, include_drafts=False, images='original'):
+    """静的なHTMLアーカイブを書き出して結果を出力する"""
+    started = time.perf_counter()
+    pages = core_app.export_archive(output, single_file=single_file, include_drafts=include_drafts, images=images)
+    print(f"アーカイブを書き出しました: {output} ({pages} ページ, {time.perf_counter() - started:.1f} 秒)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="研究記録アプリ (引数なしで開発用サーバーを起動)")
+    subparsers = parser.add_subparsers(dest='command')
+    serve_parser = subparsers.add_parser('serve', help="本番用のWSGIサーバーで起動する")
+    serve_parser.add_argument('--bind', default=os.environ.get('RESEARCH_RECORD_BIND', '127.0.0.1:8000'),
+                              help="待ち受けるアドレス (host:port)")
+    serve_parser.add_argument('--workers', type=int, default=int(os.environ.get('RESEARCH_RECORD_WORKERS', '1')),
+                              help="ワーカープロセス数")
+    serve_parser.add_argument('--threads', type=int, default=int(os.environ.get('RESEARCH_RECORD_THREADS', '8')),
+                              help="ワーカーあたりのスレッド数")
+    serve_parser.add_argument('--server', choices=['auto', 'gunicorn', 'waitress', 'wsgiref'], default='auto',
+                              help="使うWSGIサーバー")
+    verify_parser = subparsers.add_parser('verify', help="台帳を使ってノートの改ざんを検査する")
+    verify_parser.add_argument('--entry', help="このエントリーだけを包含証明で検査し、証明を出力する")
+    verify_parser.add_argument('--workers', type=int, help="並列に検査するプロセス数 (既定: CPU数)")
+    verify_parser.add_argument('--expect-root', metavar='SIZE:ROOT', help="以前に控えた台帳の件数と根のハッシュと照合する")
+    verify_parser.add_argument('--sync', action='store_true', help="不一致があれば現在の内容を台帳に記録し直す")
+    archive_parser = subparsers.add_parser('archive', help="静的なHTMLアーカイブを書き出す")
+    archive_parser.add_argument('output', help="出力先のディレクトリ (--single-file のときはHTMLファイル)")
+    archive_parser.add_argument('--single-file', action='store_true', help="画像を埋め込んだ1つのHTMLにする")
+    archive_parser.add_argument('--drafts', action='store_true', help="下書きも含める")
+    archive_parser.add_argument('--images', choices=ResearchDiaryCore.ARCHIVE_IMAGE_MODES, default='original',
+                                help="画像の扱い (original: 元画像を表示, thumbnail: サムネイルを表示して元画像へリンク)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        serve(args.bind, args.workers, args.threads, args.server)
+    elif args.command == 'verify':
+        sys.exit(run_verify(args.entry, args.workers, args.expect_root, args.sync))
+    elif args.command == 'archive':
+        run_archive(args.output, args.single_file, args.drafts, args.images)
+    else:
+        run_dev_server()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+研究記録アプリのベンチマーク。
+合成した研究ノート (synthetic.py) を件数ごとに作り、主要な処理とルートの所要時間を計ってJSONに書き出す。
+
+    python benchmarks/run_benchmarks.py                          # 100 / 1k / 10k / 50k 件
+    python benchmarks/run_benchmarks.py --sizes 100,1000 --repeat 3
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<前回のコミット>.json
+
+結果は既定で benchmarks/results/<コミット>.json に保存される。
+同じ --seed なら同じデータで計測するので、コミット間で結果を比較できる。
+"""
+
+import argparse
+import atexit
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+# 結果ファイルの形式を変えたら上げる
+SCHEMA_VERSION = 1
+DEFAULT_SIZES = [100, 1000, 10000, 50000]
+
+
+def git_revision():
+    """(コミットID, 未コミットの変更があるか)"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def measure(fn, repeat, warmup=False):
+    """fnを repeat 回実行し、各回の所要時間 (秒) のリストを返す"""
+    if warmup:
+        fn()
+    gc.collect()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def summarize(size, name, durations):
+    return {
+        'size': size, 'name': name, 'repeat': len(durations),
+        'min_s': min(durations), 'median_s': statistics.median(durations),
+        'mean_s': statistics.fmean(durations), 'max_s': max(durations),
+    }
+
+
+def bench_size(app, synthetic, size, args, workdir):
+    """size件の研究ノートで各処理を計測し、結果のリストを返す"""
+    directory = os.path.join(workdir, f"notebook_{size}")
+    os.makedirs(directory)
+    results = []
+
+    start = time.perf_counter()
+    entries, _ = synthetic.build_notebook(directory, size, storage=args.storage, seed=args.seed)
+    results.append(summarize(size, 'generate', [time.perf_counter() - start]))
+
+    def startup():
+        core = app.ResearchDiaryCore(directory, storage=app.create_storage(args.storage, directory))
+        core.close()
+
+    results.append(summarize(size, 'startup', measure(startup, args.repeat)))
+
+    core = app.ResearchDiaryCore(directory, storage=app.create_storage(args.storage, directory))
+    app.core_app = core
+    client = app.app.test_client()
+    rng = random.Random(args.seed + 1)
+    sample_entry = entries[len(entries) // 2]
+
+    def new_data(entry_type):
+        return synthetic.make_data(entry_type, datetime.now(), rng, [], 0)
+
+    def save_html_full():
+        core.incremental_html = False
+        try:
+            save_html()
+        finally:
+            core.incremental_html = True
+
+    def save_html():
+        # 保存の処理は書き込みを予約するだけなので、バックグラウンドで行う書き込みをその場で行って計る
+        core.save_html()
+        core.flush_html()
+
+    def get(url):
+        def request():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url}: {response.status_code}")
+        return request
+
+    # (名前, 関数, 計測前に1回実行するか)
+    cases = [
+        ('list_entries', lambda: core.list_entries(limit=50), True),
+        ('get_all_entries_for_list', core.get_all_entries_for_list, True),
+        ('search', lambda: core.search('自己位置推定 実装'), True),
+        ('save_html_full', save_html_full, False),
+        ('save_html_incremental', save_html, True),
+        ('save_data', core.save_data, False),
+        ('add_entry', lambda: core.add_entry({'type': 'experiment', 'data': new_data('experiment')}), False),
+        ('update_entry', lambda: core.update_entry(sample_entry['id'], {'type': sample_entry['type'],
+                                                                        'data': new_data(sample_entry['type'])}), False),
+        ('save_draft', lambda: core.save_draft({'type': 'daily', 'data': new_data('daily')}), False),
+        ('route_index', get('/'), True),
+        ('route_search', get('/search?q=%E5%AE%9F%E9%A8%93'), True),
+        ('route_view', get(f"/view/{sample_entry['id']}"), True),
+    ]
+    if not args.skip_export:
+        output = os.path.join(workdir, 'export.pdf')
+        cases.append(('export_pdf', lambda: core.export_to_pdf_logic(sample_entry, output), True))
+
+    for name, fn, warmup in cases:
+        results.append(summarize(size, name, measure(fn, args.repeat, warmup=warmup)))
+        print(f"  {name:<28} {results[-1]['median_s'] * 1000:10.2f} ms", file=sys.stderr)
+
+    core.close()
+    shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def compare(baseline, current):
+    """2つの結果の中央値を比較する表を出力する"""
+    base = {(r['size'], r['name']): r for r in baseline['results']}
+    print(f"baseline: {baseline.get('commit')}  current: {current.get('commit')}")
+    print(f"{'size':>7}  {'name':<28} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    for result in current['results']:
+        before = base.get((result['size'], result['name']))
+        if before is None:
+            continue
+        ratio = result['median_s'] / before['median_s'] if before['median_s'] else float('inf')
+        print(f"{result['size']:>7}  {result['name']:<28} {before['median_s'] * 1000:12.2f} "
+              f"{result['median_s'] * 1000:12.2f} {ratio:7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="研究記録アプリのベンチマーク")
+    parser.add_argument('--sizes', default=",".join(map(str, DEFAULT_SIZES)), help="計測する件数 (カンマ区切り)")
+    parser.add_argument('--repeat', type=int, default=5, help="各処理の計測回数")
+    parser.add_argument('--seed', type=int, default=0, help="合成データのシード値")
+    parser.add_argument('--storage', default='journal', choices=['json', 'journal', 'sharded', 'sqlite'], help="保存方式")
+    parser.add_argument('--skip-export', action='store_true', help="PDF出力を計測しない")
+    parser.add_argument('--output', help="結果のJSONの保存先 (既定: benchmarks/results/<コミット>.json)")
+    parser.add_argument('--compare', metavar='BASELINE', help="比較する以前の結果のJSON")
+    parser.add_argument('--input', metavar='RESULT', help="計測せずにこの結果を --compare と比較する")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+    else:
+        workdir = tempfile.mkdtemp(prefix='research_record_bench_')
+        # アプリ本体の終了処理 (atexit) の後に消えるよう、appを読み込む前に登録する
+        atexit.register(shutil.rmtree, workdir, True)
+        # モジュール読み込み時に作られるアプリ本体のデータも作業ディレクトリに置く
+        os.environ['RESEARCH_RECORD_DATA_DIR'] = os.path.join(workdir, 'app')
+        os.makedirs(os.environ['RESEARCH_RECORD_DATA_DIR'])
+        import app
+        import synthetic
+
+        commit, dirty = git_revision()
+        report = {
+            'schema': SCHEMA_VERSION, 'commit': commit, 'dirty': dirty,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'storage': args.storage, 'seed': args.seed, 'repeat': args.repeat, 'results': [],
+        }
+        for size in [int(s) for s in args.sizes.split(',') if s.strip()]:
+            print(f"{size} 件", file=sys.stderr)
+            report['results'].extend(bench_size(app, synthetic, size, args, workdir))
+
+        output = args.output or os.path.join(BENCH_DIR, 'results', f"{(commit or 'unknown')[:12]}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+ベンチマーク用の合成研究ノートを生成する。
+4種類のエントリー (daily / experiment / participation / research_meeting) を、
+日本語の本文・タグ・生成した画像付きで作り、指定した保存方式で書き出す。
+同じシード値なら同じデータになる。
+"""
+
+import hashlib
+import io
+import os
+import random
+from datetime import datetime, timedelta
+
+ENTRY_TYPES = ['daily', 'experiment', 'participation', 'research_meeting']
+
+NAMES = ['椿', '佐藤', '鈴木', '高橋', '田中', '伊藤', '渡辺', '山本']
+# 日報フォームの勤務形態の選択肢 (来た時間・帰った時間は登校のときだけ入力される)
+WORK_TYPES = ['登校', '在宅', '休み']
+TAGS = ['ROS', '機械学習', 'ロボット', '論文', '実験', '画像処理', '制御', 'シミュレーション',
+        '発表', 'ゼミ', 'データ解析', 'センサ', '強化学習', 'Python', 'C++', '学会']
+TOPICS = ['把持計画', '自己位置推定', '物体認識', '軌道生成', '深層学習モデル', '触覚センサ',
+          '音声認識', '点群処理', '逆運動学', 'データセット', '実機実験', '評価指標']
+ACTIONS = ['を実装した', 'を調査した', 'の実験を行った', 'のパラメータを調整した', 'の結果をまとめた',
+           'の論文を読んだ', 'のバグを修正した', 'について先生と議論した', 'の発表資料を作成した']
+REASONS = ['時間が足りなかったため', '実機が使えなかったため', '想定外のエラーが出たため',
+           'データが揃わなかったため', '優先度の高いタスクが入ったため']
+CODE_LINES = ['import numpy as np', 'x = np.linspace(0, 1, 100)', 'for i in range(10):',
+              '    loss = model(x).mean()', 'print(loss)', 'rospy.init_node("bench")']
+
+
+def _sentence(rng):
+    return f"{rng.choice(TOPICS)}{rng.choice(ACTIONS)}。"
+
+
+def _paragraph(rng, min_sentences=1, max_sentences=6):
+    return "".join(_sentence(rng) for _ in range(rng.randint(min_sentences, max_sentences)))
+
+
+def _lines(rng, min_lines=1, max_lines=5):
+    return "\n".join(f"- {_sentence(rng)}" for _ in range(rng.randint(min_lines, max_lines)))
+
+
+def _tags(rng):
+    return ", ".join(rng.sample(TAGS, rng.randint(0, 4)))
+
+
+def make_images(images_dir, count, rng, size=(320, 240)):
+    """
+    画像ディレクトリに色付きの矩形を描いたPNGを生成し、ファイル名のリストを返す。
+    ファイル名はアプリと同じく内容のSHA-256。
+    """
+    from PIL import Image, ImageDraw
+
+    os.makedirs(images_dir, exist_ok=True)
+    names = []
+    for _ in range(count):
+        base = tuple(rng.randrange(256) for _ in range(3))
+        img = Image.new('RGB', size, base)
+        draw = ImageDraw.Draw(img)
+        for _ in range(8):
+            x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+            x1, y1 = x0 + rng.randrange(20, 120), y0 + rng.randrange(20, 90)
+            draw.rectangle([x0, y0, x1, y1], fill=tuple(rng.randrange(256) for _ in range(3)))
+        buf = io.BytesIO()
+        img.save(buf, format='PNG')
+        content = buf.getvalue()
+        name = f"{hashlib.sha256(content).hexdigest()}.png"
+        path = os.path.join(images_dir, name)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(content)
+        names.append(name)
+    return names
+
+
+def _pick_images(rng, image_names, probability):
+    if not image_names or rng.random() >= probability:
+        return []
+    return rng.sample(image_names, min(len(image_names), rng.randint(1, 3)))
+
+
+def make_data(entry_type, day, rng, image_names, image_probability):
+    """エントリー1件分のフォームデータ"""
+    date = day.strftime('%Y-%m-%d')
+    if entry_type == 'daily':
+        work_type = rng.choice(WORK_TYPES)
+        times = {}
+        if work_type == '登校':
+            times = {
+                'arrival_time': f"{rng.randint(8, 11):02d}:{rng.choice(['00', '15', '30', '45'])}",
+                'departure_time': f"{rng.randint(17, 22):02d}:{rng.choice(['00', '15', '30', '45'])}",
+            }
+        return {
+            'date': date, 'work_type': work_type, **times,
+            'name': rng.choice(NAMES), 'today_goal': _paragraph(rng, 1, 2), 'today_todo': _lines(rng),
+            'today_completed': _lines(rng), 'today_completed_images': _pick_images(rng, image_names, image_probability),
+            'today_incomplete_reason': f"{_sentence(rng)}{rng.choice(REASONS)}。", 'tomorrow_todo': _lines(rng),
+            'tags': _tags(rng),
+        }
+    if entry_type == 'experiment':
+        return {
+            'experiment_date': date, 'purpose': _paragraph(rng, 1, 2), 'hypothesis': _paragraph(rng, 1, 3),
+            'method': _lines(rng, 2, 6), 'evaluation': _paragraph(rng, 1, 2), 'results': _paragraph(rng, 2, 8),
+            'results_images': _pick_images(rng, image_names, image_probability),
+            'assessment': _paragraph(rng), 'consideration': _paragraph(rng, 2, 6),
+            'code': "\n".join(rng.sample(CODE_LINES, rng.randint(1, len(CODE_LINES)))), 'tips': _paragraph(rng, 0, 2),
+            'tags': _tags(rng),
+        }
+    if entry_type == 'participation':
+        return {
+            'content': f"{rng.choice(TOPICS)}に関する勉強会に参加した。{_paragraph(rng, 2, 8)}",
+            'images': _pick_images(rng, image_names, image_probability), 'tags': _tags(rng),
+        }
+    return {
+        'meeting_title': f"第{rng.randint(1, 40)}回 研究会 ({rng.choice(TOPICS)})",
+        'current_status': _paragraph(rng, 1, 4), 'weekly_activities_thoughts': _paragraph(rng, 2, 8),
+        'weekly_activity_images': _pick_images(rng, image_names, image_probability),
+        'advice_needed': _paragraph(rng, 1, 2), 'next_week_tasks': _lines(rng), 'tags': _tags(rng),
+    }
+
+
+def generate_records(count, image_names, hasher, seed=0, draft_ratio=0.05, image_probability=0.3,
+                     start=datetime(2020, 4, 1)):
+    """
+    (entries, drafts) を生成する。記録は start から数時間おきに時刻順に並ぶ。
+    レコードの形はアプリ本体の add_entry / save_draft と同じ (hasher はハッシュ生成関数)。
+    """
+    rng = random.Random(seed)
+    entries, drafts = [], []
+    moment = start
+    for _ in range(count):
+        moment += timedelta(minutes=rng.randint(30, 600))
+        entry_type = rng.choice(ENTRY_TYPES)
+        data = make_data(entry_type, moment, rng, image_names, image_probability)
+        stamp = moment.isoformat(timespec='seconds').replace(':', '-')
+        if rng.random() < draft_ratio:
+            drafts.append({'id': f"draft_{entry_type}-{stamp}", 'type': entry_type, 'timestamp': moment.isoformat(),
+                           'data': data, 'status': 'draft'})
+        else:
+            entries.append({'id': f"{entry_type}-{stamp}", 'type': entry_type, 'timestamp': moment.isoformat(),
+                            'data': data, 'hash': hasher(data), 'status': 'completed'})
+    return entries, drafts
+
+
+def build_notebook(directory, count, storage='journal', seed=0, image_count=40, image_probability=0.3):
+    """directory に count 件の研究ノート (データ・画像) を作成し、(entries, drafts) を返す"""
+    import app
+
+    rng = random.Random(seed)
+    image_names = make_images(os.path.join(directory, 'images'), image_count, rng)
+    entries, drafts = generate_records(count, image_names, app.ResearchDiaryCore.generate_hash, seed=seed,
+                                       image_probability=image_probability)
+    # 保存方式に直接書き込み、アプリ本体として開き直す (台帳の記録・スナップショットの書き出しは本体が行う)
+    writer = app.create_storage(storage, directory)
+    writer.save_all('entries', entries)
+    writer.save_all('drafts', drafts)
+    writer.close()
+    core = app.ResearchDiaryCore(directory, storage=app.create_storage(storage, directory))
+    core.close()
+    return entries, drafts
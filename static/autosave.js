@@ -0,0 +1,138 @@
+// --- Auto Save Logic (Common for all forms) ---
+// 入力が止まってから少し待ち、前回送った内容から変わった欄だけを /api/drafts にJSONで送る。
+// 最初の1回はフォーム全体で下書きを作り、以降は版 (version) を付けたパッチを送る。
+
+// 画像のファイル名を複数持つ欄 (配列として送る)
+const AUTOSAVE_LIST_FIELDS = [
+    'today_completed_images_existing',
+    'results_images_existing',
+    'images_existing',
+    'weekly_activity_images_referenced'
+];
+const AUTOSAVE_DELAY_MS = 1000;
+
+function initDraftAutosave(form, options) {
+    let draftId = options.draftId || null;
+    let version = options.version || 0;
+    let timer = null;
+    let inFlight = false;
+    let again = false;
+
+    // フォームの送信時に自動保存の下書きIDをサーバーに伝える
+    let draftIdInput = form.querySelector('input[name="autosave_draft_id"]');
+    if (!draftIdInput) {
+        draftIdInput = document.createElement('input');
+        draftIdInput.type = 'hidden';
+        draftIdInput.name = 'autosave_draft_id';
+        form.appendChild(draftIdInput);
+    }
+    draftIdInput.value = draftId || '';
+
+    function snapshot() {
+        const formData = new FormData(form);
+        const fields = {};
+        for (const [name, value] of formData.entries()) {
+            if (typeof value !== 'string' || name === 'draft_id' || name === 'autosave_draft_id') {
+                continue; // ファイルはフォームの送信で保存する
+            }
+            fields[name] = AUTOSAVE_LIST_FIELDS.includes(name) ? formData.getAll(name) : value;
+        }
+        return fields;
+    }
+
+    // 既存の下書きを編集するときは表示した内容を送信済みとみなす
+    let lastSent = draftId ? snapshot() : null;
+
+    function changedFields(current) {
+        const changes = {};
+        const names = new Set([...Object.keys(current), ...Object.keys(lastSent)]);
+        names.forEach(name => {
+            if (JSON.stringify(current[name]) !== JSON.stringify(lastSent[name])) {
+                changes[name] = name in current ? current[name] : null; // nullは欄の削除
+            }
+        });
+        return changes;
+    }
+
+    async function send(current, keepalive) {
+        if (!draftId) {
+            const response = await fetch(options.url, {
+                method: 'POST', keepalive: keepalive,
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({type: options.type, fields: current})
+            });
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.json();
+        }
+        const changes = changedFields(current);
+        if (Object.keys(changes).length === 0) {
+            return {draft_id: draftId, version: version};
+        }
+        const request = () => fetch(`${options.url}/${encodeURIComponent(draftId)}`, {
+            method: 'PATCH', keepalive: keepalive,
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({version: version, fields: changes})
+        });
+        let response = await request();
+        if (response.status === 409) {
+            // 他のタブなどで先に更新された: 変更した欄だけを最新の版に当て直す
+            version = (await response.json()).version;
+            console.warn('下書きが他で更新されていたため、変更した欄だけを上書きします。');
+            response = await request();
+        }
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        return response.json();
+    }
+
+    async function save(keepalive) {
+        clearTimeout(timer);
+        timer = null;
+        if (inFlight) {
+            again = true;
+            return;
+        }
+        inFlight = true;
+        const current = snapshot();
+        try {
+            const result = await send(current, keepalive);
+            draftId = result.draft_id;
+            version = result.version;
+            draftIdInput.value = draftId;
+            lastSent = current;
+            console.log('自動一時保存しました。');
+        } catch (error) {
+            console.error('自動一時保存エラー:', error);
+        } finally {
+            inFlight = false;
+            if (again) {
+                again = false;
+                scheduleAutoSave();
+            }
+        }
+    }
+
+    function scheduleAutoSave() {
+        clearTimeout(timer);
+        timer = setTimeout(() => save(false), AUTOSAVE_DELAY_MS);
+    }
+
+    // フォーム内の入力要素の変更を監視
+    form.addEventListener('input', scheduleAutoSave);
+    form.addEventListener('change', scheduleAutoSave);
+    // ボタンで送信するときは自動保存を止める (送信された内容が最新になる)
+    form.addEventListener('submit', () => {
+        clearTimeout(timer);
+        timer = null;
+    });
+    // タブを閉じる・切り替えるときは待たずに送る
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'hidden' && timer !== null) {
+            save(true);
+        }
+    });
+    return scheduleAutoSave;
+}
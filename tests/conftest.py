@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+# app.py は読み込み時にデータディレクトリのアプリ本体を作るので、リポジトリのデータを使わないよう一時ディレクトリにする
+os.environ['RESEARCH_RECORD_DATA_DIR'] = tempfile.mkdtemp(prefix='research_record_test_')
+
+import app as app_module  # noqa: E402
+
+
+@pytest.fixture
+def core(tmp_path):
+    """一時ディレクトリのデータを扱うアプリ本体"""
+    core = app_module.ResearchDiaryCore(str(tmp_path))
+    yield core
+    core.close()
+
+
+@pytest.fixture
+def client(core, monkeypatch):
+    """core を使うFlaskのテストクライアント"""
+    monkeypatch.setattr(app_module, 'core_app', core)
+    return app_module.app.test_client()
@@ -0,0 +1,41 @@
+def _create_draft(client):
+    response = client.post('/api/drafts', json={'type': 'participation', 'fields': {'content': '最初の内容'}})
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def test_patch_draft_advances_version(client):
+    created = _create_draft(client)
+    draft_id = created['draft_id']
+
+    response = client.patch(f'/api/drafts/{draft_id}',
+                            json={'version': created['version'], 'fields': {'content': '更新した内容'}})
+    assert response.status_code == 200
+    assert response.get_json()['version'] == created['version'] + 1
+
+    draft = client.get(f'/api/drafts/{draft_id}').get_json()
+    assert draft['data']['content'] == '更新した内容'
+    assert draft['version'] == created['version'] + 1
+
+
+def test_stale_patch_is_409(client):
+    created = _create_draft(client)
+    draft_id = created['draft_id']
+    client.patch(f'/api/drafts/{draft_id}', json={'version': created['version'], 'fields': {'content': '先に保存'}})
+
+    response = client.patch(f'/api/drafts/{draft_id}',
+                            json={'version': created['version'], 'fields': {'content': '古い版から保存'}})
+    assert response.status_code == 409
+    conflict = response.get_json()
+    assert conflict['version'] == created['version'] + 1
+    assert conflict['data']['content'] == '先に保存'
+
+    # 返された版で送り直せば保存できる
+    response = client.patch(f'/api/drafts/{draft_id}',
+                            json={'version': conflict['version'], 'fields': {'content': '古い版から保存'}})
+    assert response.status_code == 200
+
+
+def test_patch_missing_draft_is_404(client):
+    response = client.patch('/api/drafts/draft_participation-missing', json={'version': 1, 'fields': {}})
+    assert response.status_code == 404
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import app as app_module
+
+
+def _entry(entry_id='participation-1'):
+    return {'id': entry_id, 'type': 'participation', 'timestamp': '2024-05-01T10:00:00', 'status': 'completed',
+            'data': {'content': '参加報告', 'tags': '', 'images': []}}
+
+
+def _queue(tmp_path, monkeypatch, render):
+    """描画をスレッドで行うキュー (プロセスを起動しない)"""
+    monkeypatch.setattr(app_module, '_render_export_job', render)
+    queue = app_module.ExportJobQueue(str(tmp_path), str(tmp_path / 'images'), str(tmp_path / 'exports'))
+    queue.executor = ThreadPoolExecutor(max_workers=1)
+    return queue
+
+
+def _render(script_dir, images_dir, entry, output_path, output_format):
+    with open(output_path, 'wb') as f:
+        f.write(b'%PDF')
+
+
+def _fail(script_dir, images_dir, entry, output_path, output_format):
+    raise RuntimeError('フォントがありません')
+
+
+def test_other_worker_sees_finished_job(tmp_path, monkeypatch):
+    queue = _queue(tmp_path, monkeypatch, _render)
+    job_id = queue.submit(_entry(), '0' * 64, 'pdf')
+    assert queue.wait(job_id, timeout=10)
+    queue.shutdown()
+
+    # 別のワーカーのキューはファイルから状態を求める
+    other = app_module.ExportJobQueue(str(tmp_path), str(tmp_path / 'images'), str(tmp_path / 'exports'))
+    state = other.status(job_id)
+    assert state['status'] == 'done' and state['entry_id'] == 'participation-1'
+    assert other.result_path(job_id) == queue.path(job_id)
+
+
+def test_other_worker_sees_failed_job(tmp_path, monkeypatch):
+    queue = _queue(tmp_path, monkeypatch, _fail)
+    job_id = queue.submit(_entry(), '1' * 64, 'png')
+    assert queue.wait(job_id, timeout=10) is None
+    queue.shutdown()
+
+    other = app_module.ExportJobQueue(str(tmp_path), str(tmp_path / 'images'), str(tmp_path / 'exports'))
+    state = other.status(job_id)
+    assert state['status'] == 'error' and 'フォント' in state['error']
+    assert other.result_path(job_id) is None
+
+
+def test_unknown_job_is_404(client):
+    assert client.get('/export/jobs/' + 'f' * 64 + '.pdf').status_code == 404
+    assert client.get('/export/jobs/..%2F..%2Fapp.py').status_code == 404
+    assert client.get('/export/jobs/' + 'f' * 64 + '.pdf/download').status_code == 404
+
+
+def test_cache_is_evicted_down_to_budget(tmp_path, monkeypatch):
+    queue = _queue(tmp_path, monkeypatch, _render)
+    queue.max_bytes = 8 # 出力2つ分
+    job_ids = []
+    for i in range(4):
+        job_ids.append(queue.submit(_entry(f'participation-{i}'), f'{i:064x}', 'pdf'))
+        assert queue.wait(job_ids[-1], timeout=10)
+    # 使い直した出力は新しいものとして残る
+    assert queue.wait(queue.submit(_entry('participation-0'), f'{0:064x}', 'pdf'), timeout=10)
+    queue.shutdown()
+
+    assert [queue.result_path(job_id) is not None for job_id in job_ids] == [True, False, False, True]
+    assert queue.status(job_ids[1]) is None
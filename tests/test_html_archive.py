@@ -0,0 +1,36 @@
+import os
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_save_defers_html_until_flush(core):
+    core._html_writer.delay = 60 # スレッドには書かせない
+    core.add_entry({'type': 'participation', 'data': {'content': '最初の報告', 'tags': ''}})
+    assert not os.path.exists(core.html_file)
+
+    core.flush_html()
+    assert '最初の報告' in _read(core.html_file)
+
+
+def test_fragments_are_reused_and_updated(core):
+    core._html_writer.delay = 60
+    core.add_entry({'type': 'participation', 'data': {'content': '一件目', 'tags': ''}})
+    core.add_entry({'type': 'participation', 'data': {'content': '二件目', 'tags': ''}})
+    core.flush_html()
+    entry_id = next(entry['id'] for entry in core.entries if entry['data']['content'] == '一件目')
+    core.update_entry(entry_id, {'type': 'participation', 'data': {'content': '書き換えた一件目', 'tags': ''}})
+    core.flush_html()
+
+    html = _read(core.html_file)
+    assert '書き換えた一件目' in html and '二件目' in html
+    assert '参加報告 - 一件目' not in html
+
+
+def test_close_writes_pending_html(core):
+    core._html_writer.delay = 60
+    core.add_entry({'type': 'participation', 'data': {'content': '終了前の報告', 'tags': ''}})
+    core.close()
+    assert '終了前の報告' in _read(core.html_file)
@@ -0,0 +1,53 @@
+import app as app_module
+
+
+def _entry(entry_id, date, images, tags=''):
+    return {'id': entry_id, 'type': 'participation', 'timestamp': f'{date}T12:00:00', 'status': 'completed',
+            'data': {'date': date, 'images': images, 'tags': tags}}
+
+
+def _catalog(count=25):
+    catalog = app_module.ImageCatalog()
+    catalog.rebuild((_entry(f'p{i:02d}', f'2024-05-{i + 1:02d}', [f'{i:02d}a.png', f'{i:02d}b.png'],
+                            tags='ROS' if i % 2 else ''), f'タイトル{i}') for i in range(count))
+    return catalog
+
+
+def test_pages_are_newest_first_and_complete():
+    catalog = _catalog()
+    seen = []
+    offset = 0
+    while True:
+        items, total = catalog.query(offset=offset, limit=20)
+        assert total == 50
+        if not items:
+            break
+        seen.extend(item['filename'] for item in items)
+        offset += len(items)
+    assert len(seen) == 50 and len(set(seen)) == 50
+    assert seen[:2] == ['24a.png', '24b.png']
+    assert seen[-1] == '00b.png'
+
+
+def test_query_filters_and_updates():
+    catalog = _catalog()
+    items, total = catalog.query(tag='ROS', limit=5)
+    assert total == 24
+    assert all('ROS' in item['tags'] for item in items)
+    assert catalog.query(date_from='2024-05-20', date_to='2024-05-21', limit=None)[1] == 4
+    assert catalog.query(text='07a', limit=None)[0][0]['entry_id'] == 'p07'
+
+    catalog.add(_entry('p07', '2024-06-30', ['new.png']), 'タイトル7')
+    items, total = catalog.query(limit=1)
+    assert total == 49
+    assert items[0]['filename'] == 'new.png'
+
+    catalog.remove('p07')
+    assert catalog.query(limit=None)[1] == 48
+    assert catalog.query(text='new.png', limit=None)[1] == 0
+
+
+def test_drafts_are_not_cataloged():
+    catalog = app_module.ImageCatalog()
+    catalog.add(dict(_entry('draft_p', '2024-05-01', ['draft.png']), status='draft'), '下書き')
+    assert catalog.query()[1] == 0
@@ -0,0 +1,31 @@
+import io
+
+from PIL import Image
+
+
+def _png_bytes(color=(200, 40, 40), size=(64, 48)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def test_uploaded_image_is_served(core, client):
+    response = client.post('/create/participation', data={
+        'content': '画像付きの参加報告', 'tags': '', 'save_button': '1',
+        'images_upload': (io.BytesIO(_png_bytes()), 'photo.png'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+    filename = core.entries[0]['data']['images'][0]
+
+    response = client.get(f'/images/{filename}')
+    assert response.status_code == 200
+    assert response.data == _png_bytes()
+    assert response.cache_control.max_age > 0
+
+    thumbnail = client.get(f'/images/{filename}?size=160')
+    assert thumbnail.status_code == 200
+    assert thumbnail.mimetype == 'image/jpeg'
+
+
+def test_missing_image_is_404(client):
+    assert client.get('/images/' + '0' * 64 + '.png').status_code == 404
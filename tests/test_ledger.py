@@ -0,0 +1,63 @@
+import json
+
+import app as app_module
+
+
+def _ledger(tmp_path, count=7):
+    ledger = app_module.IntegrityLedger(str(tmp_path / 'ledger.jsonl'))
+    for i in range(count):
+        ledger.append('put', f'entry-{i}', f'{i:064x}')
+    return ledger
+
+
+def test_proof_round_trip(tmp_path):
+    ledger = _ledger(tmp_path)
+    for i in range(7):
+        proof = ledger.prove(f'entry-{i}')
+        assert proof['root'] == ledger.root()
+        assert app_module.IntegrityLedger.verify_proof(proof)
+    assert ledger.prove('missing') is None
+
+    # 台帳ファイルから読み直しても同じ木になる
+    reloaded = app_module.IntegrityLedger(ledger.ledger_file)
+    assert reloaded.root() == ledger.root()
+    assert reloaded.prove('entry-3') == ledger.prove('entry-3')
+    assert reloaded.check_log(ledger.size, ledger.root()) == []
+
+
+def test_tampered_proof_is_rejected(tmp_path):
+    ledger = _ledger(tmp_path)
+    proof = ledger.prove('entry-4')
+
+    tampered_leaf = dict(proof, leaf=dict(proof['leaf'], digest='f' * 64))
+    assert not app_module.IntegrityLedger.verify_proof(tampered_leaf)
+    tampered_path = dict(proof, path=['00' * 32] + proof['path'][1:])
+    assert not app_module.IntegrityLedger.verify_proof(tampered_path)
+    assert not app_module.IntegrityLedger.verify_proof(dict(proof, index=proof['size']))
+
+
+def test_tampered_ledger_file_is_detected(tmp_path):
+    ledger = _ledger(tmp_path)
+    size, root = ledger.size, ledger.root()
+    with open(ledger.ledger_file, encoding='utf-8') as f:
+        lines = f.readlines()
+    leaf = json.loads(lines[2])
+    leaf['digest'] = 'f' * 64
+    lines[2] = json.dumps(leaf, ensure_ascii=False) + "\n"
+    with open(ledger.ledger_file, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+
+    problems = ledger.check_log(size, root)
+    assert any('3行目' in problem for problem in problems)
+    assert any(str(size) in problem for problem in problems)
+
+
+def test_core_verify_detects_edited_entry(core):
+    core.add_entry({'type': 'participation', 'data': {'content': '元の内容', 'tags': ''}})
+    entry_id = core.entries[0]['id']
+    assert core.verify(workers=1)['ok']
+    assert core.verify_entry(entry_id)['ok']
+
+    core.entries[0]['data'] = {'content': '書き換えた内容', 'tags': ''}
+    assert not core.verify(workers=1)['ok']
+    assert not core.verify_entry(entry_id)['ok']
@@ -0,0 +1,68 @@
+import app as app_module
+
+
+def _add(core, content, tags='', date=None):
+    data = {'content': content, 'tags': tags}
+    if date:
+        data['date'] = date
+    core.add_entry({'type': 'participation', 'data': data})
+    return max(core._index, key=lambda record_id: core._index[record_id]['timestamp'])
+
+
+def _pages(core, limit, **filters):
+    ids, cursor = [], None
+    while True:
+        rows, cursor = core.list_entries(cursor=cursor, limit=limit, **filters)
+        ids.extend(row.id for row in rows)
+        if cursor is None:
+            return ids
+        assert rows # cursorを返すのは次のページに行があるときだけ
+
+
+def _records(core, count=7):
+    for i in range(count):
+        _add(core, f'報告{i}', tags='ROS' if i % 2 else '', date=f'2024-05-{i + 1:02d}')
+    core.save_draft({'type': 'daily', 'data': {'date': '2024-05-03', 'name': '下書き'}})
+
+
+def test_pages_cover_filtered_rows_once(core):
+    _records(core)
+    all_ids = sorted(core._list_rows, reverse=True)
+    assert _pages(core, 3) == all_ids
+    assert _pages(core, 8) == all_ids # ちょうど1ページに収まるときは次のcursorを返さない
+    assert core.list_entries(limit=8)[1] is None
+
+    tagged = _pages(core, 2, tag='ROS')
+    assert tagged == [row_id for row_id in all_ids if 'ROS' in core._list_rows[row_id].tag_list]
+    assert len(tagged) == 3
+    assert _pages(core, 2, status='draft') == [row_id for row_id in all_ids if row_id.startswith('draft_')]
+    assert _pages(core, 2, entry_type='daily', status='completed') == []
+
+
+def test_date_filter_uses_record_date(core):
+    _records(core)
+    ids = _pages(core, 2, date_from='2024-05-02', date_to='2024-05-03')
+    assert sorted(core._list_rows[row_id].date for row_id in ids) == ['2024-05-02', '2024-05-03', '2024-05-03']
+    # 作成日 (今日) ではなく日付欄で絞り込む
+    assert [core._list_rows[row_id].date for row_id in _pages(core, 2, date_from='2024-05-07')] == ['2024-05-07']
+
+
+def test_subsets_follow_updates_and_deletes(core):
+    entry_id = _add(core, '更新前', tags='ROS', date='2024-05-01')
+    core.update_entry(entry_id, {'type': 'participation', 'data': {'content': '更新後', 'tags': '実験',
+                                                                    'date': '2024-06-01'}})
+    assert core.list_entries(tag='ROS') == ([], None)
+    assert [row.id for row in core.list_entries(tag='実験')[0]] == [entry_id]
+    assert core.list_entries(date_to='2024-05-31') == ([], None)
+
+    core.delete_entry(entry_id)
+    assert core.list_entries(tag='実験') == ([], None)
+    assert core._list_subsets == {} and core._list_dates == []
+
+
+def test_rebuild_matches_incremental_views(core):
+    _records(core)
+    subsets, dates = {key: list(ids) for key, ids in core._list_subsets.items()}, list(core._list_dates)
+    core._rebuild_views()
+    assert core._list_subsets == subsets and core._list_dates == dates
+    assert isinstance(core._list_rows[dates[0][1]], app_module.ListRow)
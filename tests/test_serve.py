@@ -0,0 +1,29 @@
+import gc
+
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def served(core, monkeypatch):
+    """serve() が起動しようとしたサーバーと引数を記録する (実際には起動しない)"""
+    monkeypatch.setattr(app_module, 'core_app', core)
+    calls = []
+    monkeypatch.setattr(app_module, 'serve_wsgiref', lambda *args: calls.append(('wsgiref',) + args))
+    monkeypatch.setattr(app_module, 'serve_gunicorn', lambda *args: calls.append(('gunicorn',) + args))
+    yield calls
+    gc.unfreeze()
+
+
+def test_multiple_workers_enable_process_lock(core, served):
+    app_module.serve('127.0.0.1:0', workers=2, server='wsgiref')
+    assert served == [('wsgiref', '127.0.0.1', 0, 2, 8)]
+    assert core.process_lock is not None
+
+
+def test_multiple_workers_fail_without_process_lock(core, served, monkeypatch):
+    monkeypatch.setattr(core, 'enable_process_lock', lambda: False)
+    with pytest.raises(SystemExit):
+        app_module.serve('127.0.0.1:0', workers=2, server='wsgiref')
+    assert served == []
@@ -0,0 +1,111 @@
+import json
+import os
+
+import app as app_module
+
+
+def _records():
+    entries = [{'id': f'participation-{i}', 'type': 'participation', 'timestamp': f'2024-05-0{i + 1}T10:00:00',
+                'status': 'completed', 'hash': f'{i:064x}',
+                'data': {'content': f'内容{i}', 'tags': 'ROS', 'images': [], 'notes': 'x' * 100}}
+               for i in range(3)]
+    drafts = [{'id': 'draft_daily-0', 'type': 'daily', 'timestamp': '2024-05-04T10:00:00', 'status': 'draft',
+               'version': 2, 'data': {'date': '2024-05-04', 'work_type': '登校'}}]
+    return entries, drafts
+
+
+def _plain(records):
+    return [dict(record, data=app_module.LazyData.full(record['data'])) for record in records]
+
+
+def test_snapshot_round_trip(tmp_path):
+    snapshot = app_module.RecordSnapshot(str(tmp_path / 'snapshot'))
+    entries, drafts = _records()
+    snapshot.write(('sig', 1), entries, drafts)
+
+    loaded_entries, loaded_drafts = snapshot.load(('sig', 1))
+    assert _plain(loaded_entries) == entries
+    assert _plain(loaded_drafts) == drafts
+    assert snapshot.load(('sig', 2)) is None
+
+    snapshot.remove()
+    assert snapshot.load(('sig', 1)) is None
+
+
+def _sharded_core(directory, monkeypatch):
+    monkeypatch.setenv('RESEARCH_RECORD_STORAGE', 'sharded')
+    return app_module.ResearchDiaryCore(str(directory))
+
+
+def test_snapshot_is_used_after_restart(tmp_path, monkeypatch):
+    core = _sharded_core(tmp_path, monkeypatch)
+    core.add_entry({'type': 'participation', 'data': {'content': '参加報告', 'tags': ''}})
+    core.close()
+    assert os.path.exists(core.snapshot.path)
+
+    core = _sharded_core(tmp_path, monkeypatch)
+    try:
+        assert isinstance(core.entries[0]['data'], app_module.LazyData)
+        assert core.get_entry_by_id(core.entries[0]['id'])['data']['content'] == '参加報告'
+    finally:
+        core.close()
+
+
+def _pull_copy(core, new_id):
+    """git pullで他の環境のエントリーが増えたように、notebook/ に直接ファイルを置く"""
+    source = core.storage._paths[('entries', core.entries[0]['id'])]
+    with open(source, encoding='utf-8') as f:
+        record = json.load(f)
+    record['id'] = new_id
+    with open(os.path.join(os.path.dirname(source), f'{new_id}.json'), 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+
+
+def test_snapshot_is_invalidated_by_files_changed_while_stopped(tmp_path, monkeypatch):
+    core = _sharded_core(tmp_path, monkeypatch)
+    core.add_entry({'type': 'participation', 'data': {'content': '参加報告', 'tags': ''}})
+    core.close()
+    _pull_copy(core, 'participation-pulled')
+
+    core = _sharded_core(tmp_path, monkeypatch)
+    try:
+        assert {entry['id'] for entry in core.entries} >= {'participation-pulled'}
+    finally:
+        core.close()
+
+
+def test_snapshot_is_not_written_over_files_changed_while_running(tmp_path, monkeypatch):
+    core = _sharded_core(tmp_path, monkeypatch)
+    core.add_entry({'type': 'participation', 'data': {'content': '参加報告', 'tags': ''}})
+    _pull_copy(core, 'participation-pulled')
+    core.close()
+    assert not os.path.exists(core.snapshot.path)
+
+    core = _sharded_core(tmp_path, monkeypatch)
+    try:
+        assert len(core.entries) == 2
+    finally:
+        core.close()
+
+
+def test_failed_load_keeps_data_and_images(tmp_path):
+    core = app_module.ResearchDiaryCore(str(tmp_path))
+    core.add_entry({'type': 'participation', 'data': {'content': '参加報告', 'tags': ''}})
+    core.close()
+    os.remove(core.snapshot.path)
+    with open(core.storage.data_file, 'a', encoding='utf-8') as f:
+        f.write('壊れた末尾')
+    with open(core.storage.data_file, encoding='utf-8') as f:
+        broken = f.read()
+    image = os.path.join(core.images_dir, '0' * 64 + '.png')
+    with open(image, 'wb') as f:
+        f.write(b'png')
+    os.utime(image, (0, 0))
+
+    core = app_module.ResearchDiaryCore(str(tmp_path))
+    assert not core.records_loaded and core.entries == []
+    core.close()
+    assert os.path.exists(image)
+    assert not os.path.exists(core.snapshot.path)
+    with open(core.storage.data_file, encoding='utf-8') as f:
+        assert f.read() == broken
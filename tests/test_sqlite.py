@@ -0,0 +1,107 @@
+import json
+import sqlite3
+
+import app as app_module
+
+
+def _sqlite_core(directory, monkeypatch):
+    monkeypatch.setenv('RESEARCH_RECORD_STORAGE', 'sqlite')
+    return app_module.ResearchDiaryCore(str(directory))
+
+
+def _fill(core):
+    core.add_entry({'type': 'participation', 'data': {'content': '参加報告', 'tags': 'ROS, 実験',
+                                                      'images': ['a.png', 'b.png'], 'notes': '本文だけの欄'}})
+    core.add_entry({'type': 'experiment', 'data': {'experiment_date': '2024-05-01', 'purpose': '目的',
+                                                   'results_images': ['c.png'], 'tags': '実験'}})
+    core.save_draft({'type': 'participation', 'data': {'content': '下書き', 'tags': 'ROS', 'images': ['d.png']}})
+
+
+def test_bodies_are_read_on_demand(tmp_path, monkeypatch):
+    core = _sqlite_core(tmp_path, monkeypatch)
+    _fill(core)
+    core.close()
+
+    core = _sqlite_core(tmp_path, monkeypatch)
+    try:
+        entry = next(e for e in core.entries if e['type'] == 'participation')
+        assert isinstance(entry['data'], app_module.SqliteLazyData)
+        assert dict.get(entry['data'], 'notes') is None # 起動時は一覧用の欄だけ
+        assert core.get_entry_by_id(entry['id'])['data']['notes'] == '本文だけの欄'
+        assert dict.get(entry['data'], 'notes') is None # コピーにだけ復元する
+    finally:
+        core.close()
+
+
+def test_tag_and_image_tables_follow_changes(tmp_path, monkeypatch):
+    core = _sqlite_core(tmp_path, monkeypatch)
+    try:
+        _fill(core)
+        storage = core.storage
+        entry_id = next(e['id'] for e in core.entries if e['type'] == 'participation')
+        assert entry_id in storage.tagged_ids(['ROS'])
+
+        core.update_entry(entry_id, {'type': 'participation', 'data': {'content': '参加報告', 'tags': 'ROS',
+                                                                        'images': ['b.png']}})
+        assert entry_id not in storage.tagged_ids(['実験'])
+        assert storage.conn.execute("SELECT filename FROM image_refs WHERE record_id = ?",
+                                    (entry_id,)).fetchall() == [('b.png',)]
+
+        core.delete_entry(entry_id)
+        assert storage.conn.execute("SELECT COUNT(*) FROM tags WHERE record_id = ?", (entry_id,)).fetchone() == (0,)
+        assert storage.conn.execute("SELECT COUNT(*) FROM image_refs WHERE record_id = ?",
+                                    (entry_id,)).fetchone() == (0,)
+    finally:
+        core.close()
+
+
+def test_queries_match_in_memory_views(tmp_path, monkeypatch):
+    sqlite_core = _sqlite_core(tmp_path / 'sqlite', monkeypatch)
+    monkeypatch.setenv('RESEARCH_RECORD_STORAGE', 'journal')
+    journal_core = app_module.ResearchDiaryCore(str(tmp_path / 'journal'))
+    try:
+        for core in (sqlite_core, journal_core):
+            _fill(core)
+
+        def images(core, **filters):
+            items, total = core.query_images(limit=None, **filters)
+            return [(item['filename'], item['date'], item['title'], item['tags']) for item in items], total
+
+        for filters in ({}, {'tag': '実験'}, {'entry_type': 'experiment'}, {'text': 'b.png'},
+                        {'date_from': '2024-05-01', 'date_to': '2024-05-01'}):
+            assert images(sqlite_core, **filters) == images(journal_core, **filters)
+        assert sqlite_core.query_images(offset=1, limit=1)[0][0]['filename'] == \
+            journal_core.query_images(offset=1, limit=1)[0][0]['filename']
+
+        def listed(core, **filters):
+            return [(row.type, row.title) for row in core.list_entries(**filters)[0]]
+
+        assert sorted(listed(sqlite_core, tag='ROS')) == sorted(listed(journal_core, tag='ROS'))
+        assert len(listed(sqlite_core, tag='ROS')) == 2
+        assert [e['type'] for e in sqlite_core.select_entries_for_export(tags=['実験'])] == \
+            [e['type'] for e in journal_core.select_entries_for_export(tags=['実験'])]
+    finally:
+        sqlite_core.close()
+        journal_core.close()
+
+
+def test_old_database_is_migrated(tmp_path):
+    db_file = str(tmp_path / 'research_data.sqlite3')
+    record = {'id': 'participation-1', 'type': 'participation', 'timestamp': '2024-05-01T10:00:00',
+              'status': 'completed', 'data': {'content': '参加報告', 'tags': 'ROS', 'images': ['a.png'], 'notes': 'x'}}
+    conn = sqlite3.connect(db_file)
+    conn.execute("CREATE TABLE records (id TEXT PRIMARY KEY, kind TEXT NOT NULL, type TEXT NOT NULL, status TEXT, "
+                 "date TEXT, timestamp TEXT, body TEXT NOT NULL)")
+    conn.execute("INSERT INTO records VALUES (?, 'entries', 'participation', 'completed', '2024-05-01', ?, ?)",
+                 (record['id'], record['timestamp'], json.dumps(record, ensure_ascii=False)))
+    conn.commit()
+    conn.close()
+
+    storage = app_module.SqliteStorage(db_file)
+    try:
+        assert storage.tagged_ids(['ROS']) == ['participation-1']
+        entries, drafts = storage.load()
+        assert entries[0]['data'].copy() == record['data'] and drafts == []
+        assert storage.conn.execute("PRAGMA user_version").fetchone()[0] == storage.SCHEMA_VERSION
+    finally:
+        storage.close()
@@ -0,0 +1,49 @@
+import app as app_module
+
+
+def _entry(entry_id, entry_type, date, **data):
+    return {'id': entry_id, 'type': entry_type, 'timestamp': f'{date}T12:00:00', 'status': 'completed',
+            'data': dict(data, date=date)}
+
+
+def test_put_and_summarize():
+    columns = app_module.StatsColumns(capacity=2)
+    columns.put(_entry('d1', 'daily', '2024-05-06', work_type='登校', arrival_time='09:00',
+                       departure_time='18:30', today_todo='a\nb\nc', today_completed='a\nb', tags='ROS, 実験'))
+    columns.put(_entry('d2', 'daily', '2024-05-07', work_type='在宅', today_todo='a', today_completed='a'))
+    columns.put(_entry('p1', 'participation', '2024-05-13', content='参加', tags='ROS'))
+
+    summary = columns.summarize()
+    assert summary['entries'] == 3
+    assert summary['by_type'] == {'daily': 2, 'experiment': 0, 'participation': 1, 'research_meeting': 0}
+    assert summary['attendance']['days'] == 1
+    assert summary['attendance']['total_hours'] == 9.5
+    assert summary['attendance']['by_work_type'] == {'登校': 1, '在宅': 1}
+    assert summary['tags'][0] == ('ROS', 2)
+    assert summary['todo'] == {'total': 4, 'done': 3, 'rate': 0.75}
+    assert [week['week'] for week in summary['weekly']] == ['2024-05-06', '2024-05-13']
+
+    assert columns.summarize(date_from='2024-05-07', date_to='2024-05-10')['entries'] == 1
+
+
+def test_update_and_remove_reuse_rows():
+    columns = app_module.StatsColumns(capacity=2)
+    columns.put(_entry('d1', 'daily', '2024-05-06', work_type='登校', arrival_time='09:00', departure_time='17:00'))
+    columns.put(_entry('d1', 'daily', '2024-05-06', work_type='休み'))
+    summary = columns.summarize()
+    assert summary['entries'] == 1
+    assert summary['attendance']['days'] == 0
+    assert summary['attendance']['by_work_type'] == {'休み': 1}
+
+    columns.remove('d1')
+    assert columns.summarize()['entries'] == 0
+    columns.put(_entry('e1', 'experiment', '2024-05-08'))
+    assert columns.size == 1 # 空いた行を再利用する
+    assert columns.summarize()['by_type']['experiment'] == 1
+
+
+def test_core_stats_follow_changes(core):
+    core.add_entry({'type': 'participation', 'data': {'content': '参加', 'tags': 'ROS'}})
+    assert core.stats()['by_type']['participation'] == 1
+    core.delete_entry(core.entries[0]['id'])
+    assert core.stats()['entries'] == 0